@@ -12,12 +12,18 @@ from .models.cost_center import CostCenter
 from .models.provider import Provider
 from .models.product_catalog import Category, Product
 from .models.warehouse import Warehouse
-from .models.inventory_models import InventoryStock, InventoryTransaction
+from .models.inventory_models import InventoryStock, InventoryTransaction, ProductStockTotal, ProductLocation, \
+    StockSnapshot, InventoryDailyMovement
 from .models.purchase_order import PurchaseOrder, DocumentType, OrderStatus, PurchaseOrderItem
 from .models.stock_transfer import StockTransfer, StockTransferItem
 from .models.employee import Employee, EmployeeLicense
 from .models.attendance import AttendanceRecord
 from .models.reception import ProductReceipt, ProductReceiptItem
+from .models.cache_generation import CacheGeneration
+from .models.idempotency import IdempotencyKey
+from .models.render_job import RenderJob
+from .models.gre_submission import GreSubmission
+from .models.sunat_token import SunatToken
 from .services.auth_service import AuthError, requires_auth
 
 
@@ -36,8 +42,8 @@ def create_app(config_class=Config):
     cors.init_app(
         app,
         resources={r"/api/*": {"origins": "*"}},
-        allow_headers=["Authorization", "Content-Type"],
-        expose_headers=["Authorization"],
+        allow_headers=["Authorization", "Content-Type", "Idempotency-Key"],
+        expose_headers=["Authorization", "Idempotent-Replayed"],
         supports_credentials=True
     )
 
@@ -59,6 +65,7 @@ def create_app(config_class=Config):
     from .routes.unit_measure_api import unit_measure_api
     from .routes.stock_transfer_report_api import stock_transfer_report_api
     from .routes.report_api import report_api
+    from .routes.job_api import job_api
 
     app.register_blueprint(transfer_api, url_prefix='/api/transfers')
     app.register_blueprint(warehouse_api, url_prefix='/api/warehouses')
@@ -77,15 +84,21 @@ def create_app(config_class=Config):
     app.register_blueprint(unit_measure_api, url_prefix='/api/units')
     app.register_blueprint(stock_transfer_report_api, url_prefix='/api')
     app.register_blueprint(report_api, url_prefix='/api/reports')
+    app.register_blueprint(job_api, url_prefix='/api/jobs')
 
-    # --- 4. MANEJADOR DE ERRORES ---
+    # --- 4. COMANDOS CLI (flask inventory ..., flask gre ...) ---
+    from .cli import inventory_cli, gre_cli
+    app.cli.add_command(inventory_cli)
+    app.cli.add_command(gre_cli)
+
+    # --- 5. MANEJADOR DE ERRORES ---
     @app.errorhandler(AuthError)
     def handle_auth_error(ex):
         response = jsonify(ex.error)
         response.status_code = ex.status_code
         return response
 
-    # --- 5. CREACIÓN DE BASE DE DATOS Y SEEDING ---
+    # --- 6. CREACIÓN DE BASE DE DATOS Y SEEDING ---
     with app.app_context():
         os.makedirs(app.instance_path, exist_ok=True)
         # db.create_all() verifica si las tablas existen antes de crear
@@ -148,14 +161,12 @@ def _seed_database():
         prod_cable = Product(
             sku='CB-THW-14',
             name='CABLE/THW #14',
-            unit_of_measure='Metros',
             standard_price=2.50,  # <-- Precio
             category_id=cat_cables.id
         )
         prod_clavo = Product(
             sku='HR-CLV-3',
             name='Clavos de 3"',
-            unit_of_measure='Kilos',
             standard_price=15.00,  # <-- Precio
             category_id=cat_herr.id
         )
@@ -0,0 +1,136 @@
+import time
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .extensions import db
+from .services.stock_total_service import rebuild_stock_totals
+from .services.stock_snapshot_service import create_snapshot, missing_monthly_cutoffs, month_start
+from .services.kardex_verify_service import verify_kardex
+from .services.daily_movement_service import rebuild_daily_movements
+from .services.idempotency_service import purge_expired_keys
+from .services.gre_dispatch_service import process_due_submissions
+
+# Comandos de mantenimiento de inventario: flask inventory <comando>
+inventory_cli = AppGroup('inventory', help='Tareas de mantenimiento de inventario.')
+
+
+@inventory_cli.command('reconcile-totals')
+@click.option('--dry-run', is_flag=True, help='Solo reporta diferencias, no corrige.')
+def reconcile_totals_command(dry_run):
+    """Reconstruye product_stock_totals desde inventory_stock y reporta diferencias."""
+    drift = rebuild_stock_totals(dry_run=dry_run)
+
+    if not drift:
+        click.echo("Sin diferencias: los totales por producto coinciden con inventory_stock.")
+        return
+
+    click.echo(f"{len(drift)} producto(s) con diferencias:")
+    for d in drift:
+        stored = 'sin fila' if d['stored'] is None else f"{d['stored']:.2f}"
+        click.echo(f"  [{d['product_id']}] {d.get('sku') or '?'}: guardado={stored} real={d['actual']:.2f}")
+
+    click.echo("Modo --dry-run: no se hicieron cambios." if dry_run else "Totales reconstruidos.")
+
+
+@inventory_cli.command('snapshot')
+@click.option('--date', 'cutoff_date', help='Fecha de corte YYYY-MM-DD (por defecto, el 1° del mes actual).')
+@click.option('--backfill', is_flag=True, help='Genera todos los cortes mensuales que falten desde el primer movimiento.')
+@click.option('--replace', is_flag=True, help='Recalcula el corte si ya existe.')
+def snapshot_command(cutoff_date, backfill, replace):
+    """Guarda la foto del stock (saldo del Kardex) por producto y almacén a una fecha de corte."""
+    if backfill:
+        cutoffs = missing_monthly_cutoffs()
+    elif cutoff_date:
+        try:
+            cutoffs = [datetime.strptime(cutoff_date, '%Y-%m-%d')]
+        except ValueError:
+            raise click.BadParameter("Use el formato YYYY-MM-DD.", param_hint='--date')
+    else:
+        cutoffs = [month_start(date.today())]
+
+    if not cutoffs:
+        click.echo("No hay cortes pendientes.")
+        return
+
+    for cutoff in cutoffs:
+        try:
+            saved = create_snapshot(cutoff, replace=replace)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        label = cutoff.strftime('%Y-%m-%d')
+        if saved is None:
+            click.echo(f"  {label}: ya existe (use --replace para recalcular).")
+        else:
+            click.echo(f"  {label}: {saved} saldo(s) guardado(s).")
+
+
+@inventory_cli.command('rollup')
+@click.option('--chunk-size', default=5000, show_default=True, help='Filas insertadas por bloque.')
+def rollup_command(chunk_size):
+    """Reconstruye el resumen diario del Kardex (inventory_daily_movements) desde inventory_transactions."""
+    start = time.perf_counter()
+    rows = rebuild_daily_movements(chunk_size=chunk_size)
+    click.echo(f"Resumen diario reconstruido: {rows} fila(s) en {time.perf_counter() - start:.1f} s.")
+
+@inventory_cli.command('verify')
+@click.option('--fix', is_flag=True, help='Corrige new_quantity de las filas del Kardex con saldo incorrecto.')
+@click.option('--limit', default=20, show_default=True, help='Cantidad máxima de diferencias a listar.')
+@click.option('--chunk-size', type=int, help='Filas por bloque (por defecto KARDEX_VERIFY_CHUNK_SIZE).')
+def verify_command(fix, limit, chunk_size):
+    """Recalcula los saldos del Kardex y los compara con new_quantity e inventory_stock."""
+    result = verify_kardex(fix=fix, chunk_size=chunk_size, sample_size=limit)
+
+    click.echo(f"Kardex: {result['rows']} fila(s), {result['groups']} producto/almacén, "
+               f"{result['seconds']:.1f} s.")
+
+    if result['row_mismatches']:
+        click.echo(f"{result['row_mismatches']} fila(s) con new_quantity distinto al saldo acumulado:")
+        for r in result['row_samples']:
+            click.echo(f"  #{r['id']} [{r['product_id']}] {r.get('sku') or '?'} almacén {r['warehouse_id']}: "
+                       f"guardado={r['stored']:.2f} esperado={r['expected']:.2f}")
+        if result['row_mismatches'] > len(result['row_samples']):
+            click.echo(f"  ... y {result['row_mismatches'] - len(result['row_samples'])} más.")
+    else:
+        click.echo("Sin diferencias en new_quantity.")
+
+    mismatches = result['stock_mismatches']
+    if mismatches:
+        click.echo(f"{len(mismatches)} producto/almacén con saldo final distinto a inventory_stock:")
+        for m in mismatches[:limit]:
+            stock = 'sin fila' if m['stock'] is None else f"{m['stock']:.2f}"
+            click.echo(f"  [{m['product_id']}] {m.get('sku') or '?'} almacén {m['warehouse_id']}: "
+                       f"kardex={m['kardex']:.2f} stock={stock}")
+        if len(mismatches) > limit:
+            click.echo(f"  ... y {len(mismatches) - limit} más.")
+    else:
+        click.echo("Sin diferencias con inventory_stock.")
+
+    if fix:
+        click.echo(f"Filas corregidas: {result['fixed']} (inventory_stock no se modifica).")
+
+
+@inventory_cli.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """Elimina las Idempotency-Key vencidas (IDEMPOTENCY_KEY_TTL_HOURS)."""
+    deleted = purge_expired_keys()
+    click.echo(f"Llaves de idempotencia eliminadas: {deleted}.")
+
+
+# Guías de remisión electrónicas: flask gre <comando>
+gre_cli = AppGroup('gre', help='Guías de remisión electrónicas (SUNAT).')
+
+
+@gre_cli.command('process-pending')
+@click.option('--loop', is_flag=True, help='No termina: revisa cada GRE_POLL_INTERVAL_SECONDS (poller dedicado).')
+def process_pending_command(loop):
+    """Envía a SUNAT las guías pendientes y consulta sus tickets (para cron o con GRE_POLLER_IN_WEB=0)."""
+    while True:
+        processed = process_due_submissions()
+        db.session.remove()
+        if not loop:
+            click.echo(f"Guías procesadas: {processed}.")
+            return
+        time.sleep(current_app.config.get('GRE_POLL_INTERVAL_SECONDS', 2))
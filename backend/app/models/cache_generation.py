@@ -0,0 +1,27 @@
+from ..extensions import db
+
+
+# Contadores de "generación" compartidos por todos los workers de gunicorn.
+# Cada worker guarda cachés en memoria; cuando alguien modifica los datos de origen
+# incrementa el contador y los demás workers detectan el cambio y descartan su caché.
+class CacheGeneration(db.Model):
+    __tablename__ = 'cache_generations'
+
+    name = db.Column(db.String(50), primary_key=True)  # ej. 'role_permissions'
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def current(name):
+        value = db.session.query(CacheGeneration.value).filter_by(name=name).scalar()
+        return value or 0
+
+    @staticmethod
+    def bump(name):
+        """
+        Incrementa el contador dentro de la transacción actual (se confirma con el commit del llamador).
+        """
+        updated = CacheGeneration.query.filter_by(name=name).update(
+            {CacheGeneration.value: CacheGeneration.value + 1}, synchronize_session=False
+        )
+        if not updated:
+            db.session.add(CacheGeneration(name=name, value=1))
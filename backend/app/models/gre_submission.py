@@ -0,0 +1,63 @@
+from ..extensions import db
+from datetime import datetime
+from sqlalchemy.schema import Index
+
+
+# Envío de una GRE a SUNAT en segundo plano (POST /api/gre/enviar).
+# La guía (gre + gre_details) se guarda en estado 'pendiente' al recibir la
+# solicitud; esta fila lleva el ZIP firmado, el ticket y los reintentos hasta
+# que SUNAT la acepta o la rechaza. Ver services/gre_dispatch_service.py.
+class GreSubmission(db.Model):
+    __tablename__ = 'gre_submissions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    gre_id = db.Column(db.Integer, db.ForeignKey('gre.id'), nullable=False, unique=True)
+    user_id = db.Column(db.String(255), nullable=False)  # Auth0 sub de quien envió la guía
+
+    # 'pendiente' -> 'aceptado' | 'rechazado' | 'error'
+    # 'aceptado_sin_stock': SUNAT la aceptó y falta la parte local (se reintenta, nunca pasa a 'error')
+    status = db.Column(db.String(20), nullable=False, default='pendiente')
+
+    # Documento firmado listo para enviar (se limpia al terminar)
+    zip_name = db.Column(db.String(100), nullable=False)
+    zip_base64 = db.Column(db.Text, nullable=True)
+    hash_zip = db.Column(db.String(64), nullable=True)
+    digest_value = db.Column(db.String(255), nullable=True)  # Para el QR si el CDR no trae la URL
+
+    ticket = db.Column(db.String(50), nullable=True)  # numTicket de SUNAT (None = aún no enviado)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Reserva del worker que la está atendiendo
+
+    # Datos para el movimiento de stock al ser aceptada (tal como llegaron en la solicitud)
+    origin_address = db.Column(db.String(255), nullable=True)
+    origin_warehouse_id = db.Column(db.Integer, nullable=True)
+    cost_center_id = db.Column(db.Integer, nullable=True)
+    transfer_id = db.Column(db.Integer, db.ForeignKey('stock_transfers.id'), nullable=True)
+
+    sunat_response = db.Column(db.Text, nullable=True)  # Última respuesta de SUNAT (JSON, sin el CDR)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    gre = db.relationship('Gre', backref=db.backref('submission', uselist=False, cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        Index('ix_gre_submissions_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.gre_id,
+            'serie': self.gre.serie if self.gre else None,
+            'numero': self.gre.numero if self.gre else None,
+            'status': self.status,
+            'ticket': self.ticket,
+            'attempts': self.attempts,
+            'error': self.error,
+            'transfer_id': self.transfer_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.status in ('pendiente', 'aceptado_sin_stock') else None
+        }
@@ -0,0 +1,31 @@
+from ..extensions import db
+from datetime import datetime
+from sqlalchemy.schema import UniqueConstraint, Index
+
+
+# Llaves de idempotencia (header Idempotency-Key) de los POST que mueven stock.
+# Guarda la huella de la solicitud y la respuesta original para devolverla si el
+# cliente reintenta. Ver services/idempotency_service.py.
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(255), nullable=False)  # Auth0 sub (la llave es única por usuario)
+    key = db.Column(db.String(255), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # SHA-256 de método + ruta + cuerpo
+
+    # 'processing' -> 'committed' (la transacción del endpoint se confirmó) -> 'completed'
+    # (una 'committed' abandonada se completa con una respuesta 200 genérica)
+    state = db.Column(db.String(20), nullable=False, default='processing')
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'key', name='_idempotency_user_key_uc'),
+        Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
@@ -1,6 +1,6 @@
 from ..extensions import db
 from datetime import datetime
-from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.schema import UniqueConstraint, Index
 
 # TABLA 1: El stock actual
 class InventoryStock(db.Model):
@@ -9,6 +9,8 @@ class InventoryStock(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=False)
     quantity = db.Column(db.Numeric(10, 2), nullable=False, default=0.00)
+    # Se incrementa en cada cambio de cantidad (control optimista, ver stock_service)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     product = db.relationship('Product')
     warehouse = db.relationship('Warehouse')
@@ -16,6 +18,71 @@ class InventoryStock(db.Model):
     # Regla: No puede haber dos entradas para el mismo producto en el mismo almacén
     __table_args__ = (UniqueConstraint('product_id', 'warehouse_id', name='_product_warehouse_uc'),)
 
+# TABLA 1B: Stock total por producto (suma de todos los almacenes)
+# Se mantiene en la misma transacción que cada movimiento de stock, para que el
+# costo promedio ponderado no tenga que hacer SUM() sobre inventory_stock.
+class ProductStockTotal(db.Model):
+    __tablename__ = 'product_stock_totals'
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    quantity = db.Column(db.Numeric(12, 2), nullable=False, default=0.00)
+
+# TABLA 1C: Ubicaciones (bins) por producto y almacén
+# Índice normalizado de Product.location (texto separado por comas), para poder
+# consultar "qué hay en el bin X". warehouse_id es NULL cuando la ubicación se
+# cargó desde el catálogo sin indicar almacén.
+class ProductLocation(db.Model):
+    __tablename__ = 'product_locations'
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=True)
+    bin = db.Column(db.String(50), nullable=False)
+
+    product = db.relationship('Product')
+    warehouse = db.relationship('Warehouse')
+
+    __table_args__ = (
+        UniqueConstraint('product_id', 'warehouse_id', 'bin', name='_product_warehouse_bin_uc'),
+        Index('ix_product_locations_bin_warehouse', 'bin', 'warehouse_id'),
+    )
+
+# TABLA 1D: Fotos periódicas del stock (por ejemplo, mensuales)
+# quantity = saldo del Kardex del producto en el almacén con timestamp < taken_at.
+# Cada corte guarda solo los saldos distintos de 0 y se genera completo en una
+# transacción ('flask inventory snapshot'). Ver stock_snapshot_service.
+class StockSnapshot(db.Model):
+    __tablename__ = 'stock_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False)  # Fecha de corte (exclusiva)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=False)
+    quantity = db.Column(db.Numeric(12, 2), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('taken_at', 'warehouse_id', 'product_id', name='_snapshot_cutoff_warehouse_product_uc'),
+    )
+
+# TABLA 1E: Resumen diario del Kardex por producto y almacén
+# entries / exits = suma de quantity_change positivos / negativos (en valor absoluto)
+# del día; closing_quantity = saldo del Kardex al cierre del día. Solo hay fila
+# para los días con movimientos. Lo mantiene inventory_ledger en la misma
+# transacción del Kardex; 'flask inventory rollup' lo reconstruye.
+class InventoryDailyMovement(db.Model):
+    __tablename__ = 'inventory_daily_movements'
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=False)
+    entries = db.Column(db.Numeric(14, 2), nullable=False, default=0.00)
+    exits = db.Column(db.Numeric(14, 2), nullable=False, default=0.00)
+    closing_quantity = db.Column(db.Numeric(14, 2), nullable=False, default=0.00)
+
+    # La restricción única sirve además para buscar el último cierre de cada producto/almacén
+    __table_args__ = (
+        UniqueConstraint('product_id', 'warehouse_id', 'day', name='_daily_product_warehouse_day_uc'),
+        Index('ix_inventory_daily_movements_day', 'day'),
+    )
+
 # TABLA 2: El historial (Kardex)
 class InventoryTransaction(db.Model):
     __tablename__ = 'inventory_transactions'
@@ -35,6 +102,12 @@ class InventoryTransaction(db.Model):
     product = db.relationship('Product')
     warehouse = db.relationship('Warehouse')
 
+    # Índices para el Kardex: filtro por producto/almacén y paginación por (timestamp, id)
+    __table_args__ = (
+        Index('ix_inventory_transactions_product_warehouse_ts', 'product_id', 'warehouse_id', 'timestamp'),
+        Index('ix_inventory_transactions_ts_id', 'timestamp', 'id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,41 @@
+from ..extensions import db
+from datetime import datetime
+from sqlalchemy.schema import Index
+
+
+# Trabajos de renderizado de PDF en segundo plano (POST /api/jobs).
+# El estado vive en la BD para que cualquier worker de gunicorn pueda responder
+# la consulta de estado; el PDF terminado queda en instance/render_jobs/.
+# Ver services/render_job_service.py.
+class RenderJob(db.Model):
+    __tablename__ = 'render_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 en hexadecimal
+    job_type = db.Column(db.String(50), nullable=False)  # ej. 'stock-transfers', 'purchase-order'
+    user_id = db.Column(db.String(255), nullable=False)  # Auth0 sub (solo el dueño puede consultarlo)
+
+    # 'pendiente' -> 'completado' | 'error'
+    status = db.Column(db.String(20), nullable=False, default='pendiente')
+    filename = db.Column(db.String(255), nullable=False)  # Nombre de descarga
+    file_size = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_render_jobs_status_created_at', 'status', 'created_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.job_type,
+            'status': self.status,
+            'filename': self.filename,
+            'file_size': self.file_size,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'download_url': f"/api/jobs/{self.id}/download" if self.status == 'completado' else None
+        }
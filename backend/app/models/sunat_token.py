@@ -0,0 +1,25 @@
+from ..extensions import db
+from datetime import datetime
+from sqlalchemy.schema import UniqueConstraint
+
+
+# Token OAuth2 de SUNAT compartido por todos los workers (y el poller de GRE).
+# Una fila por (client_id, RUC); refreshing_until reserva la renovación para que
+# un solo worker pida el token nuevo. Ver services/sunat_token_service.py.
+class SunatToken(db.Model):
+    __tablename__ = 'sunat_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.String(100), nullable=False)
+    ruc = db.Column(db.String(11), nullable=False)
+
+    access_token = db.Column(db.Text, nullable=True)
+    # Vencimiento según expires_in, ya descontado el margen de seguridad
+    expires_at = db.Column(db.DateTime, nullable=True)
+    refreshing_until = db.Column(db.DateTime, nullable=True)
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint('client_id', 'ruc', name='_sunat_token_client_ruc_uc'),
+    )
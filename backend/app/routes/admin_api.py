@@ -4,7 +4,8 @@ from ..models.role import Role
 from ..models.permission import Permission
 # Importaremos un decorador de auth mejorado en el siguiente paso
 # Por ahora, usaremos el que ya tenemos
-from ..services.auth_service import requires_auth
+from ..services.auth_service import requires_auth, token_cache, permission_cache
+from ..services import http_clients
 
 admin_api = Blueprint('admin_api', __name__)
 
@@ -66,11 +67,36 @@ def update_role_permissions(role_id, payload):
         # 3. Asignar la nueva lista de permisos al rol
         role.permissions = new_permissions
 
-        # 4. Guardar en la base de datos
+        # 4. Invalidar la caché de permisos (todos los workers la verán en el próximo chequeo)
+        permission_cache.invalidate()
+
+        # 5. Guardar en la base de datos
         db.session.commit()
 
         return jsonify(success=True, message=f"Permisos del rol '{role.name}' actualizados.")
 
     except Exception as e:
         db.session.rollback()
-        return jsonify(error=str(e)), 500
\ No newline at end of file
+        return jsonify(error=str(e)), 500
+
+
+# --- RUTA 3: Estadísticas de la caché de tokens (por worker) ---
+@admin_api.route('/auth-cache-stats')
+@requires_auth(required_permission='access:admin_panel')
+def get_auth_cache_stats(payload):
+    """
+    Devuelve tamaño y tasa de aciertos de la caché de tokens verificados
+    del worker que atiende la petición.
+    """
+    return jsonify(token_cache.stats())
+
+
+# --- RUTA 4: Latencia de los servicios externos (por worker) ---
+@admin_api.route('/http-client-stats')
+@requires_auth(required_permission='access:admin_panel')
+def get_http_client_stats(payload):
+    """
+    Llamadas, errores, reintentos y latencia (promedio, p95, máxima) por servicio
+    externo (SUNAT, Decolecta, Auth0) del worker que atiende la petición.
+    """
+    return jsonify(http_clients.stats())
@@ -73,7 +73,7 @@ def upload_attendance():
     try:
         from app.models.attendance import AttendanceRecord
         from datetime import datetime
-        import requests
+        from app.services import http_clients
         from config import Config
 
         # Leer archivo línea por línea
@@ -135,7 +135,7 @@ def upload_attendance():
                         try:
                             api_url = f"https://api.decolecta.com/v1/reniec/dni?numero={doc_number}"
                             headers = {'Authorization': f'Bearer {Config.SUNAT_API_KEY}'}
-                            resp = requests.get(api_url, headers=headers, timeout=5)
+                            resp = http_clients.get('decolecta', api_url, headers=headers)
                             if resp.status_code == 200:
                                 data = resp.json()
                                 # Construir nombre completo
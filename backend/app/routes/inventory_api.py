@@ -1,32 +1,37 @@
-from flask import Blueprint, jsonify, request, send_file, current_app
+from flask import Blueprint, jsonify, request, send_file, current_app, Response, stream_with_context
 
 from .. import Provider
 from ..extensions import db
 from ..models.warehouse import Warehouse
 from ..models.purchase_order import PurchaseOrder, PurchaseOrderItem, OrderStatus, DocumentType
-from ..models.inventory_models import InventoryStock, InventoryTransaction
-from ..models.product_catalog import Product, Category
+from ..models.inventory_models import InventoryStock, InventoryTransaction, ProductLocation
+from ..models.product_catalog import Product, Category, UnitMeasure
 # --- IMPORTS NUEVOS PARA RECEPCIÓN ---
 from ..models.reception import ProductReceipt, ProductReceiptItem
 # -------------------------------------
 from ..services.auth_service import requires_auth
+from ..services.idempotency_service import idempotent
+from ..services.reception_service import receive_purchase_order_items
+from ..services.stock_total_service import get_stock_totals
+from ..services.location_service import add_bins
+from ..services.stock_service import StockConflictError
+from ..services.inventory_ledger import apply_movements, Movement
+from ..services.stock_adjustment_service import read_adjustment_sheet, apply_mass_adjustment, EXPECTED_COLUMNS, \
+    ADJUSTMENT_MAX_ATTEMPTS
+from ..services.pagination_service import parse_page_args, parse_offset, keyset_page, id_keyset_page, DEFAULT_PAGE_SIZE
+from ..services.label_service import generate_labels_document, generate_zpl_labels, validate_label_products
+from ..services.stock_snapshot_service import stock_as_of, parse_as_of
+from ..services.kardex_export_service import kardex_export_query, iter_export_rows, stream_csv, stream_xlsx
 from sqlalchemy import or_, and_, func
 from sqlalchemy.orm import joinedload
 import pandas as pd
 import os
-from fpdf import FPDF
-from PIL import Image
+import io
 
 inventory_api = Blueprint('inventory_api', __name__)
 
 
-# --- API DE ETIQUETAS (Sin cambios) ---
-class PDF(FPDF):
-    def header(self): pass
-
-    def footer(self): pass
-
-
+# --- API DE ETIQUETAS ---
 @inventory_api.route('/generate-labels', methods=['POST'])
 @requires_auth(required_permission='view:inventory')
 def generate_labels(payload):
@@ -36,56 +41,31 @@ def generate_labels(payload):
     if not products:
         return jsonify(error="No se proporcionaron productos para generar etiquetas."), 400
 
+    label_format = (data.get('format') or request.args.get('format') or 'pdf').lower()
+    if label_format not in ('pdf', 'zpl'):
+        return jsonify(error="Formato no soportado. Use 'pdf' o 'zpl'."), 400
+
     try:
-        pdf = PDF('P', 'mm', 'A4')
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=10)
-        pdf.set_font('Arial', 'B', 10)
+        validate_label_products(products)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
-        label_width, label_height = 60, 30
-        margin_x, margin_y = 10, 10
-        gap_x, gap_y = 5, 5
+    try:
+        # ZPL para impresoras Zebra: texto liviano, se envía a medida que se genera
+        if label_format == 'zpl':
+            return Response(
+                stream_with_context(generate_zpl_labels(products, barcode=bool(data.get('barcode', True)))),
+                mimetype='text/plain',
+                headers={'Content-Disposition': 'attachment; filename=etiquetas.zpl'}
+            )
 
         logo_path = os.path.join(current_app.instance_path, 'logo_v2.png')
         if not os.path.exists(logo_path):
             return jsonify(error=f"No se encontró el logo en: {logo_path}"), 500
 
-        with Image.open(logo_path) as img:
-            logo_orig_w, logo_orig_h = img.size
-            aspect_ratio = logo_orig_w / logo_orig_h
-
-        x, y = margin_x, margin_y
-
-        for product in products:
-            quantity = int(product.get('quantity', 1))
-            for _ in range(quantity):
-                pdf.rect(x, y, label_width, label_height)
-
-                logo_h = 8
-                logo_w = logo_h * aspect_ratio
-                x_logo = x + (label_width - logo_w) / 2
-                pdf.image(logo_path, x_logo, y + 2, w=logo_w, h=logo_h)
-
-                pdf.set_font('Arial', 'B', 12)
-                pdf.set_xy(x + 1, y + 12)
-                pdf.cell(label_width - 2, 5, f"SKU: {product.get('product_sku', 'N/A')}", align='C')
-
-                pdf.set_font('Arial', '', 8)
-                pdf.set_xy(x + 1, y + 18)
-                pdf.multi_cell(label_width - 2, 5, product.get('product_name', 'Sin Nombre'), align='C')
-
-                x += label_width + gap_x
-                if x + label_width > pdf.w - margin_x:
-                    x = margin_x
-                    y += label_height + gap_y
-                    if y + label_height > pdf.h - margin_y:
-                        pdf.add_page()
-                        y = margin_y
-
-        pdf_output_path = os.path.join(current_app.instance_path, 'etiquetas.pdf')
-        pdf.output(pdf_output_path)
-
-        return send_file(pdf_output_path, as_attachment=True, download_name='etiquetas.pdf', mimetype='application/pdf')
+        content = generate_labels_document(products, logo_path)
+        return send_file(io.BytesIO(content), as_attachment=True, download_name='etiquetas.pdf',
+                         mimetype='application/pdf')
 
     except Exception as e:
         print(f"--- ERROR GENERANDO ETIQUETAS: {e} ---")
@@ -106,6 +86,7 @@ def get_warehouses(payload):
 # --- API 2: Procesar la Recepción (CON FIX DE LISTAS) ---
 @inventory_api.route('/receive', methods=['POST'])
 @requires_auth(required_permission='manage:inventory')
+@idempotent
 def receive_inventory(payload):
     data = request.get_json()
     user_id = payload['sub']
@@ -130,98 +111,15 @@ def receive_inventory(payload):
         db.session.add(new_receipt)
         db.session.flush()  # ID necesario para los items
 
-        # 2. Recorrer items
-        for item_data in data['items']:
-            po_item_id = item_data['po_item_id']
-            product_id = item_data['product_id']
-            quantity_received = float(item_data['quantity_received'])
-
-            # --- FIX: SANITIZAR LOCATION (Evitar error de lista) ---
-            raw_loc = item_data.get('location')
-            if isinstance(raw_loc, list):
-                location = ", ".join(str(x) for x in raw_loc)
-            elif raw_loc:
-                location = str(raw_loc).strip()
-            else:
-                location = None
-            # -------------------------------------------------------
-
-            if quantity_received <= 0:
-                continue
-
-                # A. Actualizar item de la orden original
-            po_item = PurchaseOrderItem.query.get(po_item_id)
-            if po_item:
-                po_item.product_id = product_id
-
-            # B. Crear Detalle de Recepción (Historial)
-            receipt_item = ProductReceiptItem(
-                receipt_id=new_receipt.id,
-                product_id=product_id,
-                quantity=quantity_received,
-                location=location,
-                po_item_id=po_item_id
-            )
-            db.session.add(receipt_item)
-
-            # C. Gestión de Stock (InventoryStock)
-            stock_entry = InventoryStock.query.filter_by(
-                product_id=product_id,
-                warehouse_id=warehouse_id
-            ).first()
-
-            if not stock_entry:
-                stock_entry = InventoryStock(
-                    product_id=product_id,
-                    warehouse_id=warehouse_id,
-                    quantity=0.0
-                )
-                db.session.add(stock_entry)
-
-            # D. Actualizar Producto (Ubicación maestra y Precio Promedio)
-            product = Product.query.get(product_id)
-
-            # Agregar ubicación al maestro si es nueva
-            if location:
-                if not product.location:
-                    product.location = location
-                else:
-                    existing_locs = [l.strip() for l in product.location.split(',')]
-                    if location not in existing_locs:
-                        existing_locs.append(location)
-                        product.location = ",".join(existing_locs)
-
-            # Cálculo Precio Promedio
-            current_total_stock = db.session.query(db.func.sum(InventoryStock.quantity)).filter_by(
-                product_id=product_id).scalar() or 0.0
-            current_total_stock = float(current_total_stock)
-            current_avg_price = float(product.standard_price or 0.0)
-
-            incoming_price = float(po_item.unit_price) if po_item else 0.0
-
-            current_total_value = current_total_stock * current_avg_price
-            incoming_total_value = quantity_received * incoming_price
-            new_total_quantity = current_total_stock + quantity_received
-
-            if new_total_quantity > 0:
-                new_avg_price = (current_total_value + incoming_total_value) / new_total_quantity
-                product.standard_price = new_avg_price
-
-            # E. Aumentar Stock Real
-            new_stock_quantity = float(stock_entry.quantity) + quantity_received
-            stock_entry.quantity = new_stock_quantity
-
-            # F. Crear Transacción Kardex
-            transaction = InventoryTransaction(
-                product_id=product_id,
-                warehouse_id=warehouse_id,
-                quantity_change=quantity_received,
-                new_quantity=new_stock_quantity,
-                type="Recepción de Compra",
-                user_id=user_id,
-                reference=f"Orden #{order_id} - {invoice_number or 'S/F'}"
-            )
-            db.session.add(transaction)
+        # 2. Procesar items en bloque (stock, costo promedio, ubicación y Kardex)
+        receive_purchase_order_items(
+            receipt_id=new_receipt.id,
+            order_id=order_id,
+            warehouse_id=warehouse_id,
+            invoice_number=invoice_number,
+            items=data['items'],
+            user_id=user_id
+        )
 
         # 3. Actualizar estado de la OC a "Recibida"
         order = PurchaseOrder.query.get(order_id)
@@ -244,27 +142,53 @@ def receive_inventory(payload):
 @inventory_api.route('/stock-report', methods=['GET'], strict_slashes=False)
 @requires_auth(required_permission='view:inventory')
 def get_stock_report(payload):
+    """
+    Stock actual por producto y almacén (cantidad > 0).
+    Query params opcionales:
+      - warehouse_id
+      - as_of=YYYY-MM-DD: stock al cierre de ese día, calculado desde el Kardex
+        (foto más cercana + movimientos posteriores). El precio es el costo promedio actual.
+    """
+    warehouse_id = request.args.get('warehouse_id', type=int)
+    as_of = request.args.get('as_of')
+    if as_of:
+        try:
+            moment = parse_as_of(as_of)
+        except ValueError:
+            return jsonify(error="Formato de fecha inválido en 'as_of'. Use YYYY-MM-DD"), 400
+
     try:
-        query = InventoryStock.query.options(
-            joinedload(InventoryStock.product).joinedload(Product.category),
-            joinedload(InventoryStock.warehouse)
-        ).filter(InventoryStock.quantity > 0)
+        if as_of:
+            balances = {key: qty for key, qty in stock_as_of(moment, warehouse_id).items() if qty > 0}
+            products = {p.id: p for p in Product.query.options(joinedload(Product.category)).filter(
+                Product.id.in_({pid for pid, _ in balances})
+            ).all()}
+            warehouses = {w.id: w for w in Warehouse.query.filter(Warehouse.id.in_({wid for _, wid in balances})).all()}
+            stock_entries = [
+                (products.get(pid), warehouses.get(wid), qty) for (pid, wid), qty in sorted(balances.items())
+            ]
+        else:
+            query = InventoryStock.query.options(
+                joinedload(InventoryStock.product).joinedload(Product.category),
+                joinedload(InventoryStock.warehouse)
+            ).filter(InventoryStock.quantity > 0)
+            if warehouse_id:
+                query = query.filter(InventoryStock.warehouse_id == warehouse_id)
+            stock_entries = [(entry.product, entry.warehouse, float(entry.quantity)) for entry in query.all()]
 
-        stock_entries = query.all()
         report = []
-        for entry in stock_entries:
-            if not entry.product: continue
+        for product, warehouse, qty in stock_entries:
+            if not product: continue
 
-            qty = float(entry.quantity)
-            price = float(entry.product.standard_price or 0.0)
-            category_name = entry.product.category.name if entry.product.category else "Sin Categoría"
+            price = float(product.standard_price or 0.0)
+            category_name = product.category.name if product.category else "Sin Categoría"
 
             report.append({
-                "product_sku": entry.product.sku,
-                "product_name": entry.product.name,
+                "product_sku": product.sku,
+                "product_name": product.name,
                 "category_name": category_name,
-                "warehouse_name": entry.warehouse.name,
-                "product_location": entry.product.location,
+                "warehouse_name": warehouse.name if warehouse else 'N/A',
+                "product_location": product.location,
                 "quantity": qty,
                 "unit_price": price,
                 "total_value": qty * price
@@ -288,62 +212,20 @@ def adjust_inventory_mass(payload):
     user_id = payload['sub']
 
     try:
-        df = pd.read_excel(file)
-        expected_columns = ['SKU', 'Cantidad', 'Locacion']
-        if not all(col in df.columns for col in expected_columns):
+        df = read_adjustment_sheet(file)
+        if not all(col in df.columns for col in EXPECTED_COLUMNS):
             return jsonify(error="El Excel debe tener: SKU, Cantidad, Locacion"), 400
 
-        updated_count = 0
-        errors = []
-
-        for index, row in df.iterrows():
-            sku = str(row['SKU']).strip()
+        # Si otro proceso mueve el stock mientras se aplica la hoja, se reintenta con datos frescos
+        for attempt in range(ADJUSTMENT_MAX_ATTEMPTS):
             try:
-                real_quantity = float(row['Cantidad'])
-                location = str(row['Locacion']).strip() if pd.notna(row['Locacion']) else None
-            except (ValueError, TypeError):
-                errors.append(f"SKU {sku}: Cantidad inválida.")
-                continue
-
-            product = Product.query.filter_by(sku=sku).first()
-            if not product:
-                errors.append(f"SKU no encontrado: {sku}")
-                continue
-
-            if location:
-                product.location = location
-
-            stock_entry = InventoryStock.query.filter_by(
-                product_id=product.id,
-                warehouse_id=warehouse_id
-            ).first()
-
-            if not stock_entry:
-                stock_entry = InventoryStock(
-                    product_id=product.id,
-                    warehouse_id=warehouse_id,
-                    quantity=0.0
-                )
-                db.session.add(stock_entry)
-
-            current_qty = float(stock_entry.quantity)
-            difference = real_quantity - current_qty
-
-            if difference != 0:
-                stock_entry.quantity = real_quantity
-                transaction = InventoryTransaction(
-                    product_id=product.id,
-                    warehouse_id=warehouse_id,
-                    quantity_change=difference,
-                    new_quantity=real_quantity,
-                    type="Carga Inicial / Ajuste",
-                    user_id=user_id
-                )
-                db.session.add(transaction)
-                updated_count += 1
-
-        db.session.commit()
-        return jsonify({"message": "Proceso completado", "updated_products": updated_count, "errors": errors})
+                result = apply_mass_adjustment(df, warehouse_id, user_id)
+                db.session.commit()
+                return jsonify({"message": "Proceso completado", **result})
+            except StockConflictError as conflict:
+                db.session.rollback()
+                if attempt == ADJUSTMENT_MAX_ATTEMPTS - 1:
+                    return jsonify(error=str(conflict)), 409
 
     except Exception as e:
         db.session.rollback()
@@ -352,57 +234,131 @@ def adjust_inventory_mass(payload):
 
 
 # --- API 5: Kardex ---
+def _apply_kardex_filters(query, args):
+    product_id = args.get('product_id')
+    warehouse_id = args.get('warehouse_id')
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+
+    if product_id: query = query.filter(InventoryTransaction.product_id == product_id)
+    if warehouse_id: query = query.filter(InventoryTransaction.warehouse_id == warehouse_id)
+    if start_date: query = query.filter(InventoryTransaction.timestamp >= start_date)
+    if end_date: query = query.filter(InventoryTransaction.timestamp <= end_date)
+    return query
+
+
 @inventory_api.route('/transactions', methods=['GET'], strict_slashes=False)
 @requires_auth(required_permission='view:inventory')
 def get_kardex_transactions(payload):
     try:
+        try:
+            paginated, limit, cursor = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        if not paginated:
+            # El Kardex completo puede tener millones de filas: siempre por páginas
+            limit = DEFAULT_PAGE_SIZE
+
         query = InventoryTransaction.query.options(
             joinedload(InventoryTransaction.product),
             joinedload(InventoryTransaction.warehouse)
-        ).order_by(InventoryTransaction.timestamp.desc())
-
-        product_id = request.args.get('product_id')
-        warehouse_id = request.args.get('warehouse_id')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        )
 
-        if product_id: query = query.filter(InventoryTransaction.product_id == product_id)
-        if warehouse_id: query = query.filter(InventoryTransaction.warehouse_id == warehouse_id)
-        if start_date: query = query.filter(InventoryTransaction.timestamp >= start_date)
-        if end_date: query = query.filter(InventoryTransaction.timestamp <= end_date)
+        query = _apply_kardex_filters(query, request.args)
 
-        transactions = query.all()
-        return jsonify([t.to_dict() for t in transactions])
+        # Respuesta por páginas: {items, next_cursor} (?limit=, por defecto DEFAULT_PAGE_SIZE; ?cursor=)
+        transactions, next_cursor = keyset_page(
+            query, InventoryTransaction.timestamp, InventoryTransaction.id, limit, cursor
+        )
+        return jsonify({"items": [t.to_dict() for t in transactions], "next_cursor": next_cursor})
 
     except Exception as e:
         print(f"--- ERROR KARDEX: {e} ---")
         return jsonify(error=str(e)), 500
 
 
+# --- API 5B: Exportar Kardex (CSV / XLSX en streaming) ---
+@inventory_api.route('/transactions/export', methods=['GET'])
+@requires_auth(required_permission='view:inventory')
+def export_kardex_transactions(payload):
+    try:
+        export_format = (request.args.get('format') or 'csv').lower()
+        if export_format not in ('csv', 'xlsx'):
+            return jsonify(error="Formato no soportado. Use 'csv' o 'xlsx'."), 400
+
+        query = _apply_kardex_filters(kardex_export_query(), request.args)
+        rows = iter_export_rows(query)
+
+        if export_format == 'csv':
+            return Response(
+                stream_with_context(stream_csv(rows)),
+                mimetype='text/csv',
+                headers={'Content-Disposition': 'attachment; filename=kardex.csv'}
+            )
+
+        return Response(
+            stream_with_context(stream_xlsx(rows)),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            headers={'Content-Disposition': 'attachment; filename=kardex.xlsx'}
+        )
+
+    except Exception as e:
+        print(f"--- ERROR EXPORT KARDEX: {e} ---")
+        return jsonify(error=str(e)), 500
+
+
 # --- API 6: Productos en Almacén ---
+# Proyección de columnas (sin cargar objetos Product ni su unidad de medida uno por uno).
+# Filtros opcionales: ?only_in_stock=true, ?q=texto (SKU o nombre).
+# Paginación opcional: ?limit=&offset= o ?limit=&cursor= -> {items, next_cursor}
 @inventory_api.route('/warehouse/<int:warehouse_id>/products', methods=['GET'])
 @requires_auth(required_permission='view:inventory')
 def get_products_in_warehouse(payload, warehouse_id):
     try:
-        results = db.session.query(Product, InventoryStock).outerjoin(
+        try:
+            paginated, limit, cursor = parse_page_args(request.args, allow_offset=True)
+            offset = parse_offset(request.args)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
+        query = db.session.query(
+            Product.id,
+            Product.sku,
+            Product.name,
+            UnitMeasure.sunat_code,
+            InventoryStock.quantity,
+            Product.location
+        ).outerjoin(
+            UnitMeasure, UnitMeasure.id == Product.unit_measure_id
+        ).outerjoin(
             InventoryStock,
             and_(InventoryStock.product_id == Product.id, InventoryStock.warehouse_id == warehouse_id)
-        ).all()
-
-        response = []
-        for product, stock_entry in results:
-            sunat_code = product.unit_measure.sunat_code if product.unit_measure else 'NIU'
-            current_stock = float(stock_entry.quantity) if stock_entry else 0.0
-
-            response.append({
-                'id': product.id,
-                'sku': product.sku,
-                'name': product.name,
-                'sunat_code': sunat_code,
-                'stock': current_stock,
-                'location': product.location  # Enviar ubicación actual también
-            })
+        )
+
+        if request.args.get('only_in_stock', '').lower() in ('1', 'true', 'yes'):
+            query = query.filter(InventoryStock.quantity > 0)
 
+        search = (request.args.get('q') or '').strip()
+        if search:
+            pattern = f"%{search}%"
+            query = query.filter(or_(Product.sku.ilike(pattern), Product.name.ilike(pattern)))
+
+        if paginated:
+            rows, next_cursor = id_keyset_page(query, Product.id, limit, cursor, offset)
+        else:
+            rows, next_cursor = query.order_by(Product.id).all(), None
+
+        response = [{
+            'id': product_id,
+            'sku': sku,
+            'name': name,
+            'sunat_code': sunat_code or 'NIU',
+            'stock': float(quantity) if quantity is not None else 0.0,
+            'location': location  # Enviar ubicación actual también
+        } for product_id, sku, name, sunat_code, quantity, location in rows]
+
+        if paginated:
+            return jsonify({"items": response, "next_cursor": next_cursor})
         return jsonify(response)
 
     except Exception as e:
@@ -410,9 +366,54 @@ def get_products_in_warehouse(payload, warehouse_id):
         return jsonify(error=str(e)), 500
 
 
+# --- API 6B: ¿Qué hay en el bin? ---
+# Consulta indexada sobre product_locations (bin, almacén) con el stock del almacén.
+@inventory_api.route('/locations/<string:bin_code>', methods=['GET'])
+@requires_auth(required_permission='view:inventory')
+def get_bin_contents(payload, bin_code):
+    try:
+        query = db.session.query(
+            ProductLocation.product_id,
+            Product.sku,
+            Product.name,
+            ProductLocation.warehouse_id,
+            Warehouse.name,
+            InventoryStock.quantity
+        ).join(
+            Product, Product.id == ProductLocation.product_id
+        ).outerjoin(
+            Warehouse, Warehouse.id == ProductLocation.warehouse_id
+        ).outerjoin(
+            InventoryStock,
+            and_(InventoryStock.product_id == ProductLocation.product_id,
+                 InventoryStock.warehouse_id == ProductLocation.warehouse_id)
+        ).filter(ProductLocation.bin == bin_code.strip())
+
+        warehouse_id = request.args.get('warehouse_id')
+        if warehouse_id:
+            query = query.filter(ProductLocation.warehouse_id == warehouse_id)
+
+        rows = query.order_by(Product.sku, ProductLocation.warehouse_id).all()
+
+        return jsonify([{
+            'product_id': product_id,
+            'sku': sku,
+            'name': name,
+            'warehouse_id': wh_id,
+            'warehouse_name': warehouse_name or 'Sin almacén',
+            'bin': bin_code.strip(),
+            'stock': float(quantity) if quantity is not None else 0.0
+        } for product_id, sku, name, wh_id, warehouse_name, quantity in rows])
+
+    except Exception as e:
+        print(f"--- ERROR CONSULTA DE UBICACIÓN: {e} ---")
+        return jsonify(error=str(e)), 500
+
+
 # --- API 2: Ingreso Directo (Sin OC Previa) ---
 @inventory_api.route('/direct-receive', methods=['POST'])
 @requires_auth(required_permission='manage:inventory')
+@idempotent
 def direct_receive_inventory(payload):
     data = request.get_json()
     user_id = payload['sub']
@@ -480,8 +481,15 @@ def direct_receive_inventory(payload):
         db.session.flush()
 
         # 6. Procesar Items
+        # Productos y stock total (agregado) en bloque; el total se actualiza en memoria línea por línea
+        product_ids = {int(item['product_id']) for item in data['items']}
+        products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids)).all()}
+        stock_totals = get_stock_totals(product_ids)
+        movements = []
+        bin_entries = []
+
         for item in data['items']:
-            product_id = item['product_id']
+            product_id = int(item['product_id'])
             qty = float(item['quantity'])
             price = float(item.get('unit_price', 0))
 
@@ -504,24 +512,13 @@ def direct_receive_inventory(payload):
             )
             db.session.add(receipt_item)
 
-            # B) Stock
-            stock_entry = InventoryStock.query.filter_by(
-                product_id=product_id,
-                warehouse_id=data['warehouse_id']
-            ).first()
-
-            if not stock_entry:
-                stock_entry = InventoryStock(
-                    product_id=product_id,
-                    warehouse_id=data['warehouse_id'],
-                    quantity=0
-                )
-                db.session.add(stock_entry)
-
-            # C) Recalcular Costo Promedio y Ubicación
-            product = Product.query.get(product_id)
+            # B) Recalcular Costo Promedio y Ubicación
+            product = products.get(product_id)
+            if not product:
+                raise ValueError(f"Producto ID {product_id} no encontrado.")
 
             if location:
+                bin_entries.append((product_id, data['warehouse_id'], location))
                 # Actualizar ubicación del producto maestro (Append)
                 if not product.location:
                     product.location = location
@@ -535,9 +532,7 @@ def direct_receive_inventory(payload):
                     product.location = ", ".join(existing)
 
             # Cálculo Ponderado
-            current_total_qty = db.session.query(func.sum(InventoryStock.quantity)).filter_by(
-                product_id=product_id).scalar() or 0
-            current_total_qty = float(current_total_qty)
+            current_total_qty = stock_totals.get(product_id, 0.0)
             current_price = float(product.standard_price or 0)
 
             new_total_val = (current_total_qty * current_price) + (qty * price)
@@ -545,21 +540,15 @@ def direct_receive_inventory(payload):
 
             if new_total_qty_global > 0:
                 product.standard_price = new_total_val / new_total_qty_global
+            stock_totals[product_id] = new_total_qty_global
 
-            # D) Aumentar Stock Físico
-            stock_entry.quantity = float(stock_entry.quantity) + qty
+            # C) Stock Físico + Kardex (se aplican en bloque al final)
+            movements.append(Movement(
+                product_id, data['warehouse_id'], qty, "Ingreso Manual", f"Fac. {invoice_num}"
+            ))
 
-            # E) Kardex
-            kardex = InventoryTransaction(
-                product_id=product_id,
-                warehouse_id=data['warehouse_id'],
-                quantity_change=qty,
-                new_quantity=stock_entry.quantity,
-                type="Ingreso Manual",
-                user_id=user_id,
-                reference=f"Fac. {invoice_num}"
-            )
-            db.session.add(kardex)
+        apply_movements(movements, user_id)
+        add_bins(bin_entries)
 
         db.session.commit()
         return jsonify(success=True, message="Ingreso registrado correctamente")
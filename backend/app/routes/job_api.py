@@ -0,0 +1,100 @@
+from flask import Blueprint, jsonify, request, send_file
+from werkzeug.exceptions import HTTPException
+
+from ..services.auth_service import requires_auth, check_permission
+from ..services.render_job_service import submit_render_job, get_job, job_file_path, RenderQueueFullError
+from .report_api import stock_movement_document, cost_report_document
+from .stock_transfer_report_api import stock_transfer_document
+from .purchase_api import purchase_order_document
+from .gre_api import gre_document
+
+job_api = Blueprint('job_api', __name__)
+
+
+def _id_param(params, name):
+    try:
+        return int(params.get(name))
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' es requerido y debe ser un número.")
+
+
+# Documentos que se pueden pedir en segundo plano: tipo -> (permiso requerido, constructor)
+# Cada constructor recibe los 'params' del POST y retorna un PdfDocument;
+# son los mismos que usan las descargas directas.
+JOB_TYPES = {
+    'stock-movement': (None, stock_movement_document),
+    'stock-transfers': (None, stock_transfer_document),
+    'gre-by-cost-center': (None, cost_report_document),
+    'purchase-order': ('view:purchases', lambda params: purchase_order_document(_id_param(params, 'order_id'))),
+    'gre': ('view:transfers', lambda params: gre_document(_id_param(params, 'transfer_id'))),
+}
+
+
+# --- RUTA 1: Encolar un documento ---
+# Body: {"type": "stock-transfers", "params": {"start_date": "2025-01-01", "end_date": "2025-01-31"}}
+# Respuesta 202: {"id": ..., "status": "pendiente", ...}; consultar GET /api/jobs/<id>
+@job_api.route('', methods=['POST'])
+@requires_auth()
+def create_job(payload):
+    data = request.get_json(silent=True) or {}
+    job_type = data.get('type')
+    params = data.get('params') or {}
+
+    if job_type not in JOB_TYPES:
+        return jsonify(error=f"Tipo de documento desconocido. Use uno de: {', '.join(JOB_TYPES)}"), 400
+    if not isinstance(params, dict):
+        return jsonify(error="'params' debe ser un objeto."), 400
+
+    permission, build_document = JOB_TYPES[job_type]
+    if permission:
+        check_permission(permission, payload)
+
+    try:
+        document = build_document(params)
+        job = submit_render_job(document, job_type, payload['sub'])
+    except HTTPException:
+        raise  # get_or_404
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except LookupError as e:
+        return jsonify(error=str(e)), 404
+    except RenderQueueFullError as e:
+        response = jsonify(error=str(e))
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    except Exception as e:
+        print(f"--- ERROR AL ENCOLAR DOCUMENTO: {e} ---")
+        return jsonify(error=str(e)), 500
+
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job.id}"
+    return response
+
+
+# --- RUTA 2: Estado del trabajo (cualquier worker puede responder) ---
+@job_api.route('/<job_id>', methods=['GET'])
+@requires_auth()
+def get_job_status(payload, job_id):
+    job = get_job(job_id, payload['sub'])
+    if job is None:
+        return jsonify(error="Trabajo no encontrado"), 404
+    return jsonify(job.to_dict())
+
+
+# --- RUTA 3: Descargar el PDF terminado ---
+@job_api.route('/<job_id>/download', methods=['GET'])
+@requires_auth()
+def download_job(payload, job_id):
+    job = get_job(job_id, payload['sub'])
+    if job is None:
+        return jsonify(error="Trabajo no encontrado"), 404
+    if job.status != 'completado':
+        return jsonify(error=f"El documento aún no está listo (estado: {job.status}).", status=job.status), 409
+
+    try:
+        return send_file(job_file_path(job.id), mimetype='application/pdf', as_attachment=True,
+                         download_name=job.filename)
+    except FileNotFoundError:
+        return jsonify(error="El archivo ya no está disponible. Vuelva a solicitar el documento."), 410
@@ -3,6 +3,7 @@ from flask import Blueprint, jsonify, request, send_file
 from ..models.product_catalog import Product, Category, UnitMeasure # <--- CAMBIO: Agregado UnitMeasure
 from ..extensions import db
 from ..services.auth_service import requires_auth
+from ..services.location_service import add_bins, split_bins, sync_catalog_bins
 from sqlalchemy import or_
 import pandas as pd
 import io
@@ -69,6 +70,9 @@ def create_product(payload):
         # Nota: Ya no asignamos 'unit_of_measure' como string
 
         db.session.add(new_prod)
+        db.session.flush()
+        add_bins((new_prod.id, None, loc) for loc in split_bins(location_str))
+
         db.session.commit()
         return jsonify(new_prod.to_dict()), 201
 
@@ -97,6 +101,7 @@ def update_product(product_id, payload):
         if 'location' in data:
             locations_list = data.get('location', [])
             prod.location = ', '.join(locations_list) if isinstance(locations_list, list) else None
+            sync_catalog_bins(prod.id, split_bins(prod.location))
 
         db.session.commit()
         return jsonify(prod.to_dict())
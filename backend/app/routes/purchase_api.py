@@ -1,19 +1,18 @@
-import base64
-
-from flask import Blueprint, jsonify, request, current_app, send_file, render_template
-from weasyprint import HTML
+from flask import Blueprint, jsonify, request, current_app
 
 from ..extensions import db
 from ..models.provider import Provider
 from ..models.purchase_order import PurchaseOrder, DocumentType, OrderStatus, PurchaseOrderItem
 from ..services.auth_service import requires_auth
-import requests
+from ..services.render_job_service import PdfDocument
+from ..services.pdf_cache_service import send_pdf
+from ..services.pdf_renderer import asset_url, load_asset
+from ..services import http_clients
 from ..models.cost_center import CostCenter
 from sqlalchemy.orm import joinedload
 from datetime import datetime
 from fpdf import FPDF
 import os
-import io
 
 purchase_api = Blueprint('purchase_api', __name__)
 
@@ -31,7 +30,7 @@ def lookup_provider(ruc, payload):
         url = f"https://api.decolecta.com/v1/sunat/ruc?numero={ruc}"
         headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
 
-        response = requests.get(url, headers=headers)
+        response = http_clients.get('decolecta', url, headers=headers)
         response.raise_for_status()
         data = response.json()
 
@@ -294,17 +293,14 @@ def cancel_purchase(order_id, payload):
         return jsonify(error=str(e)), 500
 
 
-@purchase_api.route('/<int:order_id>/pdf', methods=['GET'])
-@requires_auth(required_permission='view:purchases')
-def download_purchase_pdf(order_id, payload):
+def purchase_order_document(order_id):
+    """
+    PDF de la orden de compra / servicio (404 si no existe).
+    """
     order = PurchaseOrder.query.get_or_404(order_id)
 
-    # 1. Logo Base64
-    logo_path = os.path.join(current_app.instance_path, 'logo_v2.png')
-    logo_b64 = ""
-    if os.path.exists(logo_path):
-        with open(logo_path, "rb") as image_file:
-            logo_b64 = base64.b64encode(image_file.read()).decode('utf-8')
+    # 1. Logo (se sirve desde memoria al renderizar, ver pdf_renderer)
+    logo = load_asset(os.path.join(current_app.instance_path, 'logo_v2.png'))
 
     # 2. Lógica de Condiciones (Tu requerimiento específico)
     # Lista maestra de textos fijos
@@ -346,7 +342,7 @@ def download_purchase_pdf(order_id, payload):
 
     # 4. Contexto para el Template
     context = {
-        'logo_b64': logo_b64,
+        'logo_url': asset_url('logo.png'),
         'titulo_doc': "ORDEN DE SERVICIO" if order.order_type == 'OS' else "ORDEN DE COMPRA",
         'tipo': order.order_type,
         'codigo': order.document_number,
@@ -372,15 +368,13 @@ def download_purchase_pdf(order_id, payload):
         'condiciones': condiciones
     }
 
-    # 5. Generar PDF con WeasyPrint
-    html_string = render_template('purchase_order_weasy.html', **context)
-    pdf_bytes = HTML(string=html_string).write_pdf()
-
-    # 6. Enviar archivo
     safe_name = str(order.document_number).replace('/', '-')
-    return send_file(
-        io.BytesIO(pdf_bytes),
-        mimetype='application/pdf',
-        as_attachment=True,
-        download_name=f"Orden_{safe_name}.pdf"
-    )
\ No newline at end of file
+    return PdfDocument('purchase_order_weasy.html', context, f"Orden_{safe_name}.pdf",
+                       assets={'logo.png': logo} if logo is not None else None)
+
+
+@purchase_api.route('/<int:order_id>/pdf', methods=['GET'])
+@requires_auth(required_permission='view:purchases')
+def download_purchase_pdf(order_id, payload):
+    # Generar PDF con WeasyPrint (o reutilizar el de la caché) y enviar archivo
+    return send_pdf(purchase_order_document(order_id))
\ No newline at end of file
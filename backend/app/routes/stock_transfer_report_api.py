@@ -1,121 +1,109 @@
-from flask import Blueprint, request, jsonify, render_template, make_response
-from sqlalchemy import func, case, and_
-from datetime import datetime, time as time_obj
-from weasyprint import HTML
-from ..models.inventory_models import InventoryTransaction
+from flask import Blueprint, request, jsonify
 from ..models.product_catalog import Product, UnitMeasure
 from ..models.warehouse import Warehouse 
 from ..extensions import db
+from ..services.daily_movement_service import period_movements, parse_period
+from ..services.render_job_service import PdfDocument
+from ..services.pdf_cache_service import send_pdf
 
 stock_transfer_report_api = Blueprint('stock_transfer_report_api', __name__)
 
 
+def _stock_transfer_data(start_date, end_date, warehouse_id=None):
+    """
+    Filas del reporte por producto. Retorna (filas, importe total).
+    """
+    # Saldo inicial, entradas y salidas del período desde el resumen diario del Kardex
+    period_by_product = period_movements(start_date.date(), end_date.date(), warehouse_id)
+
+    product_ids = {
+        pid for pid, values in period_by_product.items()
+        if values['initial'] or values['entries'] or values['exits']
+    }
+    results = db.session.query(
+        Product.id,
+        Product.sku,
+        Product.name,
+        UnitMeasure.sunat_code,
+        Product.standard_price.label('product_cost')
+    ).join(UnitMeasure, Product.unit_measure_id == UnitMeasure.id) \
+        .filter(Product.id.in_(product_ids)).order_by(Product.sku).all()
+
+    report_data = []
+    units_map = {u.sunat_code: u.symbol for u in UnitMeasure.query.all()}
+    total_importe = 0
+
+    for row in results:
+        period = period_by_product[row.id]
+        initial = period['initial']
+        entries = period['entries']
+        exits = period['exits']
+        final_stock = initial + entries - exits
+
+        if initial == 0 and entries == 0 and exits == 0:
+            continue
+
+        um_symbol = units_map.get(row.sunat_code, row.sunat_code)
+        costo_unitario = float(row.product_cost or 0)
+        importe_total = final_stock * costo_unitario
+        total_importe += importe_total
+
+        report_data.append({
+            'codigo': row.sku,
+            'descripcion': row.name,
+            'saldo_inicial': initial,
+            'entradas': entries,
+            'salidas': exits,
+            'stock_final': final_stock,
+            'unidad': um_symbol,
+            'costo_prom': costo_unitario,
+            'importe': importe_total
+        })
+    return report_data, total_importe
+
+
+def stock_transfer_document(params):
+    """
+    PDF del reporte de stock con transferencias. params: start_date, end_date, warehouse_id.
+    """
+    start_date, end_date = parse_period(params)
+    warehouse_id = params.get('warehouse_id')
+    report_data, total_importe = _stock_transfer_data(start_date, end_date, warehouse_id)
+
+    warehouse_name = "Todos los Almacenes"
+    if warehouse_id:
+        warehouse = Warehouse.query.get(warehouse_id)
+        if warehouse:
+            warehouse_name = warehouse.name
+
+    currency = "SOLES"
+
+    return PdfDocument('stock_report.html', {
+        'data': report_data,
+        'start_date': start_date.strftime('%d/%m/%Y'),
+        'end_date': end_date.strftime('%d/%m/%Y'),
+        'warehouse_name': warehouse_name,
+        'currency': currency,
+        'total_importe': total_importe
+    }, f"stock_report_{params.get('start_date')}_to_{params.get('end_date')}.pdf")
+
+
 @stock_transfer_report_api.route('/reports/stock-transfers', methods=['GET'])
 def get_stock_transfer_report():
     try:
-        start_date_str = request.args.get('start_date')
-        end_date_str = request.args.get('end_date')
-        warehouse_id = request.args.get('warehouse_id')
         report_format = request.args.get('format', 'json')
 
-        if not start_date_str or not end_date_str:
-            return jsonify({"error": "Las fechas de inicio y fin son requeridas"}), 400
-
         try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-            end_date = datetime.combine(datetime.strptime(end_date_str, '%Y-%m-%d'), time_obj.max)
-        except ValueError:
-            return jsonify({"error": "Formato de fecha inválido. Use YYYY-MM-DD"}), 400
-
-        query = db.session.query(
-            Product.sku,
-            Product.name,
-            UnitMeasure.sunat_code,
-            Product.standard_price.label('product_cost'),
-            func.sum(case(
-                (InventoryTransaction.timestamp < start_date, InventoryTransaction.quantity_change),
-                else_=0
-            )).label('initial_stock'),
-            func.sum(case(
-                (and_(
-                    InventoryTransaction.timestamp.between(start_date, end_date),
-                    InventoryTransaction.quantity_change > 0
-                ), InventoryTransaction.quantity_change),
-                else_=0
-            )).label('entries'),
-            func.sum(case(
-                (and_(
-                    InventoryTransaction.timestamp.between(start_date, end_date),
-                    InventoryTransaction.quantity_change < 0
-                ), func.abs(InventoryTransaction.quantity_change)),
-                else_=0
-            )).label('exits')
-        ).join(InventoryTransaction, InventoryTransaction.product_id == Product.id) \
-            .join(UnitMeasure, Product.unit_measure_id == UnitMeasure.id)
-
-        if warehouse_id:
-            query = query.filter(InventoryTransaction.warehouse_id == warehouse_id)
-
-        results = query.group_by(Product.id, Product.sku, Product.name, UnitMeasure.sunat_code, Product.standard_price).order_by(
-            Product.sku).all()
-
-        report_data = []
-        units_map = {u.sunat_code: u.symbol for u in UnitMeasure.query.all()}
-        total_importe = 0
-
-        for row in results:
-            initial = float(row.initial_stock or 0)
-            entries = float(row.entries or 0)
-            exits = float(row.exits or 0)
-            final_stock = initial + entries - exits
-
-            if initial == 0 and entries == 0 and exits == 0:
-                continue
-
-            um_symbol = units_map.get(row.sunat_code, row.sunat_code)
-            costo_unitario = float(row.product_cost or 0)
-            importe_total = final_stock * costo_unitario
-            total_importe += importe_total
-
-            report_data.append({
-                'codigo': row.sku,
-                'descripcion': row.name,
-                'saldo_inicial': initial,
-                'entradas': entries,
-                'salidas': exits,
-                'stock_final': final_stock,
-                'unidad': um_symbol,
-                'costo_prom': costo_unitario,
-                'importe': importe_total
-            })
-
-        if report_format == 'pdf':
-            warehouse_name = "Todos los Almacenes"
-            if warehouse_id:
-                warehouse = Warehouse.query.get(warehouse_id)
-                if warehouse:
-                    warehouse_name = warehouse.name
-            
-            currency = "SOLES"
-
-            html_template = render_template(
-                'stock_report.html',
-                data=report_data,
-                start_date=start_date.strftime('%d/%m/%Y'),
-                end_date=end_date.strftime('%d/%m/%Y'),
-                warehouse_name=warehouse_name,
-                currency=currency,
-                total_importe=total_importe
-            )
-            pdf_bytes = HTML(string=html_template).write_pdf()
-            response = make_response(pdf_bytes)
-            response.headers['Content-Type'] = 'application/pdf'
-            response.headers['Content-Disposition'] = f'attachment; filename=stock_report_{start_date_str}_to_{end_date_str}.pdf'
-            return response
+            if report_format == 'pdf':
+                return send_pdf(stock_transfer_document(request.args))
+            start_date, end_date = parse_period(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
+        report_data, _ = _stock_transfer_data(start_date, end_date, request.args.get('warehouse_id'))
         return jsonify(report_data)
 
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
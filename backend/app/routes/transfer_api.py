@@ -2,11 +2,12 @@ from flask import Blueprint, jsonify, request
 from ..extensions import db
 from sqlalchemy.orm import joinedload
 from ..services.auth_service import requires_auth
+from ..services.idempotency_service import idempotent
+from ..services.inventory_ledger import apply_movements, Movement
 from datetime import datetime
 
 # Importamos TODOS los modelos que necesitamos
 from ..models.stock_transfer import StockTransfer, StockTransferItem
-from ..models.inventory_models import InventoryStock, InventoryTransaction
 from ..models.product_catalog import Product
 from ..models.warehouse import Warehouse
 
@@ -32,6 +33,7 @@ def get_transfers(payload):
 # --- RUTA 2: Crear una nueva transferencia (SIN GRE) ---
 @transfer_api.route('/', methods=['POST'], strict_slashes=False)
 @requires_auth(required_permission='manage:transfers')
+@idempotent
 def create_transfer(payload):
     data = request.get_json()
     user_id = payload['sub']
@@ -63,16 +65,21 @@ def create_transfer(payload):
         # Hacemos flush para obtener el ID de la transferencia antes de guardar items
         db.session.flush()
 
-        # --- 3. Crear los items y mover el stock ---
-        for item_data in transfer_data['items']:
-            product_id = item_data['product_id']
+        # --- 3. Crear los items y armar los movimientos de stock ---
+        items = transfer_data['items']
+        product_ids = {int(item_data['product_id']) for item_data in items}
+        products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids)).all()}
+
+        movements = []
+        for item_data in items:
+            product_id = int(item_data['product_id'])
             quantity = float(item_data['quantity'])
 
             if quantity <= 0:
                 raise ValueError("La cantidad debe ser mayor a 0.")
 
             # Verificamos que el producto exista
-            product = Product.query.get(product_id)
+            product = products.get(product_id)
             if not product:
                 raise ValueError(f"Producto ID {product_id} no encontrado.")
 
@@ -88,52 +95,20 @@ def create_transfer(payload):
             db.session.add(new_item)
             # --------------------------------------------------
 
-            # --- Lógica de Stock (Salida del Origen) ---
-            stock_origen = InventoryStock.query.filter_by(
-                product_id=product_id,
-                warehouse_id=transfer_data['origin_warehouse_id']
-            ).first()
-
-            if not stock_origen or float(stock_origen.quantity) < quantity:
-                raise ValueError(f"Stock insuficiente para {product.name} en el almacén de origen.")
-
-            stock_origen.quantity = float(stock_origen.quantity) - quantity
+            # --- Salida del Origen (solo si hay stock suficiente) ---
+            movements.append(Movement(
+                product_id, transfer_data['origin_warehouse_id'], -quantity,
+                "Transferencia Salida", require_available=True
+            ))
 
-            trans_salida = InventoryTransaction(
-                product_id=product_id,
-                warehouse_id=transfer_data['origin_warehouse_id'],
-                quantity_change=-quantity,
-                new_quantity=stock_origen.quantity,
-                type="Transferencia Salida",
-                user_id=user_id
-            )
-            db.session.add(trans_salida)
-
-            # --- Lógica de Stock (Entrada al Destino - Solo si es almacén interno) ---
+            # --- Entrada al Destino (Solo si es almacén interno) ---
             if new_transfer.destination_warehouse_id:
-                stock_destino = InventoryStock.query.filter_by(
-                    product_id=product_id,
-                    warehouse_id=new_transfer.destination_warehouse_id
-                ).first()
-
-                if not stock_destino:
-                    stock_destino = InventoryStock(product_id=product_id,
-                                                   warehouse_id=new_transfer.destination_warehouse_id, quantity=0.0)
-                    db.session.add(stock_destino)
-
-                stock_destino.quantity = float(stock_destino.quantity) + quantity
-
-                trans_entrada = InventoryTransaction(
-                    product_id=product_id,
-                    warehouse_id=new_transfer.destination_warehouse_id,
-                    quantity_change=quantity,
-                    new_quantity=stock_destino.quantity,
-                    type="Transferencia Entrada",
-                    user_id=user_id
-                )
-                db.session.add(trans_entrada)
-
-        # 4. Guardar todo
+                movements.append(Movement(
+                    product_id, new_transfer.destination_warehouse_id, quantity, "Transferencia Entrada"
+                ))
+
+        # 4. Mover stock, Kardex y totales en bloque; guardar todo
+        apply_movements(movements, user_id)
         db.session.commit()
 
         print(f"--- Transferencia ID {new_transfer.id} creada exitosamente. ---")
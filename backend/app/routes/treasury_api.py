@@ -8,6 +8,7 @@ import requests
 from flask import current_app
 from ..schemas.treasury import TransactionCreate, TransactionUpdate, TransactionResponse
 from ..services.auth_service import requires_auth
+from ..services import http_clients
 from datetime import datetime
 
 treasury_api = Blueprint('treasury_api', __name__)
@@ -518,7 +519,7 @@ def lookup_provider(ruc, payload):
             'Content-Type': 'application/json'
         }
 
-        response = requests.get(url, headers=headers)
+        response = http_clients.get('decolecta', url, headers=headers)
         response.raise_for_status()
         data = response.json()
 
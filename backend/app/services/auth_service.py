@@ -1,10 +1,16 @@
+import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from urllib.request import urlopen
-from flask import request
-from jose import jwt
+from flask import request, current_app
+from jose import jwt, jwk
 from ..extensions import db
 from ..models.role import Role
+from ..models.cache_generation import CacheGeneration
+from . import http_clients
 # --- Pega tus valores de Auth0 aquí ---
 AUTH0_DOMAIN = 'dev-gforng2dfnavhcdz.us.auth0.com'
 API_IDENTIFIER = 'https://api.appcompower.com' # El Audience
@@ -12,6 +18,11 @@ ALGORITHMS = ["RS256"]
 AUTH0_NAMESPACE = 'https://appcompower.com'
 # ------------------------------------
 
+# Tiempo mínimo entre dos refrescos forzados por un 'kid' desconocido.
+# Evita que tokens con 'kid' inventados nos hagan golpear a Auth0 en cada request.
+JWKS_MIN_REFRESH_INTERVAL = 30
+JWKS_FETCH_TIMEOUT = 5
+
 
 # Clase para los errores de autenticación
 class AuthError(Exception):
@@ -20,6 +31,224 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+# --- Caché de llaves públicas de Auth0 (JWKS) ---
+class JwksCache:
+    """
+    Guarda en memoria (por worker) las llaves RSA de Auth0 ya parseadas, indexadas por 'kid'.
+    - Se refrescan cuando vence el TTL (AUTH0_JWKS_TTL).
+    - Un 'kid' desconocido fuerza UN refresco (como máximo cada JWKS_MIN_REFRESH_INTERVAL segundos).
+    - Solo un hilo descarga el JWKS a la vez; los demás esperan y reutilizan el resultado.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._expires_at = 0.0
+        self._last_refresh = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_key(self, kid):
+        now = time.monotonic()
+        if now >= self._expires_at:
+            self._refresh(self._generation)
+
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._last_refresh >= JWKS_MIN_REFRESH_INTERVAL:
+            # 'kid' nuevo (rotación de llaves en Auth0): refrescamos una sola vez
+            self._refresh(self._generation)
+            key = self._keys.get(kid)
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0.0
+            self._last_refresh = 0.0
+            self._generation += 1
+
+    def _refresh(self, seen_generation):
+        with self._lock:
+            # Otro hilo ya refrescó mientras esperábamos el lock (single-flight)
+            if self._generation != seen_generation:
+                return
+
+            ttl = current_app.config.get('AUTH0_JWKS_TTL', 3600)
+            try:
+                jwks = fetch_jwks(get_jwks_url())
+            except Exception as e:
+                print(f"--- ERROR DESCARGANDO JWKS: {e} ---")
+                if not self._keys:
+                    raise AuthError({"code": "jwks_unavailable",
+                                     "description": "Unable to fetch signing keys"}, 503)
+                # Seguimos con las llaves anteriores y reintentamos más tarde
+                self._expires_at = time.monotonic() + JWKS_MIN_REFRESH_INTERVAL
+                return
+
+            keys = {}
+            for key in jwks.get("keys", []):
+                if key.get("kty") != "RSA" or "kid" not in key:
+                    continue
+                keys[key["kid"]] = jwk.construct({
+                    "kty": key["kty"], "kid": key["kid"], "use": key.get("use", "sig"),
+                    "n": key["n"], "e": key["e"]
+                }, algorithm=ALGORITHMS[0])
+
+            now = time.monotonic()
+            self._keys = keys
+            self._expires_at = now + ttl
+            self._last_refresh = now
+            self._generation += 1
+
+
+jwks_cache = JwksCache()
+
+
+def get_jwks_url():
+    return current_app.config.get('AUTH0_JWKS_URL') or f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
+
+
+def fetch_jwks(url):
+    """
+    Descarga el JWKS por la sesión compartida de Auth0 (http_clients).
+    Una URL file:// (JWKS local para pruebas sin conexión) se lee directamente.
+    """
+    if url.startswith(('http://', 'https://')):
+        response = http_clients.get('auth0', url)
+        response.raise_for_status()
+        return response.json()
+    with urlopen(url, timeout=JWKS_FETCH_TIMEOUT) as jsonurl:
+        return json.loads(jsonurl.read())
+
+
+# --- Caché de tokens ya verificados ---
+class VerifiedTokenCache:
+    """
+    LRU acotado de tokens cuya firma y claims ya fueron verificados.
+    - La llave es el SHA-256 del token (nunca guardamos el token en claro).
+    - Cada entrada vive hasta el 'exp' del token; vencida, se elimina.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                payload, exp = entry
+                if exp > time.time():
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return payload
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload):
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)):
+            return
+        max_size = current_app.config.get('AUTH_TOKEN_CACHE_SIZE', 1024)
+        if max_size <= 0:
+            return
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (payload, exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for digest in [d for d, (_, exp) in self._entries.items() if exp <= now]:
+                del self._entries[digest]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        self.purge_expired()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': current_app.config.get('AUTH_TOKEN_CACHE_SIZE', 1024),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+token_cache = VerifiedTokenCache()
+
+
+# --- Caché de permisos por combinación de roles ---
+PERMISSIONS_CACHE_NAME = 'role_permissions'
+
+
+class RolePermissionCache:
+    """
+    Memoriza el conjunto de permisos (frozenset) de cada combinación de roles (tupla ordenada).
+    La invalidación entre workers se hace con un contador en la BD (CacheGeneration):
+    cada worker lo revisa como máximo cada PERMISSIONS_CACHE_CHECK_INTERVAL segundos.
+    """
+
+    def __init__(self):
+        self._permissions = {}
+        self._generation = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def resolve(self, roles):
+        key = tuple(sorted(set(roles)))
+        self._sync_generation()
+
+        permissions = self._permissions.get(key)
+        if permissions is None:
+            user_roles_in_db = Role.query.filter(Role.name.in_(key)).all()
+            permissions = frozenset(perm.name for role in user_roles_in_db for perm in role.permissions)
+            self._permissions[key] = permissions
+        return permissions
+
+    def invalidate(self):
+        """Incrementa la generación en la BD (en la transacción actual) y limpia la caché local."""
+        CacheGeneration.bump(PERMISSIONS_CACHE_NAME)
+        with self._lock:
+            self._permissions = {}
+            self._generation = None
+            self._checked_at = 0.0
+
+    def _sync_generation(self):
+        interval = current_app.config.get('PERMISSIONS_CACHE_CHECK_INTERVAL', 5)
+        if time.monotonic() - self._checked_at < interval:
+            return
+        with self._lock:
+            generation = CacheGeneration.current(PERMISSIONS_CACHE_NAME)
+            if generation != self._generation:
+                self._permissions = {}
+                self._generation = generation
+            self._checked_at = time.monotonic()
+
+
+permission_cache = RolePermissionCache()
+
+
+def get_permissions_for_roles(roles):
+    return permission_cache.resolve(roles)
+
+
 # --- Obtener el Token del Header ---
 def get_token_auth_header():
     auth = request.headers.get("Authorization", None)
@@ -58,6 +287,61 @@ def check_for_roles(required_role, payload):
     return True
 
 
+# --- Verificación del token (firma + claims), con caché ---
+def verify_token(token):
+    """
+    Devuelve el payload del token. Si ya fue verificado antes y no ha vencido,
+    se sirve desde la caché sin repetir la verificación RSA.
+    """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({"code": "invalid_header",
+                        "description": "Unable to parse authentication token."}, 401)
+
+    rsa_key = jwks_cache.get_key(unverified_header.get("kid"))
+    if not rsa_key:
+        raise AuthError({"code": "invalid_header", "description": "Unable to find appropriate key"}, 401)
+
+    try:
+        payload = jwt.decode(
+            token, rsa_key, algorithms=ALGORITHMS,
+            audience=API_IDENTIFIER, issuer=f"https://{AUTH0_DOMAIN}/"
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthError({"code": "token_expired", "description": "Token is expired"}, 401)
+    except jwt.JWTClaimsError:
+        raise AuthError({"code": "invalid_claims", "description": "Incorrect claims"}, 401)
+    except Exception:
+        raise AuthError({"code": "invalid_header", "description": "Unable to find appropriate key"}, 401)
+
+    token_cache.put(token, payload)
+    return payload
+
+
+def check_permission(required_permission, payload):
+    """
+    Lanza AuthError si los roles del token no tienen el permiso (permisos de la BD).
+    """
+    # 1. Obtener los roles del token (ej. ['Admin', 'Usuario'])
+    roles_key = f"{AUTH0_NAMESPACE}/roles"
+    if roles_key not in payload:
+        raise AuthError({"code": "invalid_claims", "description": "Roles claim not found."}, 401)
+    auth0_roles = payload[roles_key]
+
+    # 2. Resolver sus permisos (memorizado por combinación de roles)
+    all_permissions = get_permissions_for_roles(auth0_roles)
+
+    # 3. Revisar si el permiso requerido está en la lista
+    if required_permission not in all_permissions:
+        raise AuthError({"code": "unauthorized",
+                        "description": "Permission not found."}, 403) # 403 Prohibido
+
+
 # --- ¡ACTUALIZADO! Decorador de Autenticación y Permisos ---
 def requires_auth(required_role=None, required_permission=None):
     """
@@ -69,66 +353,17 @@ def requires_auth(required_role=None, required_permission=None):
         @wraps(f)
         def decorated(*args, **kwargs):
             token = get_token_auth_header()
-            jsonurl = urlopen(f"https://{AUTH0_DOMAIN}/.well-known/jwks.json")
-            jwks = json.loads(jsonurl.read())
+            payload = verify_token(token)
 
-            try:
-                unverified_header = jwt.get_unverified_header(token)
-            except jwt.JWTError:
-                raise AuthError({"code": "invalid_header",
-                                "description": "Unable to parse authentication token."}, 401)
-
-            rsa_key = {}
-            for key in jwks["keys"]:
-                if key["kid"] == unverified_header["kid"]:
-                    rsa_key = {
-                        "kty": key["kty"], "kid": key["kid"], "use": key["use"], "n": key["n"], "e": key["e"]
-                    }
-            if rsa_key:
-                try:
-                    payload = jwt.decode(
-                        token, rsa_key, algorithms=ALGORITHMS,
-                        audience=API_IDENTIFIER, issuer=f"https://{AUTH0_DOMAIN}/"
-                    )
-                except jwt.ExpiredSignatureError:
-                    raise AuthError({"code": "token_expired", "description": "Token is expired"}, 401)
-                except jwt.JWTClaimsError:
-                    raise AuthError({"code": "invalid_claims", "description": "Incorrect claims"}, 401)
-                except Exception:
-                    raise AuthError({"code": "invalid_header", "description": "Unable to find appropriate key"}, 401)
-
-                # --- REVISIÓN DE ROL (de Auth0) ---
-                if required_role:
-                    check_for_roles(required_role, payload)
-
-                # --- ¡NUEVO! REVISIÓN DE PERMISO (de la Base de Datos) ---
-                if required_permission:
-                    # 1. Obtener los roles del token (ej. ['Admin', 'Usuario'])
-                    roles_key = f"{AUTH0_NAMESPACE}/roles"
-                    if roles_key not in payload:
-                        raise AuthError({"code": "invalid_claims", "description": "Roles claim not found."}, 401)
-                    auth0_roles = payload[roles_key]
-
-                    # 2. Buscar esos roles en nuestra BD
-                    user_roles_in_db = Role.query.filter(Role.name.in_(auth0_roles)).all()
-
-                    # 3. Juntar todos sus permisos en una sola lista
-                    all_permissions = set()
-                    for role in user_roles_in_db:
-                        for perm in role.permissions:
-                            all_permissions.add(perm.name)
-
-                    # 4. Revisar si el permiso requerido está en la lista
-                    if required_permission not in all_permissions:
-                        raise AuthError({"code": "unauthorized",
-                                        "description": "Permission not found."}, 403) # 403 Prohibido
-
-                kwargs["payload"] = payload
-                return f(*args, **kwargs)
-
-                kwargs["payload"] = payload
-                return f(*args, **kwargs)
-
-            raise AuthError({"code": "invalid_header", "description": "Unable to find appropriate key"}, 401)
+            # --- REVISIÓN DE ROL (de Auth0) ---
+            if required_role:
+                check_for_roles(required_role, payload)
+
+            # --- ¡NUEVO! REVISIÓN DE PERMISO (de la Base de Datos) ---
+            if required_permission:
+                check_permission(required_permission, payload)
+
+            kwargs["payload"] = payload
+            return f(*args, **kwargs)
         return decorated
     return decorator
\ No newline at end of file
@@ -0,0 +1,244 @@
+from collections import defaultdict
+from datetime import datetime, time
+
+from sqlalchemy import func, insert, update, select, case, bindparam, tuple_, text, Date
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..extensions import db
+from ..models.inventory_models import InventoryDailyMovement, InventoryTransaction
+
+
+# ==============================================================================
+# RESUMEN DIARIO DEL KARDEX (inventory_daily_movements)
+# ==============================================================================
+# Los reportes de movimiento de stock necesitan, por producto, el saldo inicial y
+# las entradas/salidas de un período. En lugar de agregar inventory_transactions
+# en cada llamada, se mantiene una fila por (día, producto, almacén) con las
+# entradas, salidas y el saldo al cierre del día. Un reporte de un año lee a lo
+# sumo 365 filas por producto/almacén.
+#
+# inventory_ledger llama a record_daily_movements() con las filas del Kardex que
+# acaba de insertar, en la misma transacción. El UPSERT suma sobre la fila del
+# día, así dos workers que mueven el mismo producto no se pisan.
+#
+# La migración carga el historial existente (backfill_daily_movements); 'flask
+# inventory rollup' reconstruye la tabla para corregir movimientos escritos por
+# fuera del ledger.
+
+DAILY_TABLE = InventoryDailyMovement.__table__
+
+
+def _day_totals(kardex_rows):
+    """
+    {(product_id, warehouse_id): [entradas, salidas]} de las filas del Kardex.
+    """
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for row in kardex_rows:
+        change = float(row['quantity_change'])
+        bucket = totals[(row['product_id'], row['warehouse_id'])]
+        if change > 0:
+            bucket[0] += change
+        else:
+            bucket[1] -= change
+    return totals
+
+
+def _last_rows(keys, day):
+    """
+    Última fila del resumen con fecha <= day para cada (producto, almacén).
+    Retorna {(product_id, warehouse_id): (día, saldo al cierre)}.
+    """
+    latest = db.session.query(
+        InventoryDailyMovement.product_id,
+        InventoryDailyMovement.warehouse_id,
+        func.max(InventoryDailyMovement.day).label('day')
+    ).filter(
+        tuple_(InventoryDailyMovement.product_id, InventoryDailyMovement.warehouse_id).in_(list(keys)),
+        InventoryDailyMovement.day <= day
+    ).group_by(InventoryDailyMovement.product_id, InventoryDailyMovement.warehouse_id).subquery()
+
+    rows = db.session.query(
+        InventoryDailyMovement.product_id,
+        InventoryDailyMovement.warehouse_id,
+        InventoryDailyMovement.day,
+        InventoryDailyMovement.closing_quantity
+    ).join(latest, (InventoryDailyMovement.product_id == latest.c.product_id)
+           & (InventoryDailyMovement.warehouse_id == latest.c.warehouse_id)
+           & (InventoryDailyMovement.day == latest.c.day)).all()
+    return {(pid, wid): (row_day, float(closing)) for pid, wid, row_day, closing in rows}
+
+
+def _kardex_balances_before(keys, moment):
+    """
+    Saldo del Kardex antes de 'moment' para productos/almacenes que aún no tienen resumen.
+    """
+    rows = db.session.query(
+        InventoryTransaction.product_id, InventoryTransaction.warehouse_id, func.sum(InventoryTransaction.quantity_change)
+    ).filter(
+        tuple_(InventoryTransaction.product_id, InventoryTransaction.warehouse_id).in_(list(keys)),
+        InventoryTransaction.timestamp < moment
+    ).group_by(InventoryTransaction.product_id, InventoryTransaction.warehouse_id).all()
+    return {(pid, wid): float(qty or 0) for pid, wid, qty in rows}
+
+
+def record_daily_movements(kardex_rows, day):
+    """
+    Suma las filas del Kardex recién insertadas (todas del día 'day') al resumen diario.
+    """
+    totals = _day_totals(kardex_rows)
+    if not totals:
+        return
+
+    # Saldo de apertura para las filas del día que aún no existen: el último cierre
+    # anterior o, si el producto/almacén no tiene resumen, el Kardex previo al día
+    last = _last_rows(totals.keys(), day)
+    without_rollup = [key for key in totals if key not in last]
+    opening = _kardex_balances_before(without_rollup, datetime.combine(day, time.min)) if without_rollup else {}
+
+    rows = []
+    for (product_id, warehouse_id), (entries, exits) in sorted(totals.items()):
+        key = (product_id, warehouse_id)
+        previous = last[key][1] if key in last else opening.get(key, 0.0)
+        rows.append({
+            'day': day, 'product_id': product_id, 'warehouse_id': warehouse_id,
+            'entries': round(entries, 2), 'exits': round(exits, 2),
+            'closing_quantity': round(previous + entries - exits, 2)
+        })
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(DAILY_TABLE).values(rows)
+        # Si la fila del día ya existe (u otro worker la creó entre medio) se suma el movimiento
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['product_id', 'warehouse_id', 'day'],
+            set_={
+                'entries': DAILY_TABLE.c.entries + stmt.excluded.entries,
+                'exits': DAILY_TABLE.c.exits + stmt.excluded.exits,
+                'closing_quantity': DAILY_TABLE.c.closing_quantity + stmt.excluded.entries - stmt.excluded.exits
+            }
+        )
+        db.session.execute(stmt)
+        return
+
+    existing = [row for row in rows if last.get((row['product_id'], row['warehouse_id']), (None,))[0] == day]
+    if existing:
+        db.session.execute(
+            update(DAILY_TABLE).where(
+                DAILY_TABLE.c.product_id == bindparam('p_id'),
+                DAILY_TABLE.c.warehouse_id == bindparam('w_id'),
+                DAILY_TABLE.c.day == bindparam('d')
+            ).values(
+                entries=DAILY_TABLE.c.entries + bindparam('e'),
+                exits=DAILY_TABLE.c.exits + bindparam('x'),
+                closing_quantity=DAILY_TABLE.c.closing_quantity + bindparam('e') - bindparam('x')
+            ),
+            [{'p_id': r['product_id'], 'w_id': r['warehouse_id'], 'd': day, 'e': r['entries'], 'x': r['exits']}
+             for r in existing]
+        )
+    new_rows = [row for row in rows if row not in existing]
+    if new_rows:
+        db.session.execute(insert(DAILY_TABLE), new_rows)
+
+
+def backfill_daily_movements(connection, chunk_size=5000):
+    """
+    Inserta el resumen calculado desde todo el Kardex (la tabla debe estar vacía).
+    'connection' es db.session o la conexión de una migración. Retorna las filas generadas.
+    """
+    t = InventoryTransaction.__table__
+    day = func.date(t.c.timestamp, type_=Date)
+    stmt = select(
+        t.c.product_id, t.c.warehouse_id, day,
+        func.sum(case((t.c.quantity_change > 0, t.c.quantity_change), else_=0)),
+        func.sum(case((t.c.quantity_change < 0, -t.c.quantity_change), else_=0))
+    ).where(t.c.timestamp.isnot(None)).group_by(t.c.product_id, t.c.warehouse_id, day) \
+        .order_by(t.c.product_id, t.c.warehouse_id, day)
+
+    total = 0
+    carry_key, balance = None, 0.0
+    batch = []
+    for product_id, warehouse_id, row_day, entries, exits in connection.execute(
+            stmt.execution_options(yield_per=chunk_size)):
+        key = (product_id, warehouse_id)
+        if key != carry_key:
+            carry_key, balance = key, 0.0
+        entries, exits = float(entries or 0), float(exits or 0)
+        balance = round(balance + entries - exits, 2)
+        batch.append({
+            'day': row_day, 'product_id': product_id, 'warehouse_id': warehouse_id,
+            'entries': round(entries, 2), 'exits': round(exits, 2), 'closing_quantity': balance
+        })
+        if len(batch) >= chunk_size:
+            connection.execute(insert(DAILY_TABLE), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        connection.execute(insert(DAILY_TABLE), batch)
+        total += len(batch)
+    return total
+
+
+def rebuild_daily_movements(chunk_size=5000):
+    """
+    Reconstruye todo el resumen desde el Kardex (una transacción). Retorna las filas generadas.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # Los movimientos que lleguen mientras tanto esperan y se suman sobre lo reconstruido
+        db.session.execute(text('LOCK TABLE inventory_daily_movements IN EXCLUSIVE MODE'))
+
+    db.session.query(InventoryDailyMovement).delete(synchronize_session=False)
+    total = backfill_daily_movements(db.session, chunk_size)
+    db.session.commit()
+    return total
+
+
+def parse_period(params):
+    """
+    start_date / end_date (YYYY-MM-DD) de los reportes -> (inicio, fin del último día). Lanza ValueError.
+    """
+    start_date_str = params.get('start_date')
+    end_date_str = params.get('end_date')
+    if not start_date_str or not end_date_str:
+        raise ValueError("Las fechas de inicio y fin son requeridas")
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+        end_date = datetime.combine(datetime.strptime(end_date_str, '%Y-%m-%d'), time.max)
+    except ValueError:
+        raise ValueError("Formato de fecha inválido. Use YYYY-MM-DD")
+    return start_date, end_date
+
+
+def period_movements(start_day, end_day, warehouse_id=None):
+    """
+    Saldo inicial, entradas y salidas por producto entre start_day y end_day (inclusive),
+    leído del resumen diario. Retorna {product_id: {'initial', 'entries', 'exits'}}.
+    """
+    result = defaultdict(lambda: {'initial': 0.0, 'entries': 0.0, 'exits': 0.0})
+    d = InventoryDailyMovement
+
+    # Saldo inicial: último cierre anterior al período de cada producto/almacén
+    latest = db.session.query(d.product_id, d.warehouse_id, func.max(d.day).label('day')).filter(d.day < start_day)
+    if warehouse_id:
+        latest = latest.filter(d.warehouse_id == warehouse_id)
+    latest = latest.group_by(d.product_id, d.warehouse_id).subquery()
+    openings = db.session.query(d.product_id, d.closing_quantity).join(
+        latest, (d.product_id == latest.c.product_id) & (d.warehouse_id == latest.c.warehouse_id)
+        & (d.day == latest.c.day)
+    ).all()
+    for product_id, closing in openings:
+        result[product_id]['initial'] += float(closing)
+
+    # Entradas y salidas del período
+    period = db.session.query(d.product_id, func.sum(d.entries), func.sum(d.exits)).filter(
+        d.day >= start_day, d.day <= end_day
+    )
+    if warehouse_id:
+        period = period.filter(d.warehouse_id == warehouse_id)
+    for product_id, entries, exits in period.group_by(d.product_id).all():
+        result[product_id]['entries'] = float(entries or 0)
+        result[product_id]['exits'] = float(exits or 0)
+
+    for values in result.values():
+        values['initial'] = round(values['initial'], 2)
+    return dict(result)
@@ -0,0 +1,411 @@
+import os
+import json
+import base64
+import random
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update, or_
+
+from ..extensions import db
+from ..models.gre import Gre
+from ..models.gre_submission import GreSubmission
+from ..models.product_catalog import Product
+from ..models.stock_transfer import StockTransfer, StockTransferItem
+from ..models.warehouse import Warehouse
+from . import gre_service
+from .inventory_ledger import apply_movements, Movement, MISSING_RECORD
+
+
+# ==============================================================================
+# ENVÍO DE GRE A SUNAT EN SEGUNDO PLANO
+# ==============================================================================
+# POST /api/gre/enviar arma, firma y comprime la guía, la guarda en estado
+# 'pendiente' (gre + gre_details + gre_submissions) y responde 202 sin esperar
+# a SUNAT. El frontend consulta GET /api/gre/estado/<id>.
+#
+# El poller (un hilo por worker, o 'flask gre process-pending') toma las guías
+# cuyo next_attempt_at ya pasó, reservándolas con locked_until para que dos
+# workers no atiendan la misma a la vez:
+#   1. Sin ticket: obtiene el token y envía el ZIP -> guarda numTicket.
+#   2. Con ticket: consulta el ticket.
+#      '0'  -> aceptada: CDR, QR, transferencia y movimiento de stock (una transacción)
+#      '99' -> rechazada
+#      otro (98 = en proceso) o falla de red -> reintento con backoff exponencial
+# Al superar GRE_POLL_MAX_ATTEMPTS la guía queda en 'error'.
+#
+# Una guía rechazada o con error libera su número: se puede volver a enviar con
+# la misma serie-número (la fila anterior se reemplaza).
+#
+# Si SUNAT la aceptó pero la transferencia/movimiento de stock falla en la BD,
+# queda en 'aceptado_sin_stock': el número sigue ocupado (el documento ya es
+# válido ante SUNAT) y solo se reintenta la parte local, sin límite. Pasados
+# GRE_POLL_MAX_ATTEMPTS intentos se avisa para conciliarla manualmente.
+
+# Estados de la guía (gre.status) que no ocupan su número
+RELEASED_STATUSES = ('rechazado', 'error')
+# Aceptada por SUNAT, falta registrar la transferencia y el movimiento de stock
+ACCEPTED_STOCK_PENDING = 'aceptado_sin_stock'
+# Estados que el poller sigue atendiendo
+ACTIVE_STATUSES = ('pendiente', ACCEPTED_STOCK_PENDING)
+
+_poller = None
+_poller_pid = None
+_poller_lock = threading.Lock()
+_wake = threading.Event()
+
+
+def _backoff(attempts):
+    """
+    Segundos hasta el próximo intento: base * 2^(intentos-1), con tope y ±20% de variación
+    (para que varios workers no consulten a SUNAT al mismo tiempo).
+    """
+    base = current_app.config.get('GRE_POLL_BASE_DELAY_SECONDS', 3)
+    limit = current_app.config.get('GRE_POLL_MAX_DELAY_SECONDS', 60)
+    return min(base * 2 ** max(attempts - 1, 0), limit) * random.uniform(0.8, 1.2)
+
+
+def _response_for_log(result):
+    """
+    Respuesta de SUNAT para guardar (sin el CDR en base64).
+    """
+    return json.dumps({k: v for k, v in (result or {}).items() if k != 'arcCdr'}, ensure_ascii=False, default=str)
+
+
+# --- 1. ENCOLAR ---
+def replace_released_gre(serie, numero):
+    """
+    Si la serie-número ya existe: la elimina si fue rechazada o quedó en error
+    (se puede reenviar) y retorna None; si está vigente o en curso, retorna la guía.
+    """
+    existing = Gre.query.filter_by(serie=serie, numero=numero).first()
+    if existing is None:
+        return None
+    if existing.status in RELEASED_STATUSES:
+        db.session.delete(existing)
+        db.session.flush()
+        return None
+    return existing
+
+
+def queue_submission(gre, user_id, zip_name, zip_base64, hash_zip, digest_value, datos_guia):
+    """
+    Registra el envío de la guía (ya agregada a la sesión). El commit lo hace quien llama.
+    """
+    submission = GreSubmission(
+        gre=gre,
+        user_id=user_id,
+        zip_name=zip_name,
+        zip_base64=zip_base64,
+        hash_zip=hash_zip,
+        digest_value=digest_value,
+        origin_address=datos_guia.get('punto_de_partida_direccion'),
+        origin_warehouse_id=datos_guia.get('origin_warehouse_id'),
+        cost_center_id=datos_guia.get('cost_center_id'),
+        next_attempt_at=datetime.now()
+    )
+    db.session.add(submission)
+    return submission
+
+
+# --- 2. PROCESAR ---
+def _claim(submission_id, now):
+    """
+    Reserva la guía para este worker (compare-and-set sobre locked_until).
+    """
+    lease = timedelta(seconds=current_app.config.get('GRE_POLL_LEASE_SECONDS', 120))
+    table = GreSubmission.__table__
+    claimed = db.session.execute(update(table).where(
+        table.c.id == submission_id,
+        table.c.status.in_(ACTIVE_STATUSES),
+        or_(table.c.locked_until.is_(None), table.c.locked_until < now)
+    ).values(locked_until=now + lease)).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def _retry(submission, error, result=None):
+    """
+    Programa otro intento con backoff, o marca la guía como 'error' si se agotaron.
+    """
+    if submission.status == ACCEPTED_STOCK_PENDING:
+        # SUNAT ya la aceptó: nunca pasa a 'error' (liberaría el número)
+        _retry_stock(submission, error)
+        return
+    submission.attempts += 1
+    submission.locked_until = None
+    if result is not None:
+        submission.sunat_response = _response_for_log(result)
+
+    if submission.attempts >= current_app.config.get('GRE_POLL_MAX_ATTEMPTS', 15):
+        print(f"--- ❌ GRE {submission.gre.serie}-{submission.gre.numero}: sin respuesta final de SUNAT ({error}) ---")
+        _finish(submission, 'error', 'error', error or "SUNAT no terminó de procesar la guía.")
+    else:
+        submission.error = error
+        submission.next_attempt_at = datetime.now() + timedelta(seconds=_backoff(submission.attempts))
+    db.session.commit()
+
+
+def _retry_stock(submission, error, xml_hash=None, result=None):
+    """
+    Deja la guía aceptada en 'aceptado_sin_stock' y programa otro intento de la parte local.
+    """
+    gre = submission.gre
+    submission.status = ACCEPTED_STOCK_PENDING
+    gre.status = ACCEPTED_STOCK_PENDING
+    if xml_hash is not None:
+        gre.xml_hash = xml_hash
+    if result is not None:
+        submission.sunat_response = _response_for_log(result)
+    submission.attempts += 1
+    submission.locked_until = None
+    if submission.attempts >= current_app.config.get('GRE_POLL_MAX_ATTEMPTS', 15):
+        print(f"--- ⚠️ GRE {gre.serie}-{gre.numero} aceptada por SUNAT sin movimiento de stock "
+              f"({submission.attempts} intentos): requiere conciliación manual ({error}) ---")
+        error = f"{error} | Aceptada por SUNAT: conciliar la transferencia y el stock manualmente."
+    submission.error = error
+    submission.next_attempt_at = datetime.now() + timedelta(seconds=_backoff(submission.attempts))
+    db.session.commit()
+
+
+def _finish(submission, status, gre_status, error=None):
+    submission.status = status
+    submission.error = error
+    submission.zip_base64 = None
+    submission.locked_until = None
+    submission.finished_at = datetime.now()
+    submission.gre.status = gre_status
+
+
+def _send(submission, access_token):
+    respuesta_envio = gre_service.enviar_guia_sunat_oauth2(
+        submission.zip_name, submission.zip_base64, access_token, submission.hash_zip
+    )
+    ticket_id = (respuesta_envio or {}).get('numTicket')
+    if not ticket_id:
+        _retry(submission, f"SUNAT no devolvió Ticket: {respuesta_envio}")
+        return
+
+    print(f"--- Ticket {ticket_id} (GRE {submission.gre.serie}-{submission.gre.numero}) ---")
+    submission.ticket = ticket_id
+    submission.attempts = 0
+    submission.error = None
+    submission.locked_until = None
+    submission.next_attempt_at = datetime.now() + timedelta(seconds=_backoff(1))
+    db.session.commit()
+
+
+def _apply_stock_effects(submission, gre):
+    """
+    Transferencia y salida de stock de la guía aceptada (misma lógica que el envío síncrono anterior).
+    Retorna la transferencia creada o None si no se encontró el almacén de origen.
+    """
+    warehouse_origen = Warehouse.query.filter_by(address=submission.origin_address).first()
+    if not warehouse_origen and submission.origin_warehouse_id:
+        warehouse_origen = db.session.get(Warehouse, submission.origin_warehouse_id)
+    if not warehouse_origen:
+        return None
+
+    tipo_gre = gre.gre_type or 'remitente'
+    new_transfer = StockTransfer(
+        user_id=submission.user_id,
+        origin_warehouse_id=warehouse_origen.id,
+        destination_external_address=gre.punto_de_llegada_direccion,
+        status=f"Completada (GRE {tipo_gre.capitalize()})",
+        transfer_date=datetime.now(),
+        gre_series=gre.serie,
+        gre_number=gre.numero,
+        gre_ticket=submission.ticket,
+        cost_center_id=submission.cost_center_id
+    )
+    db.session.add(new_transfer)
+    db.session.flush()
+
+    gre_reference = f"GRE: {gre.serie}-{gre.numero}"
+    products = {p.id: p for p in Product.query.filter(
+        Product.id.in_({d.product_id for d in gre.items if d.product_id})
+    ).all()}
+
+    movements = []
+    for detail in gre.items:
+        product = products.get(detail.product_id)
+        if not product:
+            continue
+        qty = float(detail.cantidad or 0)
+        db.session.add(StockTransferItem(
+            transfer=new_transfer, product_id=product.id, quantity=qty,
+            product_name_snapshot=product.name, product_sku_snapshot=product.sku
+        ))
+        if tipo_gre == 'remitente':
+            # Si el producto no tiene fila de stock en el origen, solo queda el Kardex
+            movements.append(Movement(
+                product.id, warehouse_origen.id, -qty, "Envío GRE Remitente",
+                gre_reference, if_missing=MISSING_RECORD
+            ))
+
+    apply_movements(movements, submission.user_id)
+    return new_transfer
+
+
+def _accept(submission, result):
+    gre = submission.gre
+    nombre_base_archivo = f"{gre.serie}-{gre.numero}"
+    print(f"--- ✅ GRE {nombre_base_archivo} Aceptada. ---")
+
+    dato_para_qr = submission.digest_value
+    if result.get('arcCdr'):
+        cdr_b64 = result['arcCdr']
+        try:
+            gre_service.guardar_xml_en_base(f"R-{nombre_base_archivo}.zip", base64.b64decode(cdr_b64), "CDR")
+        except Exception:
+            pass
+        url_oficial = gre_service.extraer_url_qr_del_cdr(cdr_b64)
+        if url_oficial:
+            dato_para_qr = url_oficial
+
+    _apply_accepted(submission, 'pendiente', dato_para_qr, result)
+
+
+def _apply_accepted(submission, from_status, xml_hash=None, result=None):
+    """
+    Transferencia, movimiento de stock y cierre de una guía que SUNAT ya aceptó.
+    Si la BD falla, la guía queda en 'aceptado_sin_stock' y se reintenta solo esta parte.
+    """
+    # Solo una vez: si otro worker ya la marcó (reserva vencida), no se repiten los movimientos
+    table = GreSubmission.__table__
+    if not db.session.execute(update(table).where(
+            table.c.id == submission.id, table.c.status == from_status
+    ).values(status='aceptado')).rowcount:
+        db.session.rollback()
+        return
+
+    gre = submission.gre
+    try:
+        if xml_hash is not None:
+            gre.xml_hash = xml_hash
+        transfer = _apply_stock_effects(submission, gre)
+        submission.transfer_id = transfer.id if transfer else None
+        if result is not None:
+            submission.sunat_response = _response_for_log(result)
+        _finish(submission, 'aceptado', 'emitido')
+        db.session.commit()
+    except Exception as db_error:
+        db.session.rollback()
+        print(f"Error BD: {db_error}")
+        # SUNAT ya la aceptó: se reintenta solo la parte local
+        submission = db.session.get(GreSubmission, submission.id)
+        _retry_stock(submission, f"Error BD: {db_error}", xml_hash, result)
+
+
+def _reject(submission, result):
+    error = result.get('error') or {}
+    detail = error.get('desError') if isinstance(error, dict) else error
+    print(f"--- ❌ GRE {submission.gre.serie}-{submission.gre.numero} rechazada: {detail} ---")
+    submission.sunat_response = _response_for_log(result)
+    _finish(submission, 'rechazado', 'rechazado', f"SUNAT rechazó: {result.get('codRespuesta')} {detail or ''}".strip())
+    db.session.commit()
+
+
+def process_submission(submission):
+    """
+    Un paso del envío (enviar o consultar el ticket). La guía debe estar reservada.
+    """
+    if submission.status == ACCEPTED_STOCK_PENDING:
+        _apply_accepted(submission, ACCEPTED_STOCK_PENDING)
+        return
+
+    access_token = gre_service.obtener_token_oauth2()
+    if not access_token:
+        _retry(submission, "Error al obtener el token de SUNAT")
+        return
+
+    if not submission.ticket:
+        _send(submission, access_token)
+        return
+
+    result = gre_service.consultar_ticket_sunat(submission.ticket, access_token)
+    if not result:
+        _retry(submission, "Sin respuesta al consultar el ticket")
+        return
+
+    cod_respuesta = result.get('codRespuesta')
+    if cod_respuesta == '0':
+        _accept(submission, result)
+    elif cod_respuesta == '99':
+        _reject(submission, result)
+    else:
+        _retry(submission, None, result)  # '98': SUNAT aún la procesa
+
+
+def process_due_submissions(limit=20):
+    """
+    Atiende las guías pendientes cuyo próximo intento ya venció. Retorna cuántas procesó.
+    """
+    now = datetime.now()
+    due = [sid for (sid,) in db.session.query(GreSubmission.id).filter(
+        GreSubmission.status.in_(ACTIVE_STATUSES),
+        GreSubmission.next_attempt_at <= now,
+        or_(GreSubmission.locked_until.is_(None), GreSubmission.locked_until < now)
+    ).order_by(GreSubmission.next_attempt_at).limit(limit).all()]
+
+    processed = 0
+    for submission_id in due:
+        if not _claim(submission_id, now):
+            continue  # Otro worker la tomó
+        submission = db.session.get(GreSubmission, submission_id)
+        try:
+            process_submission(submission)
+        except Exception as e:
+            db.session.rollback()
+            print(f"--- ERROR PROCESANDO GRE (envío {submission_id}): {e} ---")
+            _retry(db.session.get(GreSubmission, submission_id), str(e))
+        processed += 1
+    return processed
+
+
+# --- 3. POLLER (HILO POR WORKER) ---
+def _poller_loop(app):
+    while True:
+        with app.app_context():
+            try:
+                process_due_submissions()
+            except Exception as e:
+                print(f"--- ERROR EN POLLER GRE: {e} ---")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+        _wake.wait(app.config.get('GRE_POLL_INTERVAL_SECONDS', 2))
+        _wake.clear()
+
+
+def ensure_poller():
+    """
+    Arranca el hilo del poller en este proceso si no está corriendo (GRE_POLLER_IN_WEB).
+    """
+    global _poller, _poller_pid
+    if not current_app.config.get('GRE_POLLER_IN_WEB', 1):
+        return
+    with _poller_lock:
+        # Tras un fork (gunicorn) el hilo del padre no existe en el hijo
+        if _poller is not None and _poller_pid == os.getpid() and _poller.is_alive():
+            return
+        app = current_app._get_current_object()
+        _poller = threading.Thread(target=_poller_loop, args=(app,), name='gre-poller', daemon=True)
+        _poller_pid = os.getpid()
+        _poller.start()
+
+
+def wake_poller():
+    """
+    Atiende de inmediato una guía recién encolada (sin esperar el intervalo).
+    """
+    ensure_poller()
+    _wake.set()
+
+
+def get_submission(gre_id):
+    submission = GreSubmission.query.filter_by(gre_id=gre_id).first()
+    if submission is not None and submission.status in ACTIVE_STATUSES:
+        ensure_poller()  # Por si el worker que la encoló se reinició
+    return submission
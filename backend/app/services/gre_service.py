@@ -3,16 +3,23 @@ import io
 import base64
 import qrcode
 import traceback
+import threading
 from lxml import etree
-from flask import current_app, render_template
-from weasyprint import HTML
-import requests
+from flask import current_app
 from signxml import XMLSigner, methods
 import zipfile
 import hashlib
 from datetime import datetime
 import urllib.parse  # <--- IMPORTANTE: Para codificar el hash en la URL
 
+from .render_job_service import PdfDocument, render_pdf
+from .pdf_renderer import asset_url, load_asset
+from . import sunat_token_service, http_clients
+
+# Llave y certificado del PFX ya cargados (ver _cargar_firma)
+_firma = None  # ((ruta, mtime, clave), private_key, certificado PEM, XMLSigner)
+_firma_lock = threading.Lock()
+
 # --- Namespaces para XML ---
 NSMAP = {
     None: "urn:oasis:names:specification:ubl:schema:xsd:DespatchAdvice-2",
@@ -110,35 +117,27 @@ def guardar_xml_en_base(nombre_archivo, xml_contenido_bytes, subcarpeta="XML FIR
 # B. LÓGICA DE NEGOCIO (TOKEN, XML, ENVÍO)
 # ==============================================================================
 
-def obtener_token_oauth2():
-    try:
-        client_id = current_app.config['SUNAT_CLIENT_ID']
-        client_secret = current_app.config['SUNAT_CLIENT_SECRET']
-        ruc = current_app.config['TU_RUC']
-        sol_user = current_app.config['SUNAT_SOL_USER']
-        sol_pass = current_app.config['SUNAT_SOL_PASS']
-
-        username_completo = f"{ruc}{sol_user}"
-        token_url = f'https://api-seguridad.sunat.gob.pe/v1/clientessol/{client_id}/oauth2/token/'
-
-        data = {
-            'grant_type': 'password',
-            'scope': 'https://api.sunat.gob.pe/v1/contribuyente/contribuyentes',
-            'client_id': client_id,
-            'client_secret': client_secret,
-            'username': username_completo,
-            'password': sol_pass
-        }
-        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+def obtener_token_oauth2(rejected_token=None):
+    """
+    Token OAuth2 de SUNAT, en caché hasta su expires_in (ver sunat_token_service).
+    rejected_token: el que SUNAT acaba de rechazar con 401, para forzar la renovación.
+    """
+    return sunat_token_service.get_access_token(rejected_token)
 
-        response = requests.post(token_url, data=data, headers=headers)
-        if response.status_code == 200:
-            return response.json().get('access_token')
-        print(f"Error Token SUNAT: {response.text}")
-        return None
-    except Exception as e:
-        print(f"Excepción Token: {e}")
-        return None
+
+def _llamar_api_sunat(method, url, access_token, **kwargs):
+    """
+    Llamada a la API de GRE con el token; si SUNAT lo rechaza (401) se renueva y se repite una vez.
+    """
+    headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
+    response = http_clients.request('sunat_gre', method, url, headers=headers, **kwargs)
+    if response.status_code == 401:
+        print("--- SUNAT rechazó el token (401), se renueva ---")
+        nuevo_token = obtener_token_oauth2(rejected_token=access_token)
+        if nuevo_token:
+            headers['Authorization'] = f'Bearer {nuevo_token}'
+            response = http_clients.request('sunat_gre', method, url, headers=headers, **kwargs)
+    return response
 
 
 def crear_xml_guia_remision(datos_guia):
@@ -319,42 +318,46 @@ def crear_xml_guia_remision(datos_guia):
     return xml_bytes
 
 
-def firmar_xml(xml_string_sin_firmar, nombre_base_archivo):
-    try:
-        certificado_path = current_app.config['CERTIFICADO_PFX_PATH']
-        certificado_pass = current_app.config['CERTIFICADO_PASS']
+def _cargar_firma():
+    """
+    Llave privada, certificado y XMLSigner del PFX, en caché del proceso.
+    Descifrar el PKCS#12 es lento a propósito: se hace una vez y se repite solo si
+    cambia la ruta, la fecha de modificación del archivo (certificado renovado) o la clave.
+    """
+    global _firma
+    certificado_path = current_app.config['CERTIFICADO_PFX_PATH']
+    certificado_pass = current_app.config['CERTIFICADO_PASS']
+    llave = (certificado_path, os.path.getmtime(certificado_path), certificado_pass)
+    if _firma is not None and _firma[0] == llave:
+        return _firma[1:]
+
+    from cryptography.hazmat.primitives.serialization import pkcs12, Encoding
+
+    with open(certificado_path, "rb") as f:
+        pfx_data = f.read()
+    password_bytes = certificado_pass.encode('utf-8') if certificado_pass else None
+    private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(pfx_data, password_bytes)
+    certificate_bytes = certificate.public_bytes(Encoding.PEM)
+
+    signer = XMLSigner(
+        method=methods.enveloped,
+        digest_algorithm='sha256',
+        signature_algorithm='rsa-sha256',
+        c14n_algorithm='http://www.w3.org/2001/10/xml-exc-c14n#'
+    )
+    _firma = (llave, private_key, certificate_bytes, signer)
+    return _firma[1:]
 
-        with open(certificado_path, "rb") as f:
-            pfx_data = f.read()
 
+def firmar_xml(xml_string_sin_firmar, nombre_base_archivo):
+    try:
         # 1. Parseamos el XML original
         root = etree.fromstring(xml_string_sin_firmar)
 
-        # Preparamos las librerías de criptografía
-        from cryptography.hazmat.primitives.serialization import pkcs12, Encoding, NoEncryption, PrivateFormat
-        from cryptography.hazmat.backends import default_backend
-
-        password_bytes = certificado_pass.encode('utf-8') if certificado_pass else None
-        private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(
-            pfx_data, password_bytes, backend=default_backend()
-        )
-
-        private_key_bytes = private_key.private_bytes(Encoding.PEM, PrivateFormat.TraditionalOpenSSL, NoEncryption())
-        certificate_bytes = certificate.public_bytes(Encoding.PEM)
-
-        signer = XMLSigner(
-            method=methods.enveloped,
-            digest_algorithm='sha256',
-            signature_algorithm='rsa-sha256',
-            c14n_algorithm='http://www.w3.org/2001/10/xml-exc-c14n#'
-        )
-
-        # 2. Firmamos
-        signed_root = signer.sign(
-            root,
-            key=private_key_bytes,
-            cert=certificate_bytes
-        )
+        # 2. Firmamos (llave y certificado ya cargados; el signer no se comparte entre hilos a la vez)
+        with _firma_lock:
+            private_key, certificate_bytes, signer = _cargar_firma()
+            signed_root = signer.sign(root, key=private_key, cert=certificate_bytes)
 
         # 3. Mover la firma a su lugar correcto DENTRO del árbol firmado
         xpath_nsmap = {k: v for k, v in NSMAP.items() if k is not None}
@@ -398,13 +401,12 @@ def comprimir_y_codificar_base64(xml_firmado_bytes, nombre_archivo_zip):
 
 def enviar_guia_sunat_oauth2(nombre_zip, zip_base64, access_token, hash_zip):
     try:
-        base_envio_url = 'https://api-cpe.sunat.gob.pe/v1/contribuyente/gem/comprobantes/'
+        base_envio_url = current_app.config['SUNAT_API_URL']
         parametros_url = nombre_zip.replace('.zip', '')
         envio_url = f"{base_envio_url}{parametros_url}"
-        headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
         payload = {'archivo': {'nomArchivo': nombre_zip, 'arcGreZip': zip_base64, 'hashZip': hash_zip}}
 
-        response = requests.post(envio_url, json=payload, headers=headers)
+        response = _llamar_api_sunat('POST', envio_url, access_token, json=payload)
         if response.status_code == 200: return response.json()
         print(f"Error Envío SUNAT: {response.status_code} - {response.text}")
         return None
@@ -414,9 +416,8 @@ def enviar_guia_sunat_oauth2(nombre_zip, zip_base64, access_token, hash_zip):
 
 def consultar_ticket_sunat(ticket_id, access_token):
     try:
-        base_url = "https://api-cpe.sunat.gob.pe/v1/contribuyente/gem/comprobantes/envios/"
-        response = requests.get(f"{base_url}{ticket_id}",
-                                headers={'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'})
+        base_url = f"{current_app.config['SUNAT_API_URL']}envios/"
+        response = _llamar_api_sunat('GET', f"{base_url}{ticket_id}", access_token)
         if response.status_code == 200: return response.json()
         return None
     except:
@@ -427,9 +428,9 @@ def consultar_ticket_sunat(ticket_id, access_token):
 # C. GENERACIÓN DE PDF Y QR (LÓGICA CORREGIDA)
 # ==============================================================================
 
-def generar_qr_base64(data: dict, qr_data: str | None):
+def generar_qr_png(data: dict, qr_data: str | None):
     """
-    Genera el QR.
+    Genera el QR (bytes PNG).
     - Prioridad 1: Si qr_data es una URL (http...), usa eso (viene del CDR).
     - Prioridad 2: Si qr_data es un Hash, construye la URL manualmente.
     - Fallback: Si no hay nada, usa datos concatenados con pipes (|).
@@ -476,69 +477,73 @@ def generar_qr_base64(data: dict, qr_data: str | None):
 
     buffer = io.BytesIO()
     img.save(buffer, format="PNG")
-    img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    return img_base64
+    return buffer.getvalue()
 
 
-def generar_pdf_guia(datos_guia, hash_xml_firmado):
+def documento_pdf_guia(datos_guia, hash_xml_firmado):
     """
-    Genera el PDF en memoria.
+    Arma el documento (plantilla + contexto) del PDF de la guía.
     Recibe 'hash_xml_firmado' que puede ser el HASH (DigestValue) o una URL.
     """
-    try:
-        # 2. LOGO EN BASE64
-        ruta_backend = os.path.dirname(current_app.root_path)
-        ruta_logo = os.path.join(ruta_backend, 'instance', 'logo_v2.png')
-        logo_data = ""
-        if os.path.exists(ruta_logo):
-            with open(ruta_logo, "rb") as f:
-                logo_data = f"data:image/png;base64,{base64.b64encode(f.read()).decode('utf-8')}"
-
-        # 3. CONTEXTO PARA JINJA2
-        context_data = {
-            'logo_path': logo_data,
-            'serie_numero': f"{datos_guia['serie']}-{str(datos_guia['numero']).zfill(7) if isinstance(datos_guia['numero'], int) else datos_guia['numero']}",
-            'fecha_traslado': datos_guia['fecha_de_inicio_de_traslado'].strftime('%d/%m/%Y'),
-
-            'partida': {'direccion': datos_guia['punto_de_partida_direccion']},
-            'llegada': {'direccion': datos_guia['punto_de_llegada_direccion']},
-
-            'destinatario': {
-                'razon_social': datos_guia['cliente_denominacion'],
-                'ruc': datos_guia['cliente_numero_de_documento'],
-                'tipo_doc': datos_guia['cliente_tipo_de_documento']
-            },
-            'remitente': {'ruc': current_app.config['TU_RUC']},
-
-            # --- AGREGA ESTA LÍNEA AQUÍ ---
-            'transportista': datos_guia.get('transportista'),
-            # -------------------------------
-
-            'conductor': {
-                'placa': datos_guia.get('transportista_placa_numero', ''),
-                'marca': datos_guia.get('marca', ''),
-                'licencia': datos_guia.get('licencia', ''),
-                'nombre': f"{datos_guia.get('conductor_nombre', '')} {datos_guia.get('conductor_apellidos', '')}"
-            },
-
-            'motivo_traslado': datos_guia['motivo_de_traslado'],
-            'motivo': datos_guia.get('motivo', ''),
-            'items': datos_guia['items'],
-            'observaciones': datos_guia.get('observaciones', '-'),
-            'fecha_emision': datos_guia['fecha_de_emision'].strftime('%Y-%m-%d')
-        }
-
-        # 4. GENERAR QR USANDO LA NUEVA FUNCIÓN
-        qr_base64 = generar_qr_base64(context_data, hash_xml_firmado)
-        context_data['qr_base64'] = qr_base64
-        context_data['hash_qr'] = hash_xml_firmado
-
-        # 5. RENDERIZAR
-        html_string = render_template('guia_remision.html', data=context_data)
+    # 2. LOGO (se sirve desde memoria al renderizar, ver pdf_renderer)
+    ruta_backend = os.path.dirname(current_app.root_path)
+    ruta_logo = os.path.join(ruta_backend, 'instance', 'logo_v2.png')
+    assets = {}
+    logo = load_asset(ruta_logo)
+    if logo is not None:
+        assets['logo.png'] = logo
+
+    # 3. CONTEXTO PARA JINJA2
+    context_data = {
+        'logo_path': asset_url('logo.png') if logo is not None else "",
+        'serie_numero': f"{datos_guia['serie']}-{str(datos_guia['numero']).zfill(7) if isinstance(datos_guia['numero'], int) else datos_guia['numero']}",
+        'fecha_traslado': datos_guia['fecha_de_inicio_de_traslado'].strftime('%d/%m/%Y'),
+
+        'partida': {'direccion': datos_guia['punto_de_partida_direccion']},
+        'llegada': {'direccion': datos_guia['punto_de_llegada_direccion']},
+
+        'destinatario': {
+            'razon_social': datos_guia['cliente_denominacion'],
+            'ruc': datos_guia['cliente_numero_de_documento'],
+            'tipo_doc': datos_guia['cliente_tipo_de_documento']
+        },
+        'remitente': {'ruc': current_app.config['TU_RUC']},
+
+        # --- AGREGA ESTA LÍNEA AQUÍ ---
+        'transportista': datos_guia.get('transportista'),
+        # -------------------------------
+
+        'conductor': {
+            'placa': datos_guia.get('transportista_placa_numero', ''),
+            'marca': datos_guia.get('marca', ''),
+            'licencia': datos_guia.get('licencia', ''),
+            'nombre': f"{datos_guia.get('conductor_nombre', '')} {datos_guia.get('conductor_apellidos', '')}"
+        },
+
+        'motivo_traslado': datos_guia['motivo_de_traslado'],
+        'motivo': datos_guia.get('motivo', ''),
+        'items': datos_guia['items'],
+        'observaciones': datos_guia.get('observaciones', '-'),
+        'fecha_emision': datos_guia['fecha_de_emision'].strftime('%Y-%m-%d')
+    }
+
+    # 4. GENERAR QR USANDO LA NUEVA FUNCIÓN
+    assets['qr.png'] = generar_qr_png(context_data, hash_xml_firmado)
+    context_data['qr_url'] = asset_url('qr.png')
+    context_data['hash_qr'] = hash_xml_firmado
+
+    return PdfDocument(
+        'guia_remision.html', {'data': context_data}, f"GRE-{datos_guia['serie']}-{datos_guia['numero']}.pdf",
+        base_url=current_app.root_path, assets=assets
+    )
 
-        # 6. RETORNAR BYTES
-        return HTML(string=html_string, base_url=current_app.root_path).write_pdf()
 
+def generar_pdf_guia(datos_guia, hash_xml_firmado):
+    """
+    Genera el PDF en memoria. Retorna None si falla.
+    """
+    try:
+        return render_pdf(documento_pdf_guia(datos_guia, hash_xml_firmado))
     except Exception as e:
         print(f"Error generando PDF: {e}")
         traceback.print_exc()
@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+from collections import deque
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# ==============================================================================
+# CLIENTES HTTP HACIA SERVICIOS EXTERNOS (UNA SESIÓN POR SERVICIO Y PROCESO)
+# ==============================================================================
+# Antes cada llamada usaba requests.get/post sueltos (conexión TLS nueva cada
+# vez y, en varios casos, sin timeout). Ahora todas pasan por aquí:
+#
+# - Una requests.Session por servicio externo (UPSTREAMS) y por proceso, con
+#   pool de conexiones keep-alive. Se crea al primer uso en cada worker (nunca
+#   se hereda del proceso padre de gunicorn).
+# - Timeout de conexión (HTTP_CONNECT_TIMEOUT_SECONDS) y de lectura por servicio,
+#   siempre explícitos.
+# - Reintentos acotados (HTTP_MAX_RETRIES) con backoff exponencial y jitter ante
+#   errores de conexión y respuestas 5xx. Los POST que no se pueden repetir sin
+#   efectos (envío de la GRE) solo se reintentan si la conexión falló antes de
+#   enviar nada. Si los reintentos se agotan con un 5xx, se retorna esa respuesta:
+#   quien llama revisa status_code como siempre.
+# - Contadores de latencia por servicio (por worker): GET /api/admin/http-client-stats.
+#
+# Uso: http_clients.get('decolecta', url, headers=...) / http_clients.post(...)
+
+# Servicio -> timeout de lectura (s) y si su POST se puede repetir sin efectos
+UPSTREAMS = {
+    'sunat_seguridad': {'read_timeout': 15, 'retry_post': True},  # Token OAuth2 de SUNAT
+    'sunat_gre': {'read_timeout': 30, 'retry_post': False},  # Envío de GRE y consulta de ticket
+    'decolecta': {'read_timeout': 5, 'retry_post': False},  # Consulta RUC / DNI
+    'auth0': {'read_timeout': 5, 'retry_post': False},  # JWKS
+}
+RETRY_STATUSES = (500, 502, 503, 504)
+# Muestras de latencia que se guardan por servicio (para el p95)
+LATENCY_SAMPLES = 500
+
+_sessions = {}
+_sessions_pid = None
+_sessions_lock = threading.Lock()
+
+
+class UpstreamStats:
+    """
+    Contadores de un servicio externo en este proceso. Latencia = llamada completa (con reintentos).
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0  # Excepciones (timeout, conexión) o respuesta 5xx final
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._samples = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms, error, retries):
+        with self._lock:
+            self.requests += 1
+            self.errors += 1 if error else 0
+            self.retries += retries
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self._samples.append(elapsed_ms)
+
+    def to_dict(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retries,
+                'avg_ms': round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1) if samples else 0.0,
+                'max_ms': round(self.max_ms, 1)
+            }
+
+
+_stats = {name: UpstreamStats() for name in UPSTREAMS}
+
+
+def _build_session(upstream):
+    config = current_app.config
+    retries = config.get('HTTP_MAX_RETRIES', 2)
+    methods = {'GET', 'HEAD', 'OPTIONS'} | ({'POST'} if UPSTREAMS[upstream]['retry_post'] else set())
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        other=0,
+        allowed_methods=frozenset(methods),
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=config.get('HTTP_BACKOFF_SECONDS', 0.5),
+        backoff_jitter=config.get('HTTP_BACKOFF_SECONDS', 0.5),
+        backoff_max=10,
+        raise_on_status=False
+    )
+    pool_size = config.get('HTTP_POOL_SIZE', 10)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(upstream):
+    """
+    Sesión con pool y reintentos del servicio 'upstream' (una por proceso).
+    """
+    global _sessions, _sessions_pid
+    if upstream not in UPSTREAMS:
+        raise ValueError(f"Servicio externo desconocido: {upstream}")
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            # Tras un fork las conexiones del padre no se comparten
+            _sessions = {}
+            _sessions_pid = os.getpid()
+        session = _sessions.get(upstream)
+        if session is None:
+            session = _sessions[upstream] = _build_session(upstream)
+        return session
+
+
+def request(upstream, method, url, **kwargs):
+    """
+    Como requests.request, por la sesión del servicio y con su timeout si no se indica otro.
+    """
+    session = get_session(upstream)
+    kwargs.setdefault('timeout', (current_app.config.get('HTTP_CONNECT_TIMEOUT_SECONDS', 3.05),
+                                  UPSTREAMS[upstream]['read_timeout']))
+    start = time.perf_counter()
+    response = None
+    try:
+        response = session.request(method, url, **kwargs)
+        return response
+    finally:
+        retry_state = getattr(response.raw, 'retries', None) if response is not None else None
+        _stats[upstream].record(
+            (time.perf_counter() - start) * 1000,
+            error=response is None or response.status_code >= 500,
+            retries=len(retry_state.history) if retry_state is not None else 0
+        )
+
+
+def get(upstream, url, **kwargs):
+    return request(upstream, 'GET', url, **kwargs)
+
+
+def post(upstream, url, **kwargs):
+    return request(upstream, 'POST', url, **kwargs)
+
+
+def stats():
+    return {name: upstream_stats.to_dict() for name, upstream_stats in _stats.items()}
@@ -0,0 +1,224 @@
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import request, jsonify, current_app, g, has_request_context
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..extensions import db
+from ..models.idempotency import IdempotencyKey
+
+
+# ==============================================================================
+# IDEMPOTENCIA (HEADER Idempotency-Key)
+# ==============================================================================
+# El frontend puede reintentar un POST que mueve stock sin duplicarlo: si envía
+# el mismo Idempotency-Key, la segunda vez se devuelve la respuesta guardada
+# (con el header Idempotent-Replayed: true) sin ejecutar el endpoint.
+#
+# 1. Antes de ejecutar se "reserva" la llave (fila 'processing', commit propio).
+#    Una llave repetida con otra solicitud (otra huella) -> 422.
+#    Una llave cuya solicitud sigue en curso -> 409 con Retry-After.
+# 2. Cuando el endpoint confirma su transacción, la misma transacción marca la
+#    llave como 'committed' (evento before_commit). Así, si el worker muere
+#    después del commit, un reintento nunca vuelve a aplicar el movimiento.
+# 3. Al terminar se guarda la respuesta ('completed'). Si el endpoint falló sin
+#    confirmar nada (excepción o 5xx), la llave se libera para poder reintentar.
+#
+# Una reserva 'processing' más antigua que IDEMPOTENCY_LOCK_SECONDS se considera
+# abandonada (el worker murió antes de confirmar) y se puede volver a tomar.
+# Una 'committed' igual de antigua quedó sin respuesta guardada (el worker murió
+# después del commit): el movimiento ya se aplicó, así que se completa con una
+# respuesta 200 genérica ("ya aplicada") y se devuelve como las demás.
+# Las llaves vencen a las IDEMPOTENCY_KEY_TTL_HOURS ('flask inventory purge-idempotency-keys').
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def _fingerprint():
+    """
+    SHA-256 de método + ruta (con query string) + cuerpo crudo de la solicitud.
+    """
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(b'\n')
+    digest.update(request.full_path.encode())
+    digest.update(b'\n')
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _replay(record):
+    response = current_app.response_class(
+        record.response_body or '', status=record.response_status, mimetype=record.response_mimetype
+    )
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _complete_lost_response(record_id):
+    """
+    Completa una llave 'committed' cuya respuesta original se perdió (solo si sigue en ese estado).
+    """
+    response = jsonify(
+        message="La solicitud ya se aplicó. Su respuesta original no está disponible; "
+                "consulte el Kardex para ver el detalle.",
+        already_applied=True
+    )
+    table = IdempotencyKey.__table__
+    db.session.execute(update(table).where(table.c.id == record_id, table.c.state == 'committed').values(
+        state='completed',
+        response_status=200,
+        response_body=response.get_data(as_text=True),
+        response_mimetype=response.mimetype
+    ))
+    db.session.commit()
+
+
+def _in_progress():
+    response = jsonify(error="Hay una solicitud con la misma Idempotency-Key en proceso. Reintente en unos segundos.")
+    response.status_code = 409
+    response.headers['Retry-After'] = '2'
+    return response
+
+
+def _claim(user_id, key, fingerprint):
+    """
+    Reserva la llave para esta solicitud.
+    Retorna (id de la reserva, None) o (None, respuesta a devolver sin ejecutar el endpoint).
+    """
+    ttl = timedelta(hours=current_app.config.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    lock = timedelta(seconds=current_app.config.get('IDEMPOTENCY_LOCK_SECONDS', 120))
+
+    for _ in range(3):
+        now = datetime.now()
+        record = IdempotencyKey(
+            user_id=user_id, key=key, endpoint=request.endpoint, fingerprint=fingerprint,
+            state='processing', created_at=now, expires_at=now + ttl
+        )
+        db.session.add(record)
+        try:
+            db.session.commit()
+            return record.id, None
+        except IntegrityError:
+            db.session.rollback()
+
+        existing = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+        if existing is None:
+            continue  # Se purgó entre medio: reintentar la reserva
+
+        if existing.expires_at <= now:
+            IdempotencyKey.query.filter_by(id=existing.id).delete(synchronize_session=False)
+            db.session.commit()
+            continue
+
+        if existing.fingerprint != fingerprint or existing.endpoint != request.endpoint:
+            return None, (jsonify(error="La Idempotency-Key ya se usó con una solicitud distinta."), 422)
+
+        if existing.state == 'completed':
+            return None, _replay(existing)
+
+        if existing.state == 'processing' and existing.created_at <= now - lock:
+            # Reserva abandonada: se toma solo si nadie más la tomó (compare-and-set por created_at)
+            taken = IdempotencyKey.query.filter_by(
+                id=existing.id, state='processing', created_at=existing.created_at
+            ).update({'created_at': now}, synchronize_session=False)
+            db.session.commit()
+            if taken:
+                return existing.id, None
+
+        if existing.state == 'committed' and existing.created_at <= now - lock:
+            # Los cambios del endpoint se confirmaron, pero el worker murió antes de guardar la respuesta
+            _complete_lost_response(existing.id)
+            continue  # La siguiente vuelta la devuelve como 'completed'
+
+        return None, _in_progress()
+
+    return None, _in_progress()
+
+
+@event.listens_for(Session, 'before_commit')
+def _mark_committed(session):
+    """
+    En la transacción del endpoint: marca la llave como 'committed' junto con sus cambios.
+    """
+    if not has_request_context():
+        return
+    record_id = g.get('idempotency_record_id')
+    if record_id is None:
+        return
+    g.idempotency_record_id = None
+    g.idempotency_committed = True
+    table = IdempotencyKey.__table__
+    session.execute(update(table).where(table.c.id == record_id).values(state='committed'))
+
+
+def _finish(record_id, response):
+    table = IdempotencyKey.__table__
+    db.session.execute(update(table).where(table.c.id == record_id).values(
+        state='completed',
+        response_status=response.status_code,
+        response_body=response.get_data(as_text=True),
+        response_mimetype=response.mimetype
+    ))
+    db.session.commit()
+
+
+def _release(record_id):
+    IdempotencyKey.query.filter_by(id=record_id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def idempotent(f):
+    """
+    Decorador para POST que mueven stock. Va debajo de @requires_auth (usa payload['sub']).
+    Sin header Idempotency-Key el endpoint se ejecuta igual que siempre.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = (request.headers.get(IDEMPOTENCY_HEADER) or '').strip()
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify(error=f"Idempotency-Key inválida (máximo {MAX_KEY_LENGTH} caracteres)."), 400
+
+        user_id = (kwargs.get('payload') or {}).get('sub') or ''
+        record_id, early_response = _claim(user_id, key, _fingerprint())
+        if early_response is not None:
+            return early_response
+
+        g.idempotency_record_id = record_id
+        g.idempotency_committed = False
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            g.idempotency_record_id = None
+            db.session.rollback()
+            if not g.idempotency_committed:
+                _release(record_id)
+            raise
+        g.idempotency_record_id = None
+
+        # Si el endpoint confirmó cambios, su respuesta se guarda aunque sea un error
+        if response.status_code < 500 or g.idempotency_committed:
+            _finish(record_id, response)
+        else:
+            db.session.rollback()
+            _release(record_id)
+        return response
+    return decorated
+
+
+def purge_expired_keys():
+    """
+    Elimina las llaves vencidas. Retorna cuántas se borraron.
+    """
+    deleted = IdempotencyKey.query.filter(
+        IdempotencyKey.expires_at <= datetime.now()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
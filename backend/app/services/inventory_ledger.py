@@ -0,0 +1,170 @@
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from ..extensions import db
+from ..models.inventory_models import InventoryTransaction
+from ..models.product_catalog import Product
+from .stock_service import (
+    lock_stock_rows, read_stock_quantities, add_to_stock_rows, create_stock_rows,
+    StockConflictError, InsufficientStockError
+)
+from .stock_total_service import apply_stock_deltas, sum_deltas
+from .daily_movement_service import record_daily_movements
+
+
+# ==============================================================================
+# LIBRO DE MOVIMIENTOS DE INVENTARIO (EN BLOQUE)
+# ==============================================================================
+# Único punto de entrada para "mover stock + registrar Kardex". Recepciones,
+# ingresos manuales, ajustes, transferencias y GRE arman su lista de movimientos
+# y la aplican aquí en una sola pasada:
+#
+#   1. Lectura de las filas de stock involucradas (una consulta, FOR UPDATE en PostgreSQL)
+#   2. Validación (stock suficiente / versión leída) antes de escribir
+#   3. UPDATE en bloque de las filas existentes + UPSERT de las nuevas
+#   4. Lectura de los saldos finales (una consulta) y Kardex en un solo INSERT,
+#      más el resumen diario (inventory_daily_movements) con un UPSERT
+#   5. product_stock_totals con un UPDATE en bloque
+#
+# Los movimientos del mismo producto/almacén se suman en un solo cambio; el
+# saldo de cada línea del Kardex se obtiene restando al saldo final los
+# movimientos posteriores, igual que si se hubieran aplicado uno por uno.
+
+# Qué hacer si el producto no tiene fila de stock en el almacén
+MISSING_CREATE = 'create'  # Crear la fila (entradas)
+MISSING_RECORD = 'record'  # No tocar el stock, pero registrar el Kardex (saldo = movimiento)
+MISSING_SKIP = 'skip'      # Ignorar el movimiento
+
+# Un cambio de stock. type/reference van al Kardex.
+#   - require_available: la salida falla (InsufficientStockError) si no hay stock suficiente.
+#   - if_missing: MISSING_CREATE / MISSING_RECORD / MISSING_SKIP.
+Movement = namedtuple(
+    'Movement',
+    ['product_id', 'warehouse_id', 'delta', 'type', 'reference', 'require_available', 'if_missing'],
+    defaults=(None, False, MISSING_CREATE)
+)
+
+# Prioridad cuando varios movimientos de la misma fila piden cosas distintas
+_MISSING_PRIORITY = {MISSING_CREATE: 0, MISSING_RECORD: 1, MISSING_SKIP: 2}
+
+
+def _insufficient(product_id, warehouse_id):
+    product = db.session.get(Product, product_id)
+    name = product.name if product else f"ID {product_id}"
+    return InsufficientStockError(
+        f"Stock insuficiente para {name} en el almacén de origen.", product_id, warehouse_id
+    )
+
+
+def apply_movements(movements, user_id, expected_versions=None):
+    """
+    Aplica los movimientos [Movement, ...] al stock, Kardex y totales por producto.
+
+    expected_versions: {(product_id, warehouse_id): version leída o None si no existía}.
+    Las filas indicadas solo se escriben si nadie las modificó desde esa lectura;
+    si no, se lanza StockConflictError (ajuste por conteo físico).
+
+    Retorna la lista de saldos resultantes, alineada con movements
+    (None para los movimientos ignorados por MISSING_SKIP).
+    Lanza InsufficientStockError si una salida con require_available no alcanza.
+    """
+    movements = [
+        m._replace(product_id=int(m.product_id), warehouse_id=int(m.warehouse_id), delta=float(m.delta))
+        for m in movements
+    ]
+    if not movements:
+        return []
+    expected_versions = expected_versions or {}
+
+    # 1. Agrupar por fila de stock
+    net = {}
+    guarded = set()
+    missing_policy = {}
+    for m in movements:
+        key = (m.product_id, m.warehouse_id)
+        net[key] = net.get(key, 0.0) + m.delta
+        if m.require_available:
+            guarded.add(key)
+        current = missing_policy.get(key, MISSING_SKIP)
+        if _MISSING_PRIORITY[m.if_missing] < _MISSING_PRIORITY[current]:
+            current = m.if_missing
+        missing_policy[key] = current
+
+    existing = lock_stock_rows(net.keys())
+
+    # 2. Validaciones antes de escribir
+    for key, version in expected_versions.items():
+        if key in net and (existing[key]['version'] if key in existing else None) != version:
+            raise StockConflictError("El stock cambió mientras se procesaba la operación. Intente nuevamente.")
+
+    for key in guarded:
+        if net[key] < 0 and (key not in existing or existing[key]['quantity'] + net[key] < 0):
+            raise _insufficient(*key)
+
+    # 3. Escritura
+    plain, checked, versioned = [], [], []
+    new_rows, new_expected_rows = [], []
+    applied = set()
+    for key, delta in net.items():
+        if key in existing:
+            applied.add(key)
+            if delta == 0 and key not in expected_versions:
+                continue
+            row = {'id': existing[key]['id'], 'delta': delta, 'version': existing[key]['version']}
+            if key in expected_versions:
+                versioned.append(row)
+            elif key in guarded and delta < 0:
+                checked.append(row)
+            else:
+                plain.append(row)
+        elif missing_policy[key] == MISSING_CREATE:
+            applied.add(key)
+            row = {'product_id': key[0], 'warehouse_id': key[1], 'quantity': delta}
+            (new_expected_rows if key in expected_versions else new_rows).append(row)
+
+    add_to_stock_rows(plain)
+    add_to_stock_rows(checked, require_available=True)
+    add_to_stock_rows(versioned, check_version=True)
+    create_stock_rows(new_rows)
+    create_stock_rows(new_expected_rows, merge_existing=False)
+
+    # 4. Saldos por línea (de atrás hacia adelante desde el saldo final) y Kardex
+    running = read_stock_quantities(applied)
+    results = [None] * len(movements)
+    for i in range(len(movements) - 1, -1, -1):
+        m = movements[i]
+        key = (m.product_id, m.warehouse_id)
+        if key in applied:
+            results[i] = running[key]
+            running[key] -= m.delta
+        elif missing_policy[key] == MISSING_RECORD:
+            results[i] = m.delta
+
+    # Mismo instante para todo el lote: el día del Kardex y el del resumen diario coinciden
+    now = datetime.now()
+    kardex_rows = [
+        {
+            'product_id': m.product_id,
+            'warehouse_id': m.warehouse_id,
+            'quantity_change': m.delta,
+            'new_quantity': new_quantity,
+            'type': m.type,
+            'user_id': user_id,
+            'reference': m.reference,
+            'timestamp': now
+        }
+        for m, new_quantity in zip(movements, results)
+        if new_quantity is not None and m.delta != 0
+    ]
+    if kardex_rows:
+        db.session.execute(insert(InventoryTransaction), kardex_rows)
+        record_daily_movements(kardex_rows, now.date())
+
+    # 5. Total por producto (solo lo que realmente movió stock)
+    apply_stock_deltas(sum_deltas(
+        (m.product_id, m.delta) for m in movements if (m.product_id, m.warehouse_id) in applied
+    ))
+
+    return results
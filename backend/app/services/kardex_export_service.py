@@ -0,0 +1,254 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from flask import current_app
+
+from ..extensions import db
+from ..models.inventory_models import InventoryTransaction
+from ..models.product_catalog import Product
+from ..models.warehouse import Warehouse
+
+
+# ==============================================================================
+# EXPORTACIÓN DEL KARDEX (STREAMING)
+# ==============================================================================
+# Las filas se leen de la BD por bloques (yield_per) como tuplas simples, sin
+# crear objetos ORM, y se escriben a la respuesta a medida que llegan.
+# Así la memoria es la misma para 1.000 filas que para 5 millones.
+#
+# El XLSX (un ZIP) también sale en streaming: cada archivo del ZIP lleva su
+# tamaño y CRC al final (data descriptor), así la hoja se comprime y se envía
+# por bloques sin armar el archivo completo antes del primer byte.
+
+EXPORT_HEADERS = ['ID', 'Fecha', 'SKU', 'Producto', 'Almacén', 'Tipo', 'Referencia',
+                  'Cambio', 'Stock Resultante', 'Usuario']
+XLSX_MAX_ROWS = 1048575  # Filas por hoja (sin contar la cabecera)
+EXCEL_EPOCH = datetime(1899, 12, 30)
+# Caracteres de control que XML no admite
+_ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{sheets}</Types>'
+)
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}<Relationship Id="rIdStyles" Target="styles.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+    '</Relationships>'
+)
+# Estilo 1 = fecha y hora (mismo formato que usa openpyxl para datetime)
+XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd h:mm:ss"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_FOOTER = '</sheetData></worksheet>'
+
+
+def kardex_export_query():
+    """
+    Consulta base del export (se le aplican los mismos filtros que al Kardex JSON).
+    """
+    return db.session.query(
+        InventoryTransaction.id,
+        InventoryTransaction.timestamp,
+        Product.sku,
+        Product.name,
+        Warehouse.name,
+        InventoryTransaction.type,
+        InventoryTransaction.reference,
+        InventoryTransaction.quantity_change,
+        InventoryTransaction.new_quantity,
+        InventoryTransaction.user_id
+    ).outerjoin(Product, Product.id == InventoryTransaction.product_id) \
+     .outerjoin(Warehouse, Warehouse.id == InventoryTransaction.warehouse_id)
+
+
+def iter_export_rows(query):
+    """
+    Recorre la consulta por bloques y entrega filas listas para escribir.
+    """
+    chunk_size = current_app.config.get('KARDEX_EXPORT_CHUNK_SIZE', 2000)
+    query = query.order_by(
+        InventoryTransaction.timestamp.desc(), InventoryTransaction.id.desc()
+    ).execution_options(yield_per=chunk_size)
+
+    for (row_id, timestamp, sku, product_name, warehouse_name, tx_type,
+         reference, quantity_change, new_quantity, user_id) in query:
+        yield [
+            row_id,
+            timestamp,
+            sku or 'N/A',
+            product_name or 'N/A',
+            warehouse_name or 'N/A',
+            tx_type,
+            reference or '',
+            float(quantity_change),
+            float(new_quantity),
+            user_id
+        ]
+
+
+def stream_csv(rows):
+    """
+    Genera el CSV en trozos (un trozo cada KARDEX_EXPORT_CHUNK_SIZE filas).
+    """
+    chunk_size = current_app.config.get('KARDEX_EXPORT_CHUNK_SIZE', 2000)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # BOM para que Excel abra bien las tildes
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_HEADERS)
+
+    pending = 0
+    for row in rows:
+        if row[1]:
+            row[1] = row[1].strftime('%Y-%m-%d %H:%M:%S')
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """
+    Destino del ZIP sin seek: zipfile escribe data descriptors y aquí se juntan
+    los bytes hasta que el generador los entrega.
+    """
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, datetime):
+        serial = (value - EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c s="1"><v>{serial!r}</v></c>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value!r}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(number, values):
+    return f'<row r="{number}">' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(rows):
+    """
+    Genera el XLSX en trozos: la hoja se escribe y comprime cada
+    KARDEX_EXPORT_CHUNK_SIZE filas, sin archivo temporal. Los archivos del ZIP
+    que dependen de cuántas hojas hubo (workbook, content types) van al final.
+    """
+    chunk_size = current_app.config.get('KARDEX_EXPORT_CHUNK_SIZE', 2000)
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED)
+    sheet_names = []
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    pending = 0
+
+    def open_sheet():
+        sheet_names.append('Kardex' if not sheet_names else f"Kardex ({len(sheet_names) + 1})")
+        # force_zip64: el tamaño de la hoja no se conoce al escribir su cabecera local
+        handle = archive.open(f"xl/worksheets/sheet{len(sheet_names)}.xml", 'w', force_zip64=True)
+        handle.write((SHEET_HEADER + _xlsx_row(1, EXPORT_HEADERS)).encode('utf-8'))
+        return handle
+
+    for row in rows:
+        # Una hoja de Excel admite ~1M filas: se continúa en otra hoja
+        if sheet_rows >= XLSX_MAX_ROWS:
+            if sheet is not None:
+                sheet.write(SHEET_FOOTER.encode('utf-8'))
+                sheet.close()
+            sheet = open_sheet()
+            sheet_rows = 0
+        sheet_rows += 1
+        sheet.write(_xlsx_row(sheet_rows + 1, row).encode('utf-8'))
+        pending += 1
+        if pending >= chunk_size:
+            pending = 0
+            data = sink.drain()
+            if data:
+                yield data
+
+    if sheet is None:
+        sheet = open_sheet()
+    sheet.write(SHEET_FOOTER.encode('utf-8'))
+    sheet.close()
+
+    sheet_ids = range(1, len(sheet_names) + 1)
+    archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(sheets=''.join(
+        f'<sheet name="{escape(name)}" sheetId="{i}" r:id="rId{i}"/>'
+        for i, name in zip(sheet_ids, sheet_names))))
+    archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS.format(sheets=''.join(
+        f'<Relationship Id="rId{i}" Target="worksheets/sheet{i}.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        for i in sheet_ids)))
+    archive.writestr('xl/styles.xml', XLSX_STYLES)
+    archive.writestr('_rels/.rels', XLSX_ROOT_RELS)
+    archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES.format(sheets=''.join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in sheet_ids)))
+    archive.close()
+    yield sink.drain()
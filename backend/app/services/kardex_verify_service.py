@@ -0,0 +1,163 @@
+import time
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, update, cast, Float, bindparam
+
+from ..extensions import db
+from ..models.inventory_models import InventoryStock, InventoryTransaction
+from ..models.product_catalog import Product
+
+
+# ==============================================================================
+# VERIFICACIÓN DE INTEGRIDAD DEL KARDEX (VECTORIZADA)
+# ==============================================================================
+# new_quantity se escribe en cada flujo que mueve stock; si alguno se equivoca
+# (o registra movimientos sin fila de stock, como la GRE) nadie lo nota.
+#
+# Aquí se recorre el Kardex ordenado por (producto, almacén, timestamp, id) en
+# bloques de NumPy. En cada bloque el saldo acumulado por grupo sale de un solo
+# cumsum: cumsum(bloque) - cumsum(hasta el inicio del grupo). El último grupo
+# del bloque puede continuar en el siguiente: su saldo se arrastra.
+#
+# Se reporta:
+#   - filas cuyo new_quantity no coincide con el saldo acumulado, y
+#   - grupos cuyo saldo final no coincide con inventory_stock.
+# Con fix=True se corrige new_quantity (inventory_stock no se toca: la diferencia
+# con el stock se reporta para revisión manual).
+
+TOLERANCE = 0.005  # Las cantidades se guardan con 2 decimales
+
+
+def _kardex_chunks(chunk_size):
+    """
+    Lee el Kardex en orden y entrega bloques de arrays (ids, productos, almacenes, cambios, saldos guardados).
+    """
+    t = InventoryTransaction
+    stmt = select(
+        t.id, t.product_id, t.warehouse_id, cast(t.quantity_change, Float), cast(t.new_quantity, Float)
+    ).order_by(t.product_id, t.warehouse_id, t.timestamp, t.id)
+
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    for rows in result.partitions():
+        n = len(rows)
+        ids, product_ids, warehouse_ids, changes, stored = zip(*rows)
+        yield (
+            np.fromiter(ids, dtype=np.int64, count=n),
+            np.fromiter(product_ids, dtype=np.int64, count=n),
+            np.fromiter(warehouse_ids, dtype=np.int64, count=n),
+            np.fromiter(changes, dtype=np.float64, count=n),
+            np.fromiter(stored, dtype=np.float64, count=n)
+        )
+
+
+def verify_kardex(fix=False, chunk_size=None, sample_size=20):
+    """
+    Recalcula los saldos del Kardex y los compara con new_quantity e inventory_stock.
+    Retorna un resumen:
+      {'rows', 'groups', 'seconds', 'row_mismatches', 'row_samples', 'stock_mismatches', 'fixed'}
+    """
+    chunk_size = chunk_size or current_app.config.get('KARDEX_VERIFY_CHUNK_SIZE', 200000)
+    start = time.perf_counter()
+
+    total_rows = 0
+    row_mismatches = 0
+    row_samples = []
+    fix_ids, fix_values = [], []
+    finals = {}  # (producto, almacén) -> saldo final según el Kardex
+
+    carry_key, carry_total = None, 0.0
+    for ids, product_ids, warehouse_ids, changes, stored in _kardex_chunks(chunk_size):
+        n = len(ids)
+        total_rows += n
+
+        # 1. Inicio de cada grupo (producto, almacén) dentro del bloque
+        new_group = np.empty(n, dtype=bool)
+        new_group[0] = (int(product_ids[0]), int(warehouse_ids[0])) != carry_key
+        new_group[1:] = (product_ids[1:] != product_ids[:-1]) | (warehouse_ids[1:] != warehouse_ids[:-1])
+        starts = np.flatnonzero(new_group)
+
+        # 2. Saldo acumulado por grupo: cumsum del bloque menos lo acumulado antes del grupo
+        cumulative = np.cumsum(changes)
+        group_start = np.maximum.accumulate(np.where(new_group, np.arange(n), 0))
+        running = cumulative - (cumulative[group_start] - changes[group_start])
+        if not new_group[0]:
+            # Las primeras filas continúan el último grupo del bloque anterior
+            running[:starts[0] if len(starts) else n] += carry_total
+        running = np.round(running, 2)
+
+        # 3. Filas con new_quantity distinto al saldo
+        bad = np.flatnonzero(np.abs(running - stored) > TOLERANCE)
+        row_mismatches += len(bad)
+        for i in bad[:max(sample_size - len(row_samples), 0)]:
+            row_samples.append({
+                'id': int(ids[i]), 'product_id': int(product_ids[i]), 'warehouse_id': int(warehouse_ids[i]),
+                'stored': float(stored[i]), 'expected': float(running[i])
+            })
+        if fix and len(bad):
+            fix_ids.append(ids[bad])
+            fix_values.append(running[bad])
+
+        # 4. Saldos finales: el grupo arrastrado terminó en el bloque anterior, y
+        #    cada inicio de grupo cierra el grupo de la fila previa
+        if new_group[0] and carry_key is not None:
+            finals[carry_key] = carry_total
+        for end in starts[starts > 0] - 1:
+            finals[(int(product_ids[end]), int(warehouse_ids[end]))] = float(running[end])
+
+        carry_key = (int(product_ids[-1]), int(warehouse_ids[-1]))
+        carry_total = float(running[-1])
+
+    if carry_key is not None:
+        finals[carry_key] = carry_total
+
+    # 5. Saldo final vs inventory_stock (incluye filas de stock sin ningún movimiento)
+    stock = {
+        (pid, wid): round(float(qty or 0), 2) for pid, wid, qty in db.session.query(
+            InventoryStock.product_id, InventoryStock.warehouse_id, cast(InventoryStock.quantity, Float)
+        ).all()
+    }
+    stock_mismatches = []
+    for key in sorted(finals.keys() | stock.keys()):
+        kardex_qty = round(finals.get(key, 0.0), 2)
+        stock_qty = stock.get(key)
+        if abs(kardex_qty - (stock_qty or 0.0)) > TOLERANCE:
+            stock_mismatches.append({
+                'product_id': key[0], 'warehouse_id': key[1], 'kardex': kardex_qty, 'stock': stock_qty
+            })
+
+    # 6. SKU para el reporte
+    product_ids = {s['product_id'] for s in row_samples} | {m['product_id'] for m in stock_mismatches}
+    if product_ids:
+        skus = dict(db.session.query(Product.id, Product.sku).filter(Product.id.in_(product_ids)).all())
+        for entry in row_samples + stock_mismatches:
+            entry['sku'] = skus.get(entry['product_id'])
+
+    fixed = 0
+    if fix and fix_ids:
+        fixed = _write_corrections(np.concatenate(fix_ids), np.concatenate(fix_values), chunk_size)
+
+    return {
+        'rows': total_rows,
+        'groups': len(finals),
+        'seconds': time.perf_counter() - start,
+        'row_mismatches': row_mismatches,
+        'row_samples': row_samples,
+        'stock_mismatches': stock_mismatches,
+        'fixed': fixed
+    }
+
+
+def _write_corrections(ids, values, chunk_size):
+    """
+    UPDATE en bloque de new_quantity (una transacción, executemany por bloques).
+    """
+    table = InventoryTransaction.__table__
+    stmt = update(table).where(table.c.id == bindparam('kardex_id')).values(new_quantity=bindparam('expected'))
+    for offset in range(0, len(ids), chunk_size):
+        db.session.execute(stmt, [
+            {'kardex_id': int(i), 'expected': float(v)}
+            for i, v in zip(ids[offset:offset + chunk_size], values[offset:offset + chunk_size])
+        ])
+    db.session.commit()
+    return len(ids)
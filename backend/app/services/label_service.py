@@ -0,0 +1,223 @@
+import copy
+import io
+import os
+import threading
+
+from fpdf import FPDF
+from fpdf.image_parsing import preload_image
+
+
+# ==============================================================================
+# MOTOR DE ETIQUETAS (PDF)
+# ==============================================================================
+# - El logo se lee y decodifica UNA vez por proceso (se invalida si cambia el archivo)
+#   y se reutiliza en todas las etiquetas y en todos los PDFs.
+# - El PDF se arma en memoria (BytesIO): dos solicitudes simultáneas ya no
+#   escriben sobre el mismo instance/etiquetas.pdf.
+# - Para impresoras Zebra se genera ZPL (texto) en lugar de PDF: ver generate_zpl_labels().
+
+LABEL_WIDTH, LABEL_HEIGHT = 60, 30
+MARGIN_X, MARGIN_Y = 10, 10
+GAP_X, GAP_Y = 5, 5
+LOGO_HEIGHT = 8
+
+
+class PDF(FPDF):
+    def header(self): pass
+
+    def footer(self): pass
+
+
+# --- CACHÉ DEL LOGO (POR PROCESO) ---
+_logo_cache = {}
+_logo_lock = threading.Lock()
+
+
+def get_logo(logo_path):
+    """
+    Retorna (aspect_ratio, info) del logo ya decodificado.
+    La clave incluye la fecha de modificación para tomar un logo nuevo sin reiniciar.
+    """
+    mtime = os.path.getmtime(logo_path)
+    cached = _logo_cache.get(logo_path)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    with _logo_lock:
+        cached = _logo_cache.get(logo_path)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+
+        _, _, info = preload_image(FPDF().image_cache, logo_path)
+        aspect_ratio = info['w'] / info['h']
+        _logo_cache[logo_path] = (mtime, aspect_ratio, info)
+        return aspect_ratio, info
+
+
+def _register_logo(pdf, logo_path, info):
+    """
+    Registra el logo ya decodificado en el documento: fpdf2 lo encuentra por nombre
+    y no vuelve a leer ni decodificar el archivo.
+    """
+    doc_info = copy.copy(info)
+    doc_info['i'] = len(pdf.image_cache.images) + 1
+    doc_info['usages'] = 0
+    pdf.image_cache.images[logo_path] = doc_info
+
+
+# --- ETIQUETAS ---
+def validate_label_products(products):
+    """
+    Revisa el payload antes de responder (el ZPL se envía en streaming: un error
+    a mitad de camino dejaría el archivo cortado). Lanza ValueError con el detalle.
+    """
+    if not isinstance(products, list):
+        raise ValueError("'products' debe ser una lista.")
+    for index, product in enumerate(products):
+        if not isinstance(product, dict):
+            raise ValueError(f"Producto #{index + 1}: formato inválido.")
+        try:
+            int(product.get('quantity', 1))
+        except (TypeError, ValueError):
+            raise ValueError(f"Producto #{index + 1} ({product.get('product_sku', 'N/A')}): "
+                             f"cantidad inválida '{product.get('quantity')}'.")
+
+
+def expand_labels(products):
+    """
+    Convierte el payload [{product_sku, product_name, quantity}, ...] en una lista
+    plana de etiquetas [(sku, nombre), ...] (una por unidad).
+    """
+    labels = []
+    for product in products:
+        quantity = int(product.get('quantity', 1))
+        labels.extend([(product.get('product_sku', 'N/A'), product.get('product_name', 'Sin Nombre'))] * quantity)
+    return labels
+
+
+def labels_per_page():
+    """
+    Cantidad de etiquetas que entran en una hoja A4 con la grilla actual.
+    """
+    page_w, page_h = 210, 297
+    columns = int((page_w - 2 * MARGIN_X + GAP_X) // (LABEL_WIDTH + GAP_X))
+    rows = int((page_h - 2 * MARGIN_Y + GAP_Y) // (LABEL_HEIGHT + GAP_Y))
+    return columns * rows
+
+
+def render_labels_pdf(labels, logo_path):
+    """
+    Dibuja las etiquetas en una grilla A4 y retorna el PDF como bytes.
+    """
+    aspect_ratio, logo_info = get_logo(logo_path)
+
+    pdf = PDF('P', 'mm', 'A4')
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=10)
+    pdf.set_font('Helvetica', 'B', 10)
+    _register_logo(pdf, logo_path, logo_info)
+
+    logo_w = LOGO_HEIGHT * aspect_ratio
+    name_lines = {}
+    x, y = MARGIN_X, MARGIN_Y
+
+    for sku, name in labels:
+        pdf.rect(x, y, LABEL_WIDTH, LABEL_HEIGHT)
+
+        x_logo = x + (LABEL_WIDTH - logo_w) / 2
+        pdf.image(logo_path, x_logo, y + 2, w=logo_w, h=LOGO_HEIGHT)
+
+        pdf.set_font('Helvetica', 'B', 12)
+        pdf.set_xy(x + 1, y + 12)
+        pdf.cell(LABEL_WIDTH - 2, 5, f"SKU: {sku}", align='C')
+
+        # El corte de líneas del nombre es lo más costoso: se calcula una vez por nombre
+        pdf.set_font('Helvetica', '', 8)
+        pdf.set_xy(x + 1, y + 18)
+        lines = name_lines.get(name)
+        if lines is None:
+            name_lines[name] = pdf.multi_cell(LABEL_WIDTH - 2, 5, name, align='C', output='LINES')
+        else:
+            for index, line in enumerate(lines):
+                pdf.set_xy(x + 1, y + 18 + 5 * index)
+                pdf.cell(LABEL_WIDTH - 2, 5, line, align='C')
+
+        x += LABEL_WIDTH + GAP_X
+        if x + LABEL_WIDTH > pdf.w - MARGIN_X:
+            x = MARGIN_X
+            y += LABEL_HEIGHT + GAP_Y
+            if y + LABEL_HEIGHT > pdf.h - MARGIN_Y:
+                pdf.add_page()
+                y = MARGIN_Y
+
+    output = io.BytesIO()
+    pdf.output(output)
+    return output.getvalue()
+
+
+def generate_labels_document(products, logo_path):
+    """
+    Punto de entrada del endpoint: un único PDF con todas las etiquetas.
+    """
+    return render_labels_pdf(expand_labels(products), logo_path)
+
+
+# ==============================================================================
+# ETIQUETAS ZPL (IMPRESORAS TÉRMICAS ZEBRA)
+# ==============================================================================
+# Una etiqueta por producto con ^PQ (copias): la impresora repite la etiqueta,
+# así el trabajo pesa unos pocos KB aunque se pidan miles de unidades.
+
+ZPL_DOTS_PER_MM = 8  # 203 dpi
+ZPL_MAX_COPIES = 99999999  # Límite de ^PQ
+
+
+def _zpl_field(text):
+    """
+    Escapa el texto para ^FH (hexadecimal con '_'): evita que '^' o '~' en el
+    nombre se interpreten como comandos.
+    """
+    text = str(text)
+    for char in ('_', '^', '~'):
+        text = text.replace(char, f"_{ord(char):02X}")
+    return text
+
+
+def zpl_label(sku, name, copies=1, barcode=True):
+    """
+    Retorna el bloque ZPL (^XA ... ^XZ) de una etiqueta de 60 x 30 mm.
+    """
+    width = LABEL_WIDTH * ZPL_DOTS_PER_MM
+    height = LABEL_HEIGHT * ZPL_DOTS_PER_MM
+
+    parts = [
+        "^XA",
+        "^CI28",  # UTF-8 (tildes y ñ)
+        f"^PW{width}",
+        f"^LL{height}",
+        f"^FO0,12^A0N,30,30^FB{width},1,0,C^FH^FDSKU: {_zpl_field(sku)}^FS",
+        f"^FO8,48^A0N,20,20^FB{width - 16},2,0,C^FH^FD{_zpl_field(name)}^FS",
+    ]
+    if barcode:
+        parts.append(f"^FO40,100^BY2^BCN,80,Y,N,N^FH^FD{_zpl_field(sku)}^FS")
+    parts.append(f"^PQ{min(copies, ZPL_MAX_COPIES)},0,1,Y")
+    parts.append("^XZ")
+    return "\n".join(parts) + "\n"
+
+
+def generate_zpl_labels(products, barcode=True):
+    """
+    Genera el ZPL producto por producto (para enviarlo en streaming).
+    Usa el mismo payload que el PDF: [{product_sku, product_name, quantity}, ...],
+    ya revisado con validate_label_products().
+    """
+    for product in products:
+        quantity = int(product.get('quantity', 1))
+        if quantity <= 0:
+            continue
+        yield zpl_label(
+            product.get('product_sku', 'N/A'),
+            product.get('product_name', 'Sin Nombre'),
+            copies=quantity,
+            barcode=barcode
+        )
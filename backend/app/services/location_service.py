@@ -0,0 +1,89 @@
+from sqlalchemy import insert
+
+from ..extensions import db
+from ..models.inventory_models import ProductLocation
+
+
+# ==============================================================================
+# UBICACIONES (BINS) POR PRODUCTO Y ALMACÉN
+# ==============================================================================
+# product_locations es el índice consultable de ubicaciones. Product.location
+# (texto con comas) se sigue llenando igual para el frontend; cada flujo que lo
+# modifica también llama a estas funciones en la misma transacción.
+
+BIN_MAX_LENGTH = 50
+
+
+def split_bins(text):
+    """
+    'A1, B2,,A1' -> ['A1', 'B2'] (sin vacíos ni duplicados, respetando el orden).
+    """
+    if not text:
+        return []
+    bins = []
+    for raw in str(text).split(','):
+        code = raw.strip()[:BIN_MAX_LENGTH]
+        if code and code not in bins:
+            bins.append(code)
+    return bins
+
+
+def add_bins(entries):
+    """
+    Registra las ubicaciones [(product_id, warehouse_id, texto), ...] que aún no existan.
+    El texto puede traer varias ubicaciones separadas por comas.
+    """
+    wanted = set()
+    for product_id, warehouse_id, text in entries:
+        for code in split_bins(text):
+            wanted.add((int(product_id), int(warehouse_id) if warehouse_id else None, code))
+    if not wanted:
+        return
+
+    product_ids = {pid for pid, _, _ in wanted}
+    existing = set(db.session.query(
+        ProductLocation.product_id, ProductLocation.warehouse_id, ProductLocation.bin
+    ).filter(ProductLocation.product_id.in_(product_ids)).all())
+
+    missing = wanted - existing
+    if missing:
+        db.session.execute(insert(ProductLocation), [
+            {'product_id': pid, 'warehouse_id': wid, 'bin': code} for pid, wid, code in sorted(
+                missing, key=lambda e: (e[0], e[1] or 0, e[2])
+            )
+        ])
+
+
+def replace_warehouse_bins(warehouse_id, product_bins):
+    """
+    Reemplaza las ubicaciones de cada producto en el almacén: {product_id: texto}.
+    (Ajuste masivo: la ubicación informada en el conteo es la vigente).
+    """
+    if not product_bins:
+        return
+    warehouse_id = int(warehouse_id)
+
+    ProductLocation.query.filter(
+        ProductLocation.warehouse_id == warehouse_id,
+        ProductLocation.product_id.in_([int(pid) for pid in product_bins])
+    ).delete(synchronize_session=False)
+
+    add_bins((pid, warehouse_id, text) for pid, text in product_bins.items())
+
+
+def sync_catalog_bins(product_id, bins):
+    """
+    Edición desde el catálogo (sin almacén): las ubicaciones que ya no están en la
+    lista se eliminan (en cualquier almacén) y las nuevas se registran sin almacén.
+    """
+    bins = split_bins(', '.join(bins))
+
+    stale = ProductLocation.query.filter(ProductLocation.product_id == product_id)
+    if bins:
+        stale = stale.filter(ProductLocation.bin.notin_(bins))
+    stale.delete(synchronize_session=False)
+
+    known = {code for (code,) in db.session.query(ProductLocation.bin).filter(
+        ProductLocation.product_id == product_id
+    ).all()}
+    add_bins((product_id, None, code) for code in bins if code not in known)
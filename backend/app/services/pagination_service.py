@@ -0,0 +1,105 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import or_, and_
+
+
+# ==============================================================================
+# PAGINACIÓN POR CURSOR (KEYSET)
+# ==============================================================================
+# En lugar de OFFSET (que recorre todas las filas saltadas), se pide la página
+# siguiente "después del último registro visto": WHERE (ts, id) < (ts0, id0).
+# Con un índice sobre (ts, id) cada página cuesta lo mismo sin importar su posición.
+#
+# El cursor es opaco para el frontend: base64 de [timestamp ISO, id].
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp.isoformat() if timestamp else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Retorna (timestamp, id). Lanza ValueError si el cursor no es válido.
+    """
+    try:
+        ts, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return (datetime.fromisoformat(ts) if ts else None), int(row_id)
+    except Exception:
+        raise ValueError("Cursor inválido.")
+
+
+def parse_page_args(args, allow_offset=False):
+    """
+    Lee 'limit' y 'cursor' (y 'offset' si allow_offset) de la query string.
+    Retorna (paginated, limit, cursor): paginated es False si no se envió ninguno,
+    para que los endpoints mantengan la respuesta antigua (lista completa).
+    """
+    raw_limit = args.get('limit')
+    cursor = args.get('cursor')
+    if raw_limit is None and not cursor and not (allow_offset and args.get('offset')):
+        return False, None, None
+
+    try:
+        limit = int(raw_limit) if raw_limit is not None else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError("El parámetro 'limit' debe ser un número entero.")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    return True, limit, (decode_cursor(cursor) if cursor else None)
+
+
+def keyset_page(query, ts_column, id_column, limit, cursor=None):
+    """
+    Aplica orden descendente (ts, id) y el filtro del cursor a la consulta.
+    Retorna (filas, next_cursor). next_cursor es None en la última página.
+    """
+    if cursor:
+        ts, row_id = cursor
+        query = query.filter(or_(
+            ts_column < ts,
+            and_(ts_column == ts, id_column < row_id)
+        ))
+
+    rows = query.order_by(ts_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, ts_column.key), getattr(last, id_column.key))
+
+    return rows, next_cursor
+
+
+def parse_offset(args):
+    try:
+        return max(0, int(args.get('offset') or 0))
+    except ValueError:
+        raise ValueError("El parámetro 'offset' debe ser un número entero.")
+
+
+def id_keyset_page(query, id_column, limit, cursor=None, offset=0):
+    """
+    Variante por id ascendente (catálogos): WHERE id > id0 ORDER BY id.
+    Acepta además un offset clásico. Retorna (filas, next_cursor).
+    """
+    if cursor:
+        query = query.filter(id_column > cursor[1])
+
+    query = query.order_by(id_column.asc())
+    if offset:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(None, getattr(rows[-1], id_column.key))
+
+    return rows, next_cursor
@@ -0,0 +1,166 @@
+import io
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+from flask import current_app, send_file, request
+
+from .render_job_service import render_pdf
+from .pdf_renderer import stylesheet_source
+
+
+# ==============================================================================
+# CACHÉ DE PDF POR CONTENIDO (instance/pdf_cache)
+# ==============================================================================
+# La llave de un PDF es el SHA-256 de: plantilla (nombre, código fuente y CSS) +
+# contexto completo + base_url + imágenes (logo, QR). Si el registro cambia (otra
+# cantidad, otro estado, otro logo), cambia la llave: no hace falta invalidar nada. Dos descargas del mismo documento reutilizan el archivo y se
+# saltan WeasyPrint (las consultas para armar el contexto sí se ejecutan).
+#
+# - Los archivos se escriben con un temporal + os.replace (varios workers a la vez).
+# - Cada acierto actualiza la fecha de modificación del archivo; al superar
+#   PDF_CACHE_MAX_MB se borran los menos usados (LRU por mtime).
+# - La llave viaja como ETag: con If-None-Match igual se responde 304 sin cuerpo.
+# PDF_CACHE_MAX_MB = 0 desactiva la caché.
+
+CACHE_FOLDER = 'pdf_cache'
+
+_evict_lock = threading.Lock()
+
+
+def _cache_folder():
+    folder = os.path.join(current_app.instance_path, CACHE_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _max_bytes():
+    return current_app.config.get('PDF_CACHE_MAX_MB', 200) * 1024 * 1024
+
+
+def document_key(document):
+    """
+    SHA-256 (hex) de la plantilla (y su CSS) + contexto + base_url + imágenes del PdfDocument.
+    """
+    source, _, _ = current_app.jinja_env.loader.get_source(current_app.jinja_env, document.template)
+    digest = hashlib.sha256()
+    digest.update(document.template.encode())
+    digest.update(b'\0')
+    digest.update(source.encode())
+    digest.update(b'\0')
+    digest.update(json.dumps(document.context, sort_keys=True, default=str, ensure_ascii=False).encode())
+    digest.update(b'\0')
+    digest.update(stylesheet_source(document.template).encode())
+    digest.update(b'\0')
+    digest.update((document.base_url or '').encode())
+    for name, data in sorted((document.assets or {}).items()):
+        digest.update(b'\0')
+        digest.update(name.encode())
+        digest.update(hashlib.sha256(data).digest())
+    return digest.hexdigest()
+
+
+def cached_path(key):
+    """
+    Ruta del PDF en caché, o None. Un acierto cuenta como uso reciente.
+    """
+    if not _max_bytes():
+        return None
+    path = os.path.join(_cache_folder(), f"{key}.pdf")
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def _evict():
+    """
+    Borra los archivos menos usados hasta quedar bajo PDF_CACHE_MAX_MB.
+    """
+    limit = _max_bytes()
+    with _evict_lock:
+        entries = []
+        total = 0
+        for entry in os.scandir(_cache_folder()):
+            if not entry.name.endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Otro worker ya lo borró
+            total -= size
+
+
+def _store(key, write):
+    """
+    Guarda el PDF con write(archivo) en la caché y retorna su ruta.
+    """
+    path = os.path.join(_cache_folder(), f"{key}.pdf")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+    _evict()
+    return path
+
+
+def store_pdf(key, pdf_bytes):
+    if not _max_bytes():
+        return None
+    return _store(key, lambda f: f.write(pdf_bytes))
+
+
+def store_file(key, source_path):
+    """
+    Copia a la caché un PDF ya generado (por ejemplo, el de un trabajo en segundo plano).
+    """
+    if not _max_bytes():
+        return None
+
+    def copy(f):
+        with open(source_path, 'rb') as source:
+            shutil.copyfileobj(source, f)
+    return _store(key, copy)
+
+
+def send_pdf(document, as_attachment=True):
+    """
+    Respuesta con el PDF del documento: desde la caché si existe, si no se renderiza
+    y se guarda. Incluye ETag (la llave) y responde 304 a If-None-Match.
+    """
+    key = document_key(document)
+    if request.if_none_match.contains(key):
+        # El cliente ya tiene exactamente este documento (la llave depende del contenido)
+        response = current_app.response_class(status=304)
+        response.set_etag(key)
+        return response
+
+    path = cached_path(key)
+    if path is not None:
+        try:
+            return send_file(
+                path, mimetype='application/pdf', as_attachment=as_attachment,
+                download_name=document.filename, etag=key, conditional=True, max_age=0
+            )
+        except FileNotFoundError:
+            pass  # Otro worker lo desalojó entre medio: se vuelve a renderizar
+
+    pdf_bytes = render_pdf(document)
+    store_pdf(key, pdf_bytes)
+    return send_file(
+        io.BytesIO(pdf_bytes), mimetype='application/pdf', as_attachment=as_attachment,
+        download_name=document.filename, etag=key, conditional=True, max_age=0
+    )
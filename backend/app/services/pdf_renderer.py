@@ -0,0 +1,129 @@
+import os
+import mimetypes
+import threading
+
+
+# ==============================================================================
+# RENDERIZADOR WEASYPRINT COMPARTIDO (UNO POR PROCESO)
+# ==============================================================================
+# Antes cada PDF volvía a parsear el <style> de su plantilla y WeasyPrint creaba
+# una FontConfiguration nueva (cargar fontconfig/Pango) en cada llamada. Ahora:
+#
+# - El CSS de cada plantilla vive en app/templates/pdf_css/<plantilla>.css y se
+#   compila una sola vez por proceso en un objeto CSS (se recompila si el
+#   archivo cambia).
+# - Todos los renderizados del proceso usan la misma FontConfiguration.
+# - Las imágenes (logo, QR) no van como data URI en el HTML: la plantilla usa
+#   asset_url('logo.png') y el url_fetcher entrega los bytes desde memoria
+#   (PdfDocument.assets). El logo se lee del disco una vez por proceso.
+#
+# Lo usan la descarga directa y los procesos del pool de trabajos (render_job_service).
+# Compatible con el url_fetcher de WeasyPrint 66 (función que retorna un dict).
+
+STYLES_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'pdf_css')
+ASSET_SCHEME = 'asset:'
+
+_font_config = None
+_stylesheets = {}  # plantilla -> (mtime, CSS)
+_asset_files = {}  # ruta -> (mtime, bytes)
+# Pango/FontConfiguration no se comparten entre hilos: un renderizado a la vez por proceso
+_render_lock = threading.Lock()
+
+
+def asset_url(name):
+    """
+    URL para usar en la plantilla (<img src="...">) de un recurso de PdfDocument.assets.
+    """
+    return f"{ASSET_SCHEME}{name}"
+
+
+def load_asset(path):
+    """
+    Bytes de un archivo (logo) leídos una vez por proceso, o None si no existe.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _asset_files.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, f.read())
+        _asset_files[path] = cached
+    return cached[1]
+
+
+def stylesheet_path(template):
+    return os.path.join(STYLES_FOLDER, f"{os.path.splitext(template)[0]}.css")
+
+
+def stylesheet_source(template):
+    """
+    Texto del CSS de la plantilla ('' si no tiene). Forma parte de la llave de la caché de PDF.
+    """
+    try:
+        with open(stylesheet_path(template), encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return ''
+
+
+def _font_configuration():
+    global _font_config
+    if _font_config is None:
+        from weasyprint.text.fonts import FontConfiguration
+        _font_config = FontConfiguration()
+    return _font_config
+
+
+def get_stylesheet(template):
+    """
+    CSS compilado de la plantilla (en caché del proceso), o None si no tiene.
+    """
+    path = stylesheet_path(template)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _stylesheets.get(template)
+    if cached is None or cached[0] != mtime:
+        from weasyprint import CSS
+        cached = (mtime, CSS(filename=path, font_config=_font_configuration()))
+        _stylesheets[template] = cached
+    return cached[1]
+
+
+def _url_fetcher(assets):
+    """
+    url_fetcher de WeasyPrint: 'asset:<nombre>' se sirve desde 'assets'; el resto, como siempre.
+    """
+    from weasyprint import default_url_fetcher
+
+    def fetch(url, *args, **kwargs):
+        if url.startswith(ASSET_SCHEME):
+            name = url[len(ASSET_SCHEME):]
+            data = assets.get(name)
+            if data is None:
+                raise ValueError(f"Recurso no disponible para el PDF: {name}")
+            return {
+                'string': data,
+                'mime_type': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                'redirected_url': url
+            }
+        return default_url_fetcher(url, *args, **kwargs)
+    return fetch
+
+
+def write_pdf(html, base_url=None, template=None, assets=None):
+    """
+    HTML -> bytes del PDF, con el CSS precompilado de 'template' y los recursos de 'assets'.
+    """
+    from weasyprint import HTML
+
+    with _render_lock:
+        stylesheet = get_stylesheet(template) if template else None
+        document = HTML(string=html, base_url=base_url, url_fetcher=_url_fetcher(assets or {}))
+        return document.write_pdf(
+            stylesheets=[stylesheet] if stylesheet is not None else None,
+            font_config=_font_configuration()
+        )
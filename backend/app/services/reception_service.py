@@ -0,0 +1,138 @@
+from sqlalchemy import insert
+
+from ..extensions import db
+from ..models.purchase_order import PurchaseOrderItem
+from ..models.product_catalog import Product
+from ..models.reception import ProductReceiptItem
+from .stock_total_service import get_stock_totals
+from .location_service import add_bins
+from .inventory_ledger import apply_movements, Movement
+
+
+# ==============================================================================
+# MOTOR DE RECEPCIÓN DE COMPRAS (EN BLOQUE)
+# ==============================================================================
+# En lugar de 4+ consultas por línea, se precargan todos los registros con unos
+# pocos IN (...), se calcula el costo promedio en memoria (respetando el orden
+# de las líneas, igual que el flujo línea por línea) y se escribe en bloque.
+# Stock del almacén, Kardex y totales se aplican con inventory_ledger.
+
+
+def sanitize_location(raw_loc):
+    """
+    Normaliza la ubicación que envía el frontend (texto o lista) a texto.
+    """
+    if isinstance(raw_loc, list):
+        return ", ".join(str(x) for x in raw_loc)
+    elif raw_loc:
+        return str(raw_loc).strip()
+    return None
+
+
+def _merge_location(current, location):
+    """
+    Agrega la ubicación al maestro del producto si no existe aún.
+    """
+    if not location:
+        return current
+    if not current:
+        return location
+    existing_locs = [l.strip() for l in current.split(',')]
+    if location not in existing_locs:
+        existing_locs.append(location)
+        return ",".join(existing_locs)
+    return current
+
+
+def receive_purchase_order_items(receipt_id, order_id, warehouse_id, invoice_number, items, user_id):
+    """
+    Registra las líneas recibidas de una OC:
+    detalle de recepción, stock del almacén, ubicación y costo promedio del producto y Kardex.
+    Retorna la cantidad de líneas procesadas.
+    """
+    # 1. Normalizar líneas (se descartan las de cantidad <= 0)
+    lines = []
+    for item_data in items:
+        quantity_received = float(item_data['quantity_received'])
+        if quantity_received <= 0:
+            continue
+        lines.append({
+            'po_item_id': item_data.get('po_item_id'),
+            'product_id': int(item_data['product_id']),
+            'quantity': quantity_received,
+            'location': sanitize_location(item_data.get('location'))
+        })
+
+    if not lines:
+        return 0
+
+    product_ids = {line['product_id'] for line in lines}
+    po_item_ids = {line['po_item_id'] for line in lines if line['po_item_id']}
+
+    # 2. Precarga (una consulta por tabla)
+    po_items = {}
+    if po_item_ids:
+        po_items = {i.id: i for i in PurchaseOrderItem.query.filter(PurchaseOrderItem.id.in_(po_item_ids)).all()}
+
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids)).all()}
+    missing = product_ids - products.keys()
+    if missing:
+        raise ValueError(f"Producto(s) no encontrado(s): {sorted(missing)}")
+
+    global_totals = get_stock_totals(product_ids)
+
+    # 3. Cálculo en memoria (línea por línea, en orden)
+    total_qty = {pid: global_totals.get(pid, 0.0) for pid in product_ids}
+    avg_price = {pid: float(p.standard_price or 0.0) for pid, p in products.items()}
+    locations = {pid: p.location for pid, p in products.items()}
+
+    receipt_rows = []
+    movements = []
+    reference = f"Orden #{order_id} - {invoice_number or 'S/F'}"
+
+    for line in lines:
+        product_id = line['product_id']
+        quantity_received = line['quantity']
+
+        # A. Actualizar item de la orden original
+        po_item = po_items.get(line['po_item_id'])
+        if po_item:
+            po_item.product_id = product_id
+
+        # B. Detalle de Recepción (Historial)
+        receipt_rows.append({
+            'receipt_id': receipt_id,
+            'product_id': product_id,
+            'quantity': quantity_received,
+            'location': line['location'],
+            'po_item_id': line['po_item_id']
+        })
+
+        # C. Ubicación maestra
+        locations[product_id] = _merge_location(locations[product_id], line['location'])
+
+        # D. Precio Promedio Ponderado
+        incoming_price = float(po_item.unit_price) if po_item else 0.0
+        current_total_stock = total_qty[product_id]
+        new_total_quantity = current_total_stock + quantity_received
+        if new_total_quantity > 0:
+            avg_price[product_id] = (
+                current_total_stock * avg_price[product_id] + quantity_received * incoming_price
+            ) / new_total_quantity
+        total_qty[product_id] = new_total_quantity
+
+        # E. Movimiento de stock (Kardex)
+        movements.append(Movement(product_id, warehouse_id, quantity_received, "Recepción de Compra", reference))
+
+    # 4. Escritura en bloque
+    for product_id, product in products.items():
+        if locations[product_id] != product.location:
+            product.location = locations[product_id]
+        if avg_price[product_id] != float(product.standard_price or 0.0):
+            product.standard_price = avg_price[product_id]
+
+    db.session.execute(insert(ProductReceiptItem), receipt_rows)
+    apply_movements(movements, user_id)
+    add_bins((line['product_id'], warehouse_id, line['location']) for line in lines)
+
+    return len(lines)
@@ -0,0 +1,230 @@
+import os
+import uuid
+import shutil
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from flask import current_app, render_template
+
+from ..extensions import db
+from ..models.render_job import RenderJob
+from .pdf_renderer import write_pdf
+
+
+# ==============================================================================
+# RENDERIZADO DE PDF (WEASYPRINT) Y TRABAJOS EN SEGUNDO PLANO
+# ==============================================================================
+# Cada PDF (reportes, orden de compra, GRE) se describe con un PdfDocument:
+# plantilla + contexto + nombre de archivo. Quien lo arma hace las consultas;
+# el renderizado (pdf_renderer.write_pdf) es el mismo para la descarga directa
+# y para los trabajos.
+#
+# Descarga directa: render_pdf() dentro de la solicitud (como siempre).
+# Trabajo (POST /api/jobs): el HTML se arma en la solicitud y WeasyPrint corre
+# en un pool de procesos acotado (RENDER_POOL_WORKERS por worker de gunicorn),
+# así un reporte grande no bloquea al worker web. El estado queda en render_jobs
+# y el PDF en instance/render_jobs/, visibles para todos los workers.
+#
+# Los PDF terminados se copian a la caché por contenido (pdf_cache_service): si el
+# mismo documento ya está en caché, el trabajo queda 'completado' al instante.
+#
+# Si un worker muere con trabajos en curso, esos trabajos pasan a 'error' al
+# superar RENDER_JOB_TIMEOUT_SECONDS. Los trabajos terminados (y su archivo) se
+# eliminan después de RENDER_JOB_TTL_HOURS.
+
+# template: plantilla de app/templates; context: variables para la plantilla;
+# filename: nombre de descarga; base_url: para resolver rutas relativas en el HTML;
+# assets: {nombre: bytes} de las imágenes que la plantilla usa con asset_url(nombre).
+PdfDocument = namedtuple('PdfDocument', ['template', 'context', 'filename', 'base_url', 'assets'],
+                         defaults=(None, None))
+
+JOBS_FOLDER = 'render_jobs'
+
+
+class RenderQueueFullError(RuntimeError):
+    """Hay demasiados trabajos pendientes; el cliente debe reintentar más tarde."""
+    pass
+
+
+def render_html(document):
+    return render_template(document.template, **document.context)
+
+
+def render_pdf(document):
+    """
+    Renderiza el documento en la solicitud actual. Retorna los bytes del PDF.
+    """
+    return write_pdf(render_html(document), document.base_url, document.template, document.assets)
+
+
+def _render_to_file(html, base_url, template, assets, path):
+    """
+    Tarea del pool: escribe el PDF en 'path' (vía archivo temporal) y retorna su tamaño.
+    """
+    pdf = write_pdf(html, base_url, template, assets)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp_path, path)
+    return len(pdf)
+
+
+# --- POOL DE PROCESOS ---
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn': los hijos no heredan conexiones de BD ni sockets del worker web
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _discard_pool(pool=None):
+    """
+    Descarta el pool (o solo 'pool', si sigue siendo el actual) para que el próximo trabajo cree uno nuevo.
+    """
+    global _pool
+    with _pool_lock:
+        if pool is None or _pool is pool:
+            _pool = None
+
+
+def jobs_folder(app=None):
+    folder = os.path.join((app or current_app).instance_path, JOBS_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def job_file_path(job_id, app=None):
+    return os.path.join(jobs_folder(app), f"{job_id}.pdf")
+
+
+def _finish_job(app, job_id, cache_key, pool, future):
+    """
+    Callback del pool (hilo del executor): guarda el resultado del trabajo
+    y deja una copia del PDF en la caché.
+    """
+    from .pdf_cache_service import store_file
+
+    if isinstance(future.exception(), BrokenProcessPool):
+        # Un hijo murió: el pool ya no acepta trabajos, el siguiente debe crear uno nuevo
+        _discard_pool(pool)
+
+    with app.app_context():
+        job = db.session.get(RenderJob, job_id)
+        if job is None:
+            return
+        try:
+            job.file_size = future.result()
+            job.status = 'completado'
+            try:
+                store_file(cache_key, job_file_path(job_id))
+            except OSError as e:
+                print(f"--- ERROR AL GUARDAR PDF EN CACHÉ ({job_id}): {e} ---")
+        except Exception as e:
+            print(f"--- ERROR EN TRABAJO DE RENDERIZADO {job_id}: {e} ---")
+            job.status = 'error'
+            job.error = str(e) or e.__class__.__name__
+        job.finished_at = datetime.now()
+        db.session.commit()
+
+
+def _stale_limit():
+    return datetime.now() - timedelta(seconds=current_app.config.get('RENDER_JOB_TIMEOUT_SECONDS', 600))
+
+
+def submit_render_job(document, job_type, user_id):
+    """
+    Registra el trabajo y envía el renderizado al pool. Retorna el RenderJob (estado 'pendiente').
+    Lanza RenderQueueFullError si se alcanzó RENDER_JOBS_MAX_PENDING.
+    """
+    purge_expired_jobs()
+
+    pending = RenderJob.query.filter(
+        RenderJob.status == 'pendiente', RenderJob.created_at > _stale_limit()
+    ).count()
+    if pending >= current_app.config.get('RENDER_JOBS_MAX_PENDING', 20):
+        raise RenderQueueFullError("Hay demasiados documentos en cola. Intente nuevamente en unos minutos.")
+
+    from .pdf_cache_service import document_key, cached_path
+
+    job = RenderJob(id=uuid.uuid4().hex, job_type=job_type, user_id=user_id, filename=document.filename)
+
+    # Mismo documento ya generado (descarga directa u otro trabajo): se copia sin pasar por el pool
+    cache_key = document_key(document)
+    cached = cached_path(cache_key)
+    if cached is not None:
+        try:
+            shutil.copyfile(cached, job_file_path(job.id))
+            job.status = 'completado'
+            job.file_size = os.path.getsize(job_file_path(job.id))
+            job.finished_at = datetime.now()
+            db.session.add(job)
+            db.session.commit()
+            return job
+        except FileNotFoundError:
+            pass  # Desalojado entre medio: se renderiza normalmente
+
+    # El HTML se arma aquí (consultas y plantilla); el proceso hijo solo ejecuta WeasyPrint
+    html = render_html(document)
+
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    try:
+        pool = _get_pool(current_app.config.get('RENDER_POOL_WORKERS', 1))
+        future = pool.submit(_render_to_file, html, document.base_url, document.template, document.assets,
+                             job_file_path(job.id))
+    except Exception as e:
+        # Pool roto (un hijo murió): se descarta para que el próximo trabajo cree uno nuevo
+        _discard_pool()
+        job.status = 'error'
+        job.error = str(e) or e.__class__.__name__
+        job.finished_at = datetime.now()
+        db.session.commit()
+        return job
+
+    future.add_done_callback(lambda f: _finish_job(app, job.id, cache_key, pool, f))
+    return job
+
+
+def get_job(job_id, user_id):
+    """
+    Trabajo del usuario, o None. Un trabajo 'pendiente' más antiguo que
+    RENDER_JOB_TIMEOUT_SECONDS se marca como error (su worker se detuvo).
+    """
+    job = RenderJob.query.filter_by(id=job_id, user_id=user_id).first()
+    if job is not None and job.status == 'pendiente' and job.created_at <= _stale_limit():
+        job.status = 'error'
+        job.error = "El trabajo no terminó a tiempo. Vuelva a solicitar el documento."
+        job.finished_at = datetime.now()
+        db.session.commit()
+    return job
+
+
+def purge_expired_jobs():
+    """
+    Elimina los trabajos (y sus archivos) más antiguos que RENDER_JOB_TTL_HOURS.
+    """
+    limit = datetime.now() - timedelta(hours=current_app.config.get('RENDER_JOB_TTL_HOURS', 24))
+    expired = [job_id for (job_id,) in db.session.query(RenderJob.id).filter(RenderJob.created_at < limit).all()]
+    if not expired:
+        return 0
+
+    for job_id in expired:
+        try:
+            os.remove(job_file_path(job_id))
+        except FileNotFoundError:
+            pass
+    RenderJob.query.filter(RenderJob.id.in_(expired)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(expired)
@@ -0,0 +1,121 @@
+import pandas as pd
+from sqlalchemy import update
+
+from ..extensions import db
+from ..models.inventory_models import InventoryStock
+from ..models.product_catalog import Product
+from .location_service import replace_warehouse_bins
+from .inventory_ledger import apply_movements, Movement
+
+
+# ==============================================================================
+# AJUSTE MASIVO DE INVENTARIO (VECTORIZADO)
+# ==============================================================================
+# Se cargan UNA vez los mapas SKU -> producto y producto -> stock del almacén,
+# se cruzan con la hoja usando pandas y las diferencias se calculan en bloque.
+# Las diferencias se aplican como movimientos con inventory_ledger (en bloque).
+# El stock se escribe solo si su 'version' sigue siendo la leída: si otro proceso
+# lo movió mientras tanto se lanza StockConflictError y el endpoint reintenta.
+
+EXPECTED_COLUMNS = ['SKU', 'Cantidad', 'Locacion']
+ADJUSTMENT_TYPE = "Carga Inicial / Ajuste"
+ADJUSTMENT_MAX_ATTEMPTS = 3
+
+
+def read_adjustment_sheet(file):
+    """
+    Lee el Excel de ajuste. El SKU se lee como texto para no perder ceros ni convertirlo a float.
+    """
+    return pd.read_excel(file, dtype={'SKU': str})
+
+
+def apply_mass_adjustment(df, warehouse_id, user_id):
+    """
+    Aplica el conteo físico de la hoja al almacén indicado.
+    Retorna {'updated_products': int, 'errors': [{'row', 'sku', 'error'}, ...]}.
+    Las filas con error se omiten; el resto se aplica.
+    """
+    warehouse_id = int(warehouse_id)
+
+    # 1. Normalizar la hoja (row = número de fila en Excel, la fila 1 es la cabecera)
+    sheet = pd.DataFrame({
+        'row': df.index.to_numpy() + 2,
+        'sku': df['SKU'].astype(str).str.strip(),
+        'real_quantity': pd.to_numeric(df['Cantidad'], errors='coerce'),
+        'location': [(str(v).strip() or None) if pd.notna(v) else None for v in df['Locacion']]
+    })
+
+    errors = []
+
+    invalid_qty = sheet['real_quantity'].isna()
+    for row, sku in sheet.loc[invalid_qty, ['row', 'sku']].itertuples(index=False):
+        errors.append({'row': int(row), 'sku': sku, 'error': "Cantidad inválida."})
+    sheet = sheet[~invalid_qty]
+
+    # 2. Mapas SKU -> producto y producto -> stock (una consulta cada uno)
+    products_df = pd.DataFrame(
+        db.session.query(Product.id, Product.sku).all(), columns=['product_id', 'sku']
+    )
+    stock_df = pd.DataFrame(
+        db.session.query(
+            InventoryStock.id, InventoryStock.product_id, InventoryStock.quantity, InventoryStock.version
+        ).filter(InventoryStock.warehouse_id == warehouse_id).all(),
+        columns=['stock_id', 'product_id', 'current_quantity', 'stock_version']
+    )
+    stock_df['current_quantity'] = stock_df['current_quantity'].astype(float)
+
+    sheet = sheet.merge(products_df, on='sku', how='left')
+
+    not_found = sheet['product_id'].isna()
+    for row, sku in sheet.loc[not_found, ['row', 'sku']].itertuples(index=False):
+        errors.append({'row': int(row), 'sku': sku, 'error': f"SKU no encontrado: {sku}"})
+    sheet = sheet[~not_found].copy()
+    sheet['product_id'] = sheet['product_id'].astype(int)
+
+    errors.sort(key=lambda e: e['row'])
+
+    if sheet.empty:
+        return {'updated_products': 0, 'errors': errors}
+
+    sheet = sheet.sort_values('row', kind='stable').merge(stock_df, on='product_id', how='left')
+    sheet['current_quantity'] = sheet['current_quantity'].fillna(0.0)
+
+    # 3. Diferencias. Si un SKU se repite, cada fila se compara con la anterior del mismo SKU
+    previous = sheet.groupby('product_id', sort=False)['real_quantity'].shift(1)
+    sheet['previous_quantity'] = previous.fillna(sheet['current_quantity'])
+    sheet['difference'] = sheet['real_quantity'] - sheet['previous_quantity']
+
+    changed = sheet[sheet['difference'] != 0]
+
+    # 4. Ubicación maestra: gana la última ubicación informada por producto
+    last_locations = sheet.dropna(subset=['location']).drop_duplicates('product_id', keep='last')
+    if not last_locations.empty:
+        product_locations = {
+            int(pid): loc for pid, loc in last_locations[['product_id', 'location']].itertuples(index=False)
+        }
+        db.session.execute(update(Product), [
+            {'id': pid, 'location': loc} for pid, loc in product_locations.items()
+        ])
+        replace_warehouse_bins(warehouse_id, product_locations)
+
+    # 5. Movimientos: una línea por cada fila con diferencia. Todo producto contado
+    #    queda registrado en el almacén (aunque sea con 0): los que no tienen fila
+    #    y no cambian entran como movimiento en 0 (crea la fila, sin Kardex).
+    movements = [
+        Movement(int(pid), warehouse_id, float(diff), ADJUSTMENT_TYPE)
+        for pid, diff in changed[['product_id', 'difference']].itertuples(index=False)
+    ]
+    final_stock = sheet.drop_duplicates('product_id', keep='last')
+    unchanged_new = final_stock[final_stock['stock_id'].isna() & ~final_stock['product_id'].isin(changed['product_id'])]
+    movements.extend(Movement(int(pid), warehouse_id, 0.0, ADJUSTMENT_TYPE) for pid in unchanged_new['product_id'])
+
+    # El stock solo se escribe si su versión sigue siendo la leída (None = no existía)
+    expected_versions = {
+        (int(pid), warehouse_id): (None if pd.isna(stock_id) else int(version))
+        for pid, stock_id, version in final_stock[['product_id', 'stock_id', 'stock_version']].itertuples(index=False)
+    }
+
+    # 6. Stock, Kardex y total por producto
+    apply_movements(movements, user_id, expected_versions=expected_versions)
+
+    return {'updated_products': int(len(changed)), 'errors': errors}
@@ -0,0 +1,233 @@
+from sqlalchemy import update, insert, bindparam, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models.inventory_models import InventoryStock
+
+
+# ==============================================================================
+# CAMBIOS DE STOCK ATÓMICOS
+# ==============================================================================
+# Con varios workers de gunicorn, "leer quantity en Python, sumar y guardar"
+# pierde actualizaciones cuando dos procesos tocan la misma fila a la vez.
+# Aquí el cálculo lo hace la BD en una sola sentencia:
+#
+#   UPDATE inventory_stock SET quantity = quantity + :delta, version = version + 1
+#   WHERE product_id = :p AND warehouse_id = :w [AND quantity >= :salida]
+#   RETURNING quantity
+#
+# La condición "quantity >= :salida" reemplaza al chequeo de stock insuficiente
+# hecho en Python: si no alcanza, la fila no se toca y se retorna None.
+#
+# Cuando el valor a escribir depende de lo leído (ajuste por conteo físico) se
+# usa la columna version: UPDATE ... WHERE id = :id AND version = :leída.
+# Si otro proceso la cambió entre medio, se lanza StockConflictError para reintentar.
+#
+# Las funciones *_rows trabajan en bloque (una sentencia para N filas) y son las
+# que usa inventory_ledger; change_stock queda para movimientos sueltos.
+
+STOCK_TABLE = InventoryStock.__table__
+
+
+class StockConflictError(RuntimeError):
+    """Otro proceso modificó el stock leído; la operación debe reintentarse."""
+    pass
+
+
+class InsufficientStockError(ValueError):
+    """No hay stock suficiente para una salida."""
+
+    def __init__(self, message, product_id=None, warehouse_id=None):
+        super().__init__(message)
+        self.product_id = product_id
+        self.warehouse_id = warehouse_id
+
+
+def _dialect_insert():
+    """
+    insert() con soporte de ON CONFLICT (PostgreSQL / SQLite). None si el motor no lo soporta.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(STOCK_TABLE)
+    if dialect == 'sqlite':
+        return sqlite.insert(STOCK_TABLE)
+    return None
+
+
+def _upsert_statement(rows):
+    """
+    INSERT ... ON CONFLICT DO UPDATE que suma la cantidad si la fila ya existe.
+    rows: [{'product_id', 'warehouse_id', 'quantity', 'version'}, ...] sin claves repetidas.
+    """
+    stmt = _dialect_insert()
+    if stmt is None:
+        return None
+
+    stmt = stmt.values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=['product_id', 'warehouse_id'],
+        set_={
+            'quantity': STOCK_TABLE.c.quantity + stmt.excluded.quantity,
+            'version': STOCK_TABLE.c.version + 1
+        }
+    )
+
+
+def _matched_rows(stmt, params):
+    """
+    Ejecuta un UPDATE en bloque y retorna cuántas filas cumplieron el WHERE.
+    """
+    if db.session.get_bind().dialect.supports_sane_multi_rowcount:
+        return db.session.execute(stmt, params).rowcount
+    # El driver no informa filas afectadas en executemany: se ejecuta una por una
+    return sum(db.session.execute(stmt, p).rowcount for p in params)
+
+
+def change_stock(product_id, warehouse_id, delta, require_available=False, create_missing=True):
+    """
+    Suma delta (positivo o negativo) al stock del producto en el almacén, de forma atómica.
+    Retorna la cantidad resultante (float), o None si:
+      - require_available y no hay stock suficiente (o no existe la fila), o
+      - la fila no existe y create_missing es False.
+    Nota: no actualiza product_stock_totals (ver stock_total_service.apply_stock_deltas).
+    """
+    product_id, warehouse_id, delta = int(product_id), int(warehouse_id), float(delta)
+    guarded = require_available and delta < 0
+
+    # Las entradas pueden crear la fila: un solo UPSERT cubre la carrera "dos procesos la crean a la vez"
+    if create_missing and not guarded:
+        upsert = _upsert_statement([
+            {'product_id': product_id, 'warehouse_id': warehouse_id, 'quantity': delta, 'version': 1}
+        ])
+        if upsert is not None:
+            return float(db.session.execute(upsert.returning(STOCK_TABLE.c.quantity)).scalar_one())
+
+    stmt = update(STOCK_TABLE).where(
+        STOCK_TABLE.c.product_id == product_id,
+        STOCK_TABLE.c.warehouse_id == warehouse_id
+    )
+    if guarded:
+        stmt = stmt.where(STOCK_TABLE.c.quantity >= -delta)
+    stmt = stmt.values(
+        quantity=STOCK_TABLE.c.quantity + delta,
+        version=STOCK_TABLE.c.version + 1
+    ).returning(STOCK_TABLE.c.quantity)
+
+    new_quantity = db.session.execute(stmt).scalar()
+    if new_quantity is not None:
+        return float(new_quantity)
+
+    if guarded or not create_missing:
+        return None
+
+    # Motores sin UPSERT: se crea la fila (si otro proceso la creó primero, falla la
+    # restricción única y la transacción completa se revierte)
+    db.session.execute(insert(STOCK_TABLE).values(
+        product_id=product_id, warehouse_id=warehouse_id, quantity=delta, version=1
+    ))
+    return delta
+
+
+# --- OPERACIONES EN BLOQUE ---
+
+def lock_stock_rows(keys):
+    """
+    Lee las filas de stock de [(product_id, warehouse_id), ...] en una consulta.
+    En PostgreSQL las bloquea (FOR UPDATE) en orden de id hasta el fin de la transacción.
+    Retorna {(product_id, warehouse_id): {'id', 'quantity', 'version'}} solo para las que existen.
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+
+    rows = db.session.execute(
+        db.select(
+            STOCK_TABLE.c.id, STOCK_TABLE.c.product_id, STOCK_TABLE.c.warehouse_id,
+            STOCK_TABLE.c.quantity, STOCK_TABLE.c.version
+        )
+        .where(tuple_(STOCK_TABLE.c.product_id, STOCK_TABLE.c.warehouse_id).in_(keys))
+        .order_by(STOCK_TABLE.c.id)
+        .with_for_update()
+    ).all()
+    return {
+        (pid, wid): {'id': stock_id, 'quantity': float(qty), 'version': int(version or 0)}
+        for stock_id, pid, wid, qty, version in rows
+    }
+
+
+def read_stock_quantities(keys):
+    """
+    {(product_id, warehouse_id): cantidad} de las filas indicadas (una consulta).
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    rows = db.session.execute(
+        db.select(STOCK_TABLE.c.product_id, STOCK_TABLE.c.warehouse_id, STOCK_TABLE.c.quantity)
+        .where(tuple_(STOCK_TABLE.c.product_id, STOCK_TABLE.c.warehouse_id).in_(keys))
+    ).all()
+    return {(pid, wid): float(qty) for pid, wid, qty in rows}
+
+
+def add_to_stock_rows(rows, require_available=False, check_version=False):
+    """
+    Suma deltas a filas existentes en una sentencia: [{'id', 'delta', 'version'}, ...].
+      - require_available: la fila solo se actualiza si quantity + delta >= 0.
+      - check_version: la fila solo se actualiza si su versión sigue siendo 'version'.
+    Si alguna fila no cumple, lanza InsufficientStockError / StockConflictError
+    (la transacción debe revertirse).
+    """
+    if not rows:
+        return
+
+    stmt = update(STOCK_TABLE).where(STOCK_TABLE.c.id == bindparam('stock_id'))
+    if require_available:
+        stmt = stmt.where(STOCK_TABLE.c.quantity + bindparam('delta') >= 0)
+    if check_version:
+        stmt = stmt.where(STOCK_TABLE.c.version == bindparam('read_version'))
+    stmt = stmt.values(
+        quantity=STOCK_TABLE.c.quantity + bindparam('delta'),
+        version=STOCK_TABLE.c.version + 1
+    )
+
+    params = []
+    for r in rows:
+        p = {'stock_id': int(r['id']), 'delta': float(r['delta'])}
+        if check_version:
+            p['read_version'] = int(r['version'])
+        params.append(p)
+
+    if _matched_rows(stmt, params) == len(params):
+        return
+    if check_version:
+        raise StockConflictError("El stock cambió mientras se procesaba la operación. Intente nuevamente.")
+    raise InsufficientStockError("Stock insuficiente: otro proceso retiró stock al mismo tiempo. Intente nuevamente.")
+
+
+def create_stock_rows(rows, merge_existing=True):
+    """
+    Crea filas de stock [{'product_id', 'warehouse_id', 'quantity'}, ...] en una sentencia.
+    Si otro proceso creó la misma fila entre medio:
+      - merge_existing: se le suma la cantidad (UPSERT; en otros motores falla la restricción única).
+      - si no: la restricción única falla y se lanza StockConflictError.
+    """
+    if not rows:
+        return
+
+    values = [
+        {'product_id': int(r['product_id']), 'warehouse_id': int(r['warehouse_id']),
+         'quantity': float(r['quantity']), 'version': 1}
+        for r in rows
+    ]
+
+    upsert = _upsert_statement(values) if merge_existing else None
+    if upsert is not None:
+        db.session.execute(upsert)
+        return
+
+    try:
+        db.session.execute(insert(STOCK_TABLE), values)
+    except IntegrityError:
+        raise StockConflictError("El stock cambió mientras se procesaba la operación. Intente nuevamente.")
@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import datetime, date, time, timedelta
+
+from sqlalchemy import func, insert
+
+from ..extensions import db
+from ..models.inventory_models import InventoryTransaction, StockSnapshot
+
+
+# ==============================================================================
+# STOCK A UNA FECHA (FOTOS PERIÓDICAS + KARDEX)
+# ==============================================================================
+# El saldo histórico de un producto en un almacén es la suma de quantity_change
+# del Kardex hasta ese momento. En lugar de sumar toda la historia, se parte de
+# la foto (stock_snapshots) más cercana a la fecha pedida y se aplican solo los
+# movimientos entre ambas: el costo depende del tamaño de esa ventana.
+#
+# Si la foto más cercana es posterior, los movimientos de la ventana se restan.
+# Las fotos se generan con 'flask inventory snapshot' (por ejemplo, el 1° de
+# cada mes); sin fotos el cálculo sigue siendo correcto, solo más lento.
+#
+# Nota: el saldo sale del Kardex. El stock cargado sin movimiento de Kardex
+# (datos antiguos) no aparece aquí, igual que en el reporte de transferencias.
+
+
+def parse_as_of(value):
+    """
+    'YYYY-MM-DD' -> límite exclusivo al final de ese día (el día completo queda incluido).
+    Lanza ValueError si el formato es inválido.
+    """
+    day = datetime.strptime(value, '%Y-%m-%d').date()
+    return datetime.combine(day + timedelta(days=1), time.min)
+
+
+def month_start(day):
+    """
+    Primer instante del mes de la fecha indicada.
+    """
+    return datetime(day.year, day.month, 1)
+
+
+def _nearest_cutoff(moment):
+    """
+    Fecha de corte más cercana a 'moment' (anterior o posterior), o None si no hay fotos.
+    """
+    before = db.session.query(func.max(StockSnapshot.taken_at)).filter(StockSnapshot.taken_at <= moment).scalar()
+    after = db.session.query(func.min(StockSnapshot.taken_at)).filter(StockSnapshot.taken_at > moment).scalar()
+    if before is None or after is None:
+        return before or after
+    return before if moment - before <= after - moment else after
+
+
+def _kardex_sums(start, end, warehouse_id=None, product_ids=None):
+    """
+    SUM(quantity_change) por (producto, almacén) con start <= timestamp < end.
+    """
+    query = db.session.query(
+        InventoryTransaction.product_id, InventoryTransaction.warehouse_id, func.sum(InventoryTransaction.quantity_change)
+    ).filter(InventoryTransaction.timestamp < end)
+    if start is not None:
+        query = query.filter(InventoryTransaction.timestamp >= start)
+    if warehouse_id:
+        query = query.filter(InventoryTransaction.warehouse_id == warehouse_id)
+    if product_ids is not None:
+        query = query.filter(InventoryTransaction.product_id.in_(product_ids))
+    return query.group_by(InventoryTransaction.product_id, InventoryTransaction.warehouse_id).all()
+
+
+def stock_as_of(moment, warehouse_id=None, product_ids=None):
+    """
+    Saldo del Kardex antes de 'moment' (timestamp < moment).
+    Retorna {(product_id, warehouse_id): cantidad}; incluye saldos en 0 si hubo movimientos.
+    """
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return {}
+
+    cutoff = _nearest_cutoff(moment)
+    balances = defaultdict(float)
+
+    if cutoff is not None:
+        snapshot = db.session.query(
+            StockSnapshot.product_id, StockSnapshot.warehouse_id, StockSnapshot.quantity
+        ).filter(StockSnapshot.taken_at == cutoff)
+        if warehouse_id:
+            snapshot = snapshot.filter(StockSnapshot.warehouse_id == warehouse_id)
+        if product_ids is not None:
+            snapshot = snapshot.filter(StockSnapshot.product_id.in_(product_ids))
+        for pid, wid, qty in snapshot.all():
+            balances[(pid, wid)] += float(qty)
+
+    if cutoff is None or cutoff <= moment:
+        # Foto anterior (o ninguna): se suman los movimientos desde el corte
+        for pid, wid, qty in _kardex_sums(cutoff, moment, warehouse_id, product_ids):
+            balances[(pid, wid)] += float(qty or 0)
+    else:
+        # Foto posterior: se restan los movimientos entre la fecha pedida y el corte
+        for pid, wid, qty in _kardex_sums(moment, cutoff, warehouse_id, product_ids):
+            balances[(pid, wid)] -= float(qty or 0)
+
+    return {key: round(qty, 2) for key, qty in balances.items()}
+
+
+def create_snapshot(cutoff, replace=False):
+    """
+    Genera la foto de todos los saldos con timestamp < cutoff.
+    Retorna la cantidad de filas guardadas, o None si el corte ya existía (y no se pidió replace).
+    """
+    if cutoff > datetime.now():
+        raise ValueError("La fecha de corte no puede estar en el futuro.")
+
+    exists = db.session.query(StockSnapshot.id).filter(StockSnapshot.taken_at == cutoff).first()
+    if exists and not replace:
+        return None
+    if exists:
+        StockSnapshot.query.filter(StockSnapshot.taken_at == cutoff).delete(synchronize_session=False)
+
+    # Parte de la foto más cercana, así cada corte nuevo solo recorre su propio período
+    balances = stock_as_of(cutoff)
+    rows = [
+        {'taken_at': cutoff, 'product_id': pid, 'warehouse_id': wid, 'quantity': qty}
+        for (pid, wid), qty in sorted(balances.items()) if qty != 0
+    ]
+    if rows:
+        db.session.execute(insert(StockSnapshot), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def missing_monthly_cutoffs(until=None):
+    """
+    Cortes mensuales (1° de cada mes) desde el primer movimiento del Kardex hasta 'until'
+    (por defecto, el mes actual) que aún no tienen foto.
+    """
+    first = db.session.query(func.min(InventoryTransaction.timestamp)).scalar()
+    if first is None:
+        return []
+
+    until = until or month_start(date.today())
+    existing = {taken_at for (taken_at,) in db.session.query(StockSnapshot.taken_at).distinct().all()}
+
+    cutoffs = []
+    current = month_start(first)
+    while current <= until:
+        # El mes del primer movimiento empieza antes de él: ese corte siempre sería vacío
+        if current > first and current not in existing:
+            cutoffs.append(current)
+        current = month_start(current + timedelta(days=32))
+    return cutoffs
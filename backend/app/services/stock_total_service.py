@@ -0,0 +1,148 @@
+from collections import defaultdict
+
+from sqlalchemy import func, insert, update, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..extensions import db
+from ..models.inventory_models import InventoryStock, ProductStockTotal
+from ..models.product_catalog import Product
+
+
+# ==============================================================================
+# STOCK TOTAL POR PRODUCTO (AGREGADO INCREMENTAL)
+# ==============================================================================
+# product_stock_totals guarda la suma de inventory_stock por producto.
+# Cada movimiento de stock llama a apply_stock_deltas() en su misma transacción,
+# así el costo promedio ponderado lee el total en O(1) en lugar de hacer SUM().
+#
+# La migración siembra la tabla desde inventory_stock (los productos que aún no
+# tienen fila). Un producto sin fila la recibe en su siguiente movimiento, en
+# apply_stock_deltas(); mientras tanto get_stock_totals() suma inventory_stock.
+# 'flask inventory reconcile-totals' reconstruye todo.
+
+
+def _seed_missing_totals(product_ids):
+    """
+    Crea la fila de total para los productos que aún no la tienen, sumando inventory_stock.
+    Retorna el conjunto de productos sembrados.
+    """
+    existing = {pid for (pid,) in db.session.query(ProductStockTotal.product_id).filter(
+        ProductStockTotal.product_id.in_(product_ids)
+    ).all()}
+    missing = set(product_ids) - existing
+    if not missing:
+        return set()
+
+    sums = dict(db.session.query(InventoryStock.product_id, func.sum(InventoryStock.quantity)).filter(
+        InventoryStock.product_id.in_(missing)
+    ).group_by(InventoryStock.product_id).all())
+    rows = [{'product_id': pid, 'quantity': float(sums.get(pid) or 0.0)} for pid in sorted(missing)]
+
+    # Si otro worker sembró el mismo producto en paralelo, su fila gana y este
+    # proceso aplica su delta normalmente (solo se retornan las filas insertadas aquí)
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(ProductStockTotal).values(rows).on_conflict_do_nothing(
+            index_elements=['product_id']
+        ).returning(ProductStockTotal.product_id)
+        return {pid for (pid,) in db.session.execute(stmt).all()}
+
+    db.session.execute(insert(ProductStockTotal), rows)
+    return missing
+
+
+def get_stock_totals(product_ids):
+    """
+    Devuelve {product_id: stock total en todos los almacenes} (float).
+    Un producto sin fila (p. ej. la app atendió movimientos antes de migrar) se
+    suma desde inventory_stock; su fila se crea en su próximo movimiento.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+
+    rows = dict(db.session.query(ProductStockTotal.product_id, ProductStockTotal.quantity).filter(
+        ProductStockTotal.product_id.in_(product_ids)
+    ).all())
+    missing = product_ids - rows.keys()
+    if missing:
+        rows.update(db.session.query(InventoryStock.product_id, func.sum(InventoryStock.quantity)).filter(
+            InventoryStock.product_id.in_(missing)
+        ).group_by(InventoryStock.product_id).all())
+    return {pid: float(rows.get(pid) or 0.0) for pid in product_ids}
+
+
+def apply_stock_deltas(deltas):
+    """
+    Suma los cambios de stock {product_id: delta} al agregado.
+    Debe llamarse DESPUÉS de modificar inventory_stock en la sesión (se hace flush aquí).
+    """
+    deltas = {pid: float(delta) for pid, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    db.session.flush()
+    # Los productos sembrados ahora ya leen inventory_stock con el movimiento incluido
+    seeded = _seed_missing_totals(deltas.keys())
+
+    params = [{'pid': pid, 'delta': delta} for pid, delta in deltas.items() if pid not in seeded]
+    if not params:
+        return
+
+    table = ProductStockTotal.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.product_id == bindparam('pid'))
+        .values(quantity=table.c.quantity + bindparam('delta')),
+        params
+    )
+
+
+def sum_deltas(movements):
+    """
+    Agrupa [(product_id, delta), ...] en {product_id: delta_total}.
+    """
+    deltas = defaultdict(float)
+    for product_id, delta in movements:
+        deltas[product_id] += float(delta)
+    return deltas
+
+
+def rebuild_stock_totals(dry_run=False):
+    """
+    Recalcula product_stock_totals desde inventory_stock.
+    Retorna la lista de diferencias encontradas (antes de corregir).
+    """
+    actual = {pid: float(qty or 0.0) for pid, qty in db.session.query(
+        InventoryStock.product_id, func.sum(InventoryStock.quantity)
+    ).group_by(InventoryStock.product_id).all()}
+    stored = {pid: float(qty or 0.0) for pid, qty in db.session.query(
+        ProductStockTotal.product_id, ProductStockTotal.quantity
+    ).all()}
+
+    drift = []
+    for pid in sorted(actual.keys() | stored.keys()):
+        expected = round(actual.get(pid, 0.0), 2)
+        current = round(stored[pid], 2) if pid in stored else None
+        if current is None or current != expected:
+            drift.append({'product_id': pid, 'stored': current, 'actual': expected})
+
+    if not drift:
+        return drift
+
+    skus = dict(db.session.query(Product.id, Product.sku).filter(
+        Product.id.in_([d['product_id'] for d in drift])
+    ).all())
+    for d in drift:
+        d['sku'] = skus.get(d['product_id'])
+
+    if not dry_run:
+        ProductStockTotal.query.delete()
+        if actual:
+            db.session.execute(insert(ProductStockTotal), [
+                {'product_id': pid, 'quantity': qty} for pid, qty in actual.items()
+            ])
+        db.session.commit()
+
+    return drift
@@ -0,0 +1,176 @@
+import time
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, insert, update, or_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from ..extensions import db
+from ..models.sunat_token import SunatToken
+from . import http_clients
+
+
+# ==============================================================================
+# CACHÉ DEL TOKEN OAUTH2 DE SUNAT
+# ==============================================================================
+# Antes cada envío/consulta de GRE hacía el POST password-grant a
+# api-seguridad.sunat.gob.pe. El token dura ~1 hora (expires_in), así que ahora:
+#
+# - Se guarda por (SUNAT_CLIENT_ID, TU_RUC) en la tabla sunat_tokens, compartida
+#   por todos los workers, y en memoria del proceso.
+# - Vence SUNAT_TOKEN_SAFETY_MARGIN_SECONDS antes de lo que dice expires_in.
+# - Faltando SUNAT_TOKEN_REFRESH_AHEAD_SECONDS, el primer worker que lo pide
+#   reserva la renovación (refreshing_until) y trae uno nuevo; los demás siguen
+#   usando el vigente mientras tanto.
+# - Si SUNAT responde 401 con un token, get_access_token(rejected_token=...) lo
+#   descarta y fuerza la renovación (o toma el que otro worker ya renovó).
+#
+# Las lecturas/escrituras de la tabla van en su propia conexión: no tocan la
+# transacción de db.session de quien pide el token.
+
+# Si la respuesta no trae expires_in
+DEFAULT_EXPIRES_IN = 3600
+# Segundos que un worker reserva la renovación del token
+REFRESH_LEASE_SECONDS = 30
+# Espera máxima por la renovación de otro worker cuando no hay token vigente
+REFRESH_WAIT_SECONDS = 10
+
+_tokens = {}  # (client_id, ruc) -> (access_token, expires_at)
+_lock = threading.Lock()
+
+
+def _request_token(client_id, ruc):
+    """
+    POST password-grant a SUNAT. Retorna (access_token, expires_in) o (None, None).
+    """
+    try:
+        config = current_app.config
+        token_url = f"{config['SUNAT_SECURITY_URL']}{client_id}/oauth2/token/"
+        data = {
+            'grant_type': 'password',
+            'scope': 'https://api.sunat.gob.pe/v1/contribuyente/contribuyentes',
+            'client_id': client_id,
+            'client_secret': config['SUNAT_CLIENT_SECRET'],
+            'username': f"{ruc}{config['SUNAT_SOL_USER']}",
+            'password': config['SUNAT_SOL_PASS']
+        }
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+        response = http_clients.post('sunat_seguridad', token_url, data=data, headers=headers)
+        if response.status_code == 200:
+            body = response.json()
+            return body.get('access_token'), body.get('expires_in')
+        print(f"Error Token SUNAT: {response.text}")
+        return None, None
+    except Exception as e:
+        print(f"Excepción Token: {e}")
+        return None, None
+
+
+def _expiration(now, expires_in):
+    try:
+        expires_in = int(expires_in)
+    except (TypeError, ValueError):
+        expires_in = DEFAULT_EXPIRES_IN
+    margin = current_app.config.get('SUNAT_TOKEN_SAFETY_MARGIN_SECONDS', 60)
+    # Con un expires_in muy corto el margen no puede dejarlo ya vencido
+    return now + timedelta(seconds=max(expires_in - margin, expires_in // 2))
+
+
+def _usable(token, expires_at, now, rejected_token):
+    return bool(token) and token != rejected_token and expires_at is not None and now < expires_at
+
+
+def _key_filter(table, key):
+    return (table.c.client_id == key[0]) & (table.c.ruc == key[1])
+
+
+def _take_refresh(key, now):
+    """
+    Reserva la renovación para este worker (compare-and-set sobre refreshing_until).
+    """
+    table = SunatToken.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(update(table).where(
+            _key_filter(table, key),
+            or_(table.c.refreshing_until.is_(None), table.c.refreshing_until < now)
+        ).values(refreshing_until=now + timedelta(seconds=REFRESH_LEASE_SECONDS))).rowcount == 1
+
+
+def _refresh(key, current_token):
+    """
+    Pide un token nuevo (con la renovación ya reservada) y lo publica para los demás workers.
+    Si SUNAT no lo entrega, retorna current_token (el vigente, o None).
+    """
+    access_token, expires_in = _request_token(*key)
+    now = datetime.now()
+    values = {'refreshing_until': None, 'updated_at': now}
+    if access_token:
+        values.update(access_token=access_token, expires_at=_expiration(now, expires_in))
+
+    table = SunatToken.__table__
+    with db.engine.begin() as conn:
+        conn.execute(update(table).where(_key_filter(table, key)).values(**values))
+
+    if not access_token:
+        return current_token
+    _tokens[key] = (access_token, values['expires_at'])
+    return access_token
+
+
+def _shared_token(key, rejected_token, ahead):
+    table = SunatToken.__table__
+    deadline = time.monotonic() + REFRESH_WAIT_SECONDS
+    while True:
+        now = datetime.now()
+        with db.engine.begin() as conn:
+            row = conn.execute(select(table.c.access_token, table.c.expires_at)
+                               .where(_key_filter(table, key))).first()
+        if row is None:
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(table).values(client_id=key[0], ruc=key[1], updated_at=now))
+            except IntegrityError:
+                pass  # Otro worker creó la fila al mismo tiempo
+            continue
+
+        token, expires_at = row
+        valid = _usable(token, expires_at, now, rejected_token)
+        if valid and now < expires_at - ahead:
+            _tokens[key] = (token, expires_at)
+            return token
+        if _take_refresh(key, now):
+            return _refresh(key, token if valid else None)
+        if valid:
+            return token  # Otro worker lo está renovando; este aún sirve
+        if time.monotonic() > deadline:
+            print("--- Token SUNAT: la renovación de otro worker no terminó, se pide uno propio ---")
+            access_token, expires_in = _request_token(*key)
+            if access_token:
+                _tokens[key] = (access_token, _expiration(datetime.now(), expires_in))
+            return access_token
+        time.sleep(0.25)
+
+
+def get_access_token(rejected_token=None):
+    """
+    Token OAuth2 vigente de SUNAT (desde la caché o renovado), o None si SUNAT no lo entrega.
+    rejected_token: token que SUNAT acaba de rechazar con 401; no se vuelve a usar.
+    """
+    key = (current_app.config['SUNAT_CLIENT_ID'], current_app.config['TU_RUC'])
+    ahead = timedelta(seconds=current_app.config.get('SUNAT_TOKEN_REFRESH_AHEAD_SECONDS', 300))
+
+    with _lock:
+        token, expires_at = _tokens.get(key, (None, None))
+        if _usable(token, expires_at and expires_at - ahead, datetime.now(), rejected_token):
+            return token
+        try:
+            return _shared_token(key, rejected_token, ahead)
+        except SQLAlchemyError as e:
+            # Sin la tabla (BD sin migrar) el token se pide como antes, sin caché compartida
+            print(f"Error caché de token SUNAT: {e}")
+            access_token, expires_in = _request_token(*key)
+            if access_token:
+                _tokens[key] = (access_token, _expiration(datetime.now(), expires_in))
+            return access_token
@@ -25,4 +25,75 @@ class Config:
     # Te recomiendo mover el PFX a la carpeta 'backend/instance/'
     CERTIFICADO_PFX_PATH = os.environ.get('CERTIFICADO_PFX_PATH') or os.path.join(basedir, 'instance',
                                                                                   'certificado.pfx')
-    CERTIFICADO_PASS = os.environ.get('CERTIFICADO_PASS') or "SOVOS1234"
\ No newline at end of file
+    CERTIFICADO_PASS = os.environ.get('CERTIFICADO_PASS') or "SOVOS1234"
+
+    # --- SUNAT: URLS BASE (apuntar a un simulador local para pruebas, ver scripts/sunat_standin.py) ---
+    SUNAT_SECURITY_URL = os.environ.get('SUNAT_SECURITY_URL') or 'https://api-seguridad.sunat.gob.pe/v1/clientessol/'
+    SUNAT_API_URL = os.environ.get('SUNAT_API_URL') or 'https://api-cpe.sunat.gob.pe/v1/contribuyente/gem/comprobantes/'
+
+    # --- SUNAT: CACHÉ DEL TOKEN OAUTH2 (services/sunat_token_service.py) ---
+    # El token se da por vencido este número de segundos antes de su expires_in
+    SUNAT_TOKEN_SAFETY_MARGIN_SECONDS = int(os.environ.get('SUNAT_TOKEN_SAFETY_MARGIN_SECONDS') or 60)
+    # Faltando menos de esto para el vencimiento, un worker lo renueva mientras los demás siguen usando el actual
+    SUNAT_TOKEN_REFRESH_AHEAD_SECONDS = int(os.environ.get('SUNAT_TOKEN_REFRESH_AHEAD_SECONDS') or 300)
+
+    # --- HTTP: SERVICIOS EXTERNOS (services/http_clients.py) ---
+    # Timeout de conexión; el de lectura depende del servicio (http_clients.UPSTREAMS)
+    HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('HTTP_CONNECT_TIMEOUT_SECONDS') or 3.05)
+    # Reintentos ante error de conexión o 5xx; la espera base se duplica en cada uno (más jitter)
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES') or 2)
+    HTTP_BACKOFF_SECONDS = float(os.environ.get('HTTP_BACKOFF_SECONDS') or 0.5)
+    # Conexiones keep-alive por servicio y por worker
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE') or 10)
+
+    # --- GRE: ENVÍO EN SEGUNDO PLANO (services/gre_dispatch_service.py) ---
+    # Segundos entre revisiones del poller cuando no hay guías por atender
+    GRE_POLL_INTERVAL_SECONDS = float(os.environ.get('GRE_POLL_INTERVAL_SECONDS') or 2)
+    # Espera antes de la primera consulta del ticket; se duplica en cada reintento hasta el máximo
+    GRE_POLL_BASE_DELAY_SECONDS = float(os.environ.get('GRE_POLL_BASE_DELAY_SECONDS') or 3)
+    GRE_POLL_MAX_DELAY_SECONDS = float(os.environ.get('GRE_POLL_MAX_DELAY_SECONDS') or 60)
+    # Intentos (envío o consulta) antes de marcar la guía como 'error'
+    GRE_POLL_MAX_ATTEMPTS = int(os.environ.get('GRE_POLL_MAX_ATTEMPTS') or 15)
+    # Segundos que un worker reserva una guía mientras habla con SUNAT
+    GRE_POLL_LEASE_SECONDS = int(os.environ.get('GRE_POLL_LEASE_SECONDS') or 120)
+    # 1 = cada worker web corre su propio poller (hilo); 0 = solo 'flask gre process-pending'
+    GRE_POLLER_IN_WEB = int(os.environ.get('GRE_POLLER_IN_WEB') or 1)
+
+    # --- AUTH0: CACHÉ DE LLAVES (JWKS) ---
+    # AUTH0_JWKS_URL permite apuntar a un JWKS local (pruebas sin conexión).
+    # Si no se define, se usa https://<AUTH0_DOMAIN>/.well-known/jwks.json
+    AUTH0_JWKS_URL = os.environ.get('AUTH0_JWKS_URL')
+    AUTH0_JWKS_TTL = int(os.environ.get('AUTH0_JWKS_TTL') or 3600)  # Segundos
+
+    # --- AUTH: CACHÉ DE TOKENS VERIFICADOS (LRU por worker) ---
+    AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE') or 1024)
+
+    # --- AUTH: CACHÉ ROL -> PERMISOS ---
+    # Cada cuántos segundos un worker revisa en la BD si otro worker cambió los permisos
+    PERMISSIONS_CACHE_CHECK_INTERVAL = float(os.environ.get('PERMISSIONS_CACHE_CHECK_INTERVAL') or 5)
+
+    # --- KARDEX: EXPORTACIÓN EN STREAMING ---
+    # Filas leídas de la BD (y enviadas al cliente) por bloque
+    KARDEX_EXPORT_CHUNK_SIZE = int(os.environ.get('KARDEX_EXPORT_CHUNK_SIZE') or 2000)
+    # Filas por bloque de NumPy en 'flask inventory verify'
+    KARDEX_VERIFY_CHUNK_SIZE = int(os.environ.get('KARDEX_VERIFY_CHUNK_SIZE') or 200000)
+
+    # --- INVENTARIO: IDEMPOTENCY-KEY EN POST QUE MUEVEN STOCK ---
+    # Horas que se guarda la respuesta de una llave (reintentos dentro de ese plazo se repiten)
+    IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS') or 24)
+    # Segundos tras los cuales una solicitud 'en proceso' sin confirmar se considera abandonada
+    IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS') or 120)
+
+    # --- PDF: TRABAJOS EN SEGUNDO PLANO (POST /api/jobs) ---
+    # Procesos de WeasyPrint por worker de gunicorn
+    RENDER_POOL_WORKERS = int(os.environ.get('RENDER_POOL_WORKERS') or 1)
+    # Máximo de trabajos pendientes (todos los workers); por encima se responde 503
+    RENDER_JOBS_MAX_PENDING = int(os.environ.get('RENDER_JOBS_MAX_PENDING') or 20)
+    # Un trabajo pendiente por más de estos segundos se da por perdido (su worker se detuvo)
+    RENDER_JOB_TIMEOUT_SECONDS = int(os.environ.get('RENDER_JOB_TIMEOUT_SECONDS') or 600)
+    # Horas que se conservan los PDF generados
+    RENDER_JOB_TTL_HOURS = int(os.environ.get('RENDER_JOB_TTL_HOURS') or 24)
+
+    # --- PDF: CACHÉ POR CONTENIDO (instance/pdf_cache) ---
+    # Tamaño máximo en MB; al superarlo se borran los PDF menos usados. 0 = desactivada.
+    PDF_CACHE_MAX_MB = int(os.environ.get('PDF_CACHE_MAX_MB') or 200)
@@ -0,0 +1,32 @@
+"""add cache_generations (invalidación de cachés entre workers)
+
+Revision ID: 1b7e4c9d2a38
+Revises: f7b3d9a1c560
+Create Date: 2026-10-18 14:05:51.220417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b7e4c9d2a38'
+down_revision = 'f7b3d9a1c560'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all() al iniciar la app puede haber creado la tabla antes de migrar
+    if sa.inspect(op.get_bind()).has_table('cache_generations'):
+        return
+
+    op.create_table('cache_generations',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_generations')
@@ -0,0 +1,39 @@
+"""add stock_snapshots (periodic kardex balances)
+
+Revision ID: 2d9f4b8e6c15
+Revises: 7c4d1e9a2f63
+Create Date: 2026-10-17 20:12:33.604127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d9f4b8e6c15'
+down_revision = '7c4d1e9a2f63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all() al iniciar la app puede haber creado la tabla antes de migrar
+    if sa.inspect(op.get_bind()).has_table('stock_snapshots'):
+        return
+
+    op.create_table('stock_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('taken_at', sa.DateTime(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('warehouse_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+        sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('taken_at', 'warehouse_id', 'product_id', name='_snapshot_cutoff_warehouse_product_uc')
+    )
+
+
+def downgrade():
+    op.drop_table('stock_snapshots')
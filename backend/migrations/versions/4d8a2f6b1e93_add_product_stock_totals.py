@@ -0,0 +1,43 @@
+"""add product_stock_totals (stock total por producto) and seed from inventory_stock
+
+Revision ID: 4d8a2f6b1e93
+Revises: 1b7e4c9d2a38
+Create Date: 2026-10-18 14:12:37.904166
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8a2f6b1e93'
+down_revision = '1b7e4c9d2a38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # create_all() al iniciar la app puede haber creado la tabla antes de migrar
+    if not sa.inspect(bind).has_table('product_stock_totals'):
+        op.create_table('product_stock_totals',
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('quantity', sa.Numeric(precision=12, scale=2), nullable=False),
+            sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+            sa.PrimaryKeyConstraint('product_id')
+        )
+
+    # --- BACKFILL: SUM(inventory_stock.quantity) por producto ---
+    # Solo los productos sin fila: si la app atendió movimientos antes de migrar,
+    # apply_stock_deltas() ya sembró (correctamente) los productos que se movieron
+    op.execute(
+        "INSERT INTO product_stock_totals (product_id, quantity) "
+        "SELECT product_id, COALESCE(SUM(quantity), 0) FROM inventory_stock "
+        "WHERE product_id NOT IN (SELECT product_id FROM product_stock_totals) "
+        "GROUP BY product_id"
+    )
+
+
+def downgrade():
+    op.drop_table('product_stock_totals')
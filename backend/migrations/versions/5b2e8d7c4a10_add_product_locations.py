@@ -0,0 +1,97 @@
+"""add product_locations (bin index) and backfill from products.location
+
+Revision ID: 5b2e8d7c4a10
+Revises: 3f6a1c2d9b47
+Create Date: 2026-10-17 16:40:12.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e8d7c4a10'
+down_revision = '3f6a1c2d9b47'
+branch_labels = None
+depends_on = None
+
+
+BIN_MAX_LENGTH = 50
+
+
+def _split_bins(text):
+    bins = []
+    for raw in (text or '').split(','):
+        code = raw.strip()[:BIN_MAX_LENGTH]
+        if code and code not in bins:
+            bins.append(code)
+    return bins
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # create_all() al iniciar la app puede haber creado la tabla antes de migrar
+    if not sa.inspect(bind).has_table('product_locations'):
+        op.create_table('product_locations',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('warehouse_id', sa.Integer(), nullable=True),
+            sa.Column('bin', sa.String(length=50), nullable=False),
+            sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+            sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('product_id', 'warehouse_id', 'bin', name='_product_warehouse_bin_uc')
+        )
+        with op.batch_alter_table('product_locations', schema=None) as batch_op:
+            batch_op.create_index('ix_product_locations_bin_warehouse', ['bin', 'warehouse_id'], unique=False)
+
+    if bind.execute(sa.text("SELECT COUNT(*) FROM product_locations")).scalar():
+        return
+
+    # --- BACKFILL ---
+    # 1. Recepciones: dan el almacén exacto de cada ubicación
+    rows = set()
+    received = bind.execute(sa.text(
+        "SELECT ri.product_id, r.warehouse_id, ri.location "
+        "FROM product_receipt_items ri JOIN product_receipts r ON r.id = ri.receipt_id "
+        "WHERE ri.location IS NOT NULL"
+    )).fetchall()
+    for product_id, warehouse_id, location in received:
+        for code in _split_bins(location):
+            rows.add((product_id, warehouse_id, code))
+
+    # 2. Product.location: las ubicaciones sin recepción se asignan a los almacenes
+    #    donde el producto tiene stock; si no tiene stock en ninguno, quedan sin almacén
+    stock_warehouses = {}
+    for product_id, warehouse_id in bind.execute(sa.text(
+        "SELECT product_id, warehouse_id FROM inventory_stock"
+    )).fetchall():
+        stock_warehouses.setdefault(product_id, []).append(warehouse_id)
+
+    received_bins = {(pid, code) for pid, _, code in rows}
+    for product_id, location in bind.execute(sa.text(
+        "SELECT id, location FROM products WHERE location IS NOT NULL"
+    )).fetchall():
+        for code in _split_bins(location):
+            if (product_id, code) in received_bins:
+                continue
+            for warehouse_id in stock_warehouses.get(product_id) or [None]:
+                rows.add((product_id, warehouse_id, code))
+
+    if rows:
+        table = sa.table('product_locations',
+                         sa.column('product_id', sa.Integer),
+                         sa.column('warehouse_id', sa.Integer),
+                         sa.column('bin', sa.String))
+        op.bulk_insert(table, [
+            {'product_id': pid, 'warehouse_id': wid, 'bin': code}
+            for pid, wid, code in sorted(rows, key=lambda r: (r[0], r[1] or 0, r[2]))
+        ])
+
+
+def downgrade():
+    with op.batch_alter_table('product_locations', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_locations_bin_warehouse')
+
+    op.drop_table('product_locations')
@@ -0,0 +1,44 @@
+"""add idempotency_keys (Idempotency-Key de POST que mueven stock)
+
+Revision ID: 6e1a9c3f7b28
+Revises: 2d9f4b8e6c15
+Create Date: 2026-10-17 22:41:09.318254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1a9c3f7b28'
+down_revision = '2d9f4b8e6c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all() al iniciar la app puede haber creado la tabla antes de migrar
+    if sa.inspect(op.get_bind()).has_table('idempotency_keys'):
+        return
+
+    op.create_table('idempotency_keys',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.String(length=255), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('endpoint', sa.String(length=100), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('state', sa.String(length=20), nullable=False),
+        sa.Column('response_status', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.Text(), nullable=True),
+        sa.Column('response_mimetype', sa.String(length=100), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'key', name='_idempotency_user_key_uc')
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,48 @@
+"""add inventory_daily_movements (resumen diario del kardex)
+
+Revision ID: a47c2e5d9f31
+Revises: 6e1a9c3f7b28
+Create Date: 2026-10-17 23:18:52.740611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a47c2e5d9f31'
+down_revision = '6e1a9c3f7b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # create_all() al iniciar la app puede haber creado la tabla (vacía) antes de migrar
+    if not sa.inspect(bind).has_table('inventory_daily_movements'):
+        op.create_table('inventory_daily_movements',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('warehouse_id', sa.Integer(), nullable=False),
+            sa.Column('entries', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('exits', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.Column('closing_quantity', sa.Numeric(precision=14, scale=2), nullable=False),
+            sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+            sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('product_id', 'warehouse_id', 'day', name='_daily_product_warehouse_day_uc')
+        )
+        op.create_index('ix_inventory_daily_movements_day', 'inventory_daily_movements', ['day'], unique=False)
+
+    # Carga el historial del Kardex (misma lógica que 'flask inventory rollup'), salvo que ya tenga datos
+    if bind.execute(sa.text('SELECT COUNT(*) FROM inventory_daily_movements')).scalar():
+        return
+    from app.services.daily_movement_service import backfill_daily_movements
+    total = backfill_daily_movements(bind)
+    print(f"--- inventory_daily_movements: {total} filas cargadas desde el Kardex ---")
+
+
+def downgrade():
+    op.drop_index('ix_inventory_daily_movements_day', table_name='inventory_daily_movements')
+    op.drop_table('inventory_daily_movements')
@@ -0,0 +1,41 @@
+"""add render_jobs (PDF en segundo plano)
+
+Revision ID: c3b8f1e6a924
+Revises: a47c2e5d9f31
+Create Date: 2026-10-18 00:07:41.552816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3b8f1e6a924'
+down_revision = 'a47c2e5d9f31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all() al iniciar la app puede haber creado la tabla antes de migrar
+    if sa.inspect(op.get_bind()).has_table('render_jobs'):
+        return
+
+    op.create_table('render_jobs',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('job_type', sa.String(length=50), nullable=False),
+        sa.Column('user_id', sa.String(length=255), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_render_jobs_status_created_at', 'render_jobs', ['status', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_render_jobs_status_created_at', table_name='render_jobs')
+    op.drop_table('render_jobs')
@@ -0,0 +1,56 @@
+"""add gre_submissions (envío de GRE en segundo plano)
+
+Revision ID: e5d2a7c4b183
+Revises: c3b8f1e6a924
+Create Date: 2026-10-18 01:12:05.318440
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5d2a7c4b183'
+down_revision = 'c3b8f1e6a924'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all() al iniciar la app puede haber creado la tabla antes de migrar
+    if sa.inspect(op.get_bind()).has_table('gre_submissions'):
+        return
+
+    op.create_table('gre_submissions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('gre_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.String(length=255), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('zip_name', sa.String(length=100), nullable=False),
+        sa.Column('zip_base64', sa.Text(), nullable=True),
+        sa.Column('hash_zip', sa.String(length=64), nullable=True),
+        sa.Column('digest_value', sa.String(length=255), nullable=True),
+        sa.Column('ticket', sa.String(length=50), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('origin_address', sa.String(length=255), nullable=True),
+        sa.Column('origin_warehouse_id', sa.Integer(), nullable=True),
+        sa.Column('cost_center_id', sa.Integer(), nullable=True),
+        sa.Column('transfer_id', sa.Integer(), nullable=True),
+        sa.Column('sunat_response', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['gre_id'], ['gre.id'], ),
+        sa.ForeignKeyConstraint(['transfer_id'], ['stock_transfers.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('gre_id')
+    )
+    op.create_index('ix_gre_submissions_status_next_attempt_at', 'gre_submissions', ['status', 'next_attempt_at'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_gre_submissions_status_next_attempt_at', table_name='gre_submissions')
+    op.drop_table('gre_submissions')
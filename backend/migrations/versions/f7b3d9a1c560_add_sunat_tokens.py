@@ -0,0 +1,38 @@
+"""add sunat_tokens (caché compartida del token OAuth2 de SUNAT)
+
+Revision ID: f7b3d9a1c560
+Revises: e5d2a7c4b183
+Create Date: 2026-10-18 09:41:27.506113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7b3d9a1c560'
+down_revision = 'e5d2a7c4b183'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all() al iniciar la app puede haber creado la tabla antes de migrar
+    if sa.inspect(op.get_bind()).has_table('sunat_tokens'):
+        return
+
+    op.create_table('sunat_tokens',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.String(length=100), nullable=False),
+        sa.Column('ruc', sa.String(length=11), nullable=False),
+        sa.Column('access_token', sa.Text(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.Column('refreshing_until', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('client_id', 'ruc', name='_sunat_token_client_ruc_uc')
+    )
+
+
+def downgrade():
+    op.drop_table('sunat_tokens')
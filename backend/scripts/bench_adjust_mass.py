@@ -0,0 +1,61 @@
+# Benchmark del ajuste masivo (/api/inventory/adjust-mass) con una hoja sintética.
+# Usa una BD SQLite temporal, NO toca instance/app.db.
+#
+#   python -m scripts.bench_adjust_mass            (50.000 filas)
+#   python -m scripts.bench_adjust_mass 20000
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DB = os.path.join(tempfile.mkdtemp(), 'bench_adjust.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{BENCH_DB}"
+
+import pandas as pd
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models.product_catalog import Product, Category
+from app.models.inventory_models import InventoryStock
+from app.models.warehouse import Warehouse
+from app.services.stock_adjustment_service import apply_mass_adjustment
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+app = create_app()
+
+with app.app_context():
+    category = Category.query.first()
+    warehouse = Warehouse.query.first()
+
+    print(f"--- Creando {ROWS} productos y stock inicial ---")
+    db.session.execute(insert(Product), [
+        {'sku': f"BENCH-{i:06d}", 'name': f"Producto {i}", 'standard_price': 1.0, 'category_id': category.id}
+        for i in range(ROWS)
+    ])
+    product_ids = dict(db.session.query(Product.sku, Product.id).filter(Product.sku.like('BENCH-%')).all())
+    # La mitad de los productos ya tiene stock en el almacén
+    db.session.execute(insert(InventoryStock), [
+        {'product_id': product_ids[f"BENCH-{i:06d}"], 'warehouse_id': warehouse.id, 'quantity': 10}
+        for i in range(0, ROWS, 2)
+    ])
+    db.session.commit()
+
+    # Hoja: cantidades nuevas, algunas iguales (sin cambio), algunas ubicaciones
+    # y un 1% de SKUs inexistentes para ejercitar el reporte de errores.
+    sheet = pd.DataFrame({
+        'SKU': [f"BENCH-{i:06d}" if i % 100 else f"NOEXISTE-{i}" for i in range(ROWS)],
+        'Cantidad': [10 if i % 4 == 0 else i % 37 for i in range(ROWS)],
+        'Locacion': [f"R{i % 50}-N{i % 5}" if i % 3 == 0 else None for i in range(ROWS)]
+    })
+
+    start = time.perf_counter()
+    result = apply_mass_adjustment(sheet, warehouse.id, 'bench')
+    db.session.commit()
+    elapsed = time.perf_counter() - start
+
+    print(f"Filas: {ROWS}")
+    print(f"Ajustadas: {result['updated_products']} | Errores: {len(result['errors'])}")
+    print(f"Tiempo: {elapsed:.2f} s ({ROWS / elapsed:,.0f} filas/s)")
+
+os.remove(BENCH_DB)
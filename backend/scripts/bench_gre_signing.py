@@ -0,0 +1,118 @@
+# Benchmark de firma de GRE (un proceso = un núcleo): firmar_xml anterior (lee el
+# PFX, descifra el PKCS#12 y serializa llave y certificado a PEM en cada firma) vs
+# firmar_xml con la llave, el certificado y el XMLSigner en caché del proceso.
+# Usa CERTIFICADO_PFX_PATH si existe; si no, genera un certificado de prueba temporal.
+# También verifica que ambas versiones produzcan exactamente el mismo XML firmado.
+#
+#   python -m scripts.bench_gre_signing          (100 guías)
+#   python -m scripts.bench_gre_signing 500      (500 guías)
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import pkcs12, BestAvailableEncryption
+from cryptography.x509.oid import NameOID
+from lxml import etree
+from signxml import XMLSigner, methods
+
+from app import create_app
+from app.services import gre_service
+from app.services.gre_service import NSMAP, crear_xml_guia_remision, firmar_xml
+
+GUIDES = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+
+def create_test_pfx(password):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'Certificado de prueba GRE')])
+    now = datetime.now(timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now).not_valid_after(now + timedelta(days=30))
+            .sign(key, hashes.SHA256()))
+    path = os.path.join(tempfile.mkdtemp(), 'certificado.pfx')
+    with open(path, 'wb') as f:
+        f.write(pkcs12.serialize_key_and_certificates(b'gre', key, cert, None, BestAvailableEncryption(password.encode('utf-8'))))
+    return path
+
+
+def build_guides():
+    return [crear_xml_guia_remision({
+        'serie': 'T001', 'numero': i, 'fecha_de_emision': date(2026, 1, 5), 'fecha_de_inicio_de_traslado': date(2026, 1, 5),
+        'cliente_tipo_de_documento': '6', 'cliente_numero_de_documento': '20123456789', 'cliente_denominacion': 'Cliente S.A.C.',
+        'motivo_de_traslado': '04', 'motivo': 'Traslado entre establecimientos', 'peso_bruto_total': 10,
+        'punto_de_partida_ubigeo': '150101', 'punto_de_partida_direccion': 'Av. Origen 100',
+        'punto_de_llegada_ubigeo': '150101', 'punto_de_llegada_direccion': 'Av. Destino 200',
+        'tipo_de_transporte': '02', 'transportista_placa_numero': 'ABC123',
+        'conductor_documento_tipo': '1', 'conductor_documento_numero': '12345678',
+        'conductor_nombre': 'Juan', 'conductor_apellidos': 'Pérez', 'licencia': 'Q12345678',
+        'items': [{'codigo': f"SKU-{j:05d}", 'descripcion': f"Producto {j}", 'cantidad': 3, 'unidad_de_medida': 'NIU'}
+                  for j in range(5)]
+    }) for i in range(1, GUIDES + 1)]
+
+
+def legacy_firmar_xml(xml_string_sin_firmar, certificado_path, certificado_pass):
+    """
+    firmar_xml anterior: todo el trabajo con el PFX en cada firma.
+    """
+    from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat
+
+    with open(certificado_path, "rb") as f:
+        pfx_data = f.read()
+    root = etree.fromstring(xml_string_sin_firmar)
+    password_bytes = certificado_pass.encode('utf-8') if certificado_pass else None
+    private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(pfx_data, password_bytes)
+    private_key_bytes = private_key.private_bytes(Encoding.PEM, PrivateFormat.TraditionalOpenSSL, NoEncryption())
+    certificate_bytes = certificate.public_bytes(Encoding.PEM)
+
+    signer = XMLSigner(method=methods.enveloped, digest_algorithm='sha256', signature_algorithm='rsa-sha256',
+                       c14n_algorithm='http://www.w3.org/2001/10/xml-exc-c14n#')
+    signed_root = signer.sign(root, key=private_key_bytes, cert=certificate_bytes)
+
+    xpath_nsmap = {k: v for k, v in NSMAP.items() if k is not None}
+    signature_node = signed_root.xpath("//ds:Signature", namespaces=xpath_nsmap)[0]
+    extension_content_node = \
+        signed_root.xpath("//ext:UBLExtensions/ext:UBLExtension/ext:ExtensionContent", namespaces=xpath_nsmap)[0]
+    signature_node.set("Id", "Sign")
+    extension_content_node.append(signature_node)
+    return etree.tostring(signed_root, pretty_print=True, xml_declaration=True, encoding='utf-8')
+
+
+def measure(sign, guides):
+    start = time.perf_counter()
+    signed = [sign(xml) for xml in guides]
+    return time.perf_counter() - start, signed
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        app.config.setdefault('TU_RUC', '20000000000')
+        if not os.path.exists(app.config['CERTIFICADO_PFX_PATH']):
+            app.config['CERTIFICADO_PASS'] = 'bench'
+            app.config['CERTIFICADO_PFX_PATH'] = create_test_pfx('bench')
+        path, password = app.config['CERTIFICADO_PFX_PATH'], app.config['CERTIFICADO_PASS']
+        guides = build_guides()
+
+        legacy_firmar_xml(guides[0], path, password)  # Calienta imports
+        before, legacy = measure(lambda xml: legacy_firmar_xml(xml, path, password), guides)
+
+        gre_service._firma = None
+        start = time.perf_counter()
+        firmar_xml(guides[0], 'bench')
+        first = (time.perf_counter() - start) * 1000
+        after, cached = measure(lambda xml: firmar_xml(xml, 'bench'), guides)
+
+        print(f"--- {GUIDES} guías, 1 proceso ---")
+        print(f"antes:   {before:6.2f} s  ({GUIDES / before:7.1f} guías/s, {before / GUIDES * 1000:6.1f} ms por firma)")
+        print(f"después: {after:6.2f} s  ({GUIDES / after:7.1f} guías/s, {after / GUIDES * 1000:6.1f} ms por firma)"
+              f"  | primera firma (descifra el PFX): {first:.1f} ms")
+        print(f"XML firmado idéntico: {legacy == cached}")
+
+
+if __name__ == '__main__':
+    main()
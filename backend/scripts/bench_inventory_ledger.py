@@ -0,0 +1,75 @@
+# Benchmark de inventory_ledger.apply_movements frente al flujo anterior
+# (un UPDATE atómico + un INSERT de Kardex por línea).
+# Usa una BD SQLite temporal, NO toca instance/app.db.
+#
+#   python -m scripts.bench_inventory_ledger            (5.000 movimientos)
+#   python -m scripts.bench_inventory_ledger 20000
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DB = os.path.join(tempfile.mkdtemp(), 'bench_ledger.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{BENCH_DB}"
+
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models.product_catalog import Product, Category
+from app.models.inventory_models import InventoryStock, InventoryTransaction
+from app.models.warehouse import Warehouse
+from app.services.inventory_ledger import apply_movements, Movement
+from app.services.stock_service import change_stock
+from app.services.stock_total_service import apply_stock_deltas, sum_deltas
+
+MOVEMENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+
+def per_line(movements, user_id):
+    """Flujo anterior: una sentencia de stock y un Kardex por movimiento."""
+    for m in movements:
+        new_quantity = change_stock(m.product_id, m.warehouse_id, m.delta, require_available=m.require_available)
+        if new_quantity is None:
+            raise ValueError("Stock insuficiente.")
+        db.session.add(InventoryTransaction(
+            product_id=m.product_id, warehouse_id=m.warehouse_id, quantity_change=m.delta,
+            new_quantity=new_quantity, type=m.type, user_id=user_id, reference=m.reference
+        ))
+    apply_stock_deltas(sum_deltas((m.product_id, m.delta) for m in movements))
+
+
+app = create_app()
+
+with app.app_context():
+    category = Category.query.first()
+    origin, destination = Warehouse.query.order_by(Warehouse.id).limit(2).all()
+    products = MOVEMENTS // 2
+
+    print(f"--- Creando {products} productos con stock en el almacén de origen ---")
+    db.session.execute(insert(Product), [
+        {'sku': f"LEDGER-{i:06d}", 'name': f"Producto {i}", 'standard_price': 1.0, 'category_id': category.id}
+        for i in range(products)
+    ])
+    product_ids = [pid for (pid,) in db.session.query(Product.id).filter(Product.sku.like('LEDGER-%')).all()]
+    db.session.execute(insert(InventoryStock), [
+        {'product_id': pid, 'warehouse_id': origin.id, 'quantity': 1000} for pid in product_ids
+    ])
+    db.session.commit()
+
+    # Una transferencia grande: salida del origen + entrada al destino por producto
+    def transfer(reference):
+        movements = []
+        for pid in product_ids:
+            movements.append(Movement(pid, origin.id, -1, "Transferencia Salida", reference, require_available=True))
+            movements.append(Movement(pid, destination.id, 1, "Transferencia Entrada", reference))
+        return movements
+
+    for label, apply in (("Línea por línea", per_line), ("Ledger en bloque", apply_movements)):
+        movements = transfer(label)
+        start = time.perf_counter()
+        apply(movements, 'bench')
+        db.session.commit()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<17} {len(movements)} movimientos en {elapsed:.2f} s ({len(movements) / elapsed:,.0f} mov/s)")
+
+os.remove(BENCH_DB)
@@ -0,0 +1,43 @@
+# Benchmark del motor de etiquetas (PDF) con 5.000 etiquetas.
+# Usa instance/logo_v2.png si existe; si no, genera un logo de prueba temporal.
+#
+#   python -m scripts.bench_labels              (5.000 etiquetas)
+#   python -m scripts.bench_labels 20000        (20.000 etiquetas)
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from app.services.label_service import render_labels_pdf, expand_labels, _logo_cache
+
+LABELS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+
+def main():
+    logo_path = os.path.join(os.path.dirname(__file__), '..', 'instance', 'logo_v2.png')
+    if not os.path.exists(logo_path):
+        logo_path = os.path.join(tempfile.mkdtemp(), 'logo_v2.png')
+        Image.new('RGB', (600, 200), (20, 60, 140)).save(logo_path)
+
+    products = [
+        {'product_sku': f"SKU-{i:05d}", 'product_name': f"Cable de cobre {i} mm x 100 m", 'quantity': 1}
+        for i in range(LABELS)
+    ]
+    labels = expand_labels(products)
+
+    print(f"--- {LABELS} etiquetas ---")
+
+    _logo_cache.clear()
+    start = time.perf_counter()
+    pdf = render_labels_pdf(labels, logo_path)
+    print(f"PDF (primera vez, decodifica logo): {time.perf_counter() - start:.2f} s | {len(pdf) / 1024:,.0f} KB")
+
+    start = time.perf_counter()
+    render_labels_pdf(labels, logo_path)
+    print(f"PDF (logo en caché):                {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
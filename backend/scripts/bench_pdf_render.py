@@ -0,0 +1,125 @@
+# Benchmark de WeasyPrint por plantilla: renderizado anterior (CSS en <style>,
+# imágenes como data URI, FontConfiguration nueva en cada PDF) vs pdf_renderer
+# (CSS precompilado, FontConfiguration del proceso, imágenes desde memoria).
+# No necesita datos en la BD: arma contextos de prueba para cada plantilla.
+# Usa instance/logo_v2.png si existe; si no, genera un logo de prueba temporal.
+#
+#   python -m scripts.bench_pdf_render              (20 renderizados por plantilla, 40 filas)
+#   python -m scripts.bench_pdf_render 50 200       (50 renderizados, 200 filas por reporte)
+import base64
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+from PIL import Image
+
+from app import create_app
+from app.services import pdf_renderer
+from app.services.gre_service import documento_pdf_guia
+from app.services.pdf_renderer import ASSET_SCHEME, asset_url, stylesheet_source
+from app.services.render_job_service import PdfDocument, render_html
+
+REPEAT = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+ROWS = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+
+def load_logo():
+    logo_path = os.path.join(os.path.dirname(__file__), '..', 'instance', 'logo_v2.png')
+    if not os.path.exists(logo_path):
+        logo_path = os.path.join(tempfile.mkdtemp(), 'logo_v2.png')
+        Image.new('RGB', (600, 200), (20, 60, 140)).save(logo_path)
+    with open(logo_path, 'rb') as f:
+        return f.read()
+
+
+def build_documents(logo):
+    stock_rows = [{
+        'codigo': f"SKU-{i:05d}", 'descripcion': f"Cable de cobre {i} mm x 100 m", 'unidad': 'UND',
+        'saldo_inicial': 10.0, 'entradas': 5.0, 'salidas': 3.0, 'stock_final': 12.0,
+        'costo_prom': 7.5, 'importe': 90.0
+    } for i in range(ROWS)]
+    stock = PdfDocument('stock_report.html', {
+        'data': stock_rows, 'start_date': '01/01/2026', 'end_date': '31/01/2026',
+        'warehouse_name': 'Almacén Central', 'currency': 'SOLES',
+        'total_importe': sum(row['importe'] for row in stock_rows)
+    }, 'Stock_Reporte.pdf')
+
+    gres = [{
+        'serie': 'T001', 'numero': i, 'fecha_emision': '2026-01-05', 'destinatario': 'Cliente S.A.C.', 'total_gre': 45.0,
+        'items': [{'descripcion': f"Producto {j}", 'unidad': 'UND', 'cantidad': 3.0, 'unit_price': 5.0} for j in range(3)]
+    } for i in range(max(ROWS // 4, 1))]
+    cost = PdfDocument('cost_report.html', {
+        'data': [{'cost_center_code': 'CC1', 'total_cc': 45.0 * len(gres), 'gres': gres}],
+        'start_date': '2026-01-01', 'end_date': '2026-01-31', 'grand_total': 45.0 * len(gres)
+    }, 'Reporte_Costos.pdf')
+
+    items = [{'descripcion': f"Servicio {i}", 'unidad': 'UND', 'cantidad': 2.0, 'pu': 50.0, 'total': 100.0}
+             for i in range(ROWS // 2)]
+    purchase = PdfDocument('purchase_order_weasy.html', {
+        'logo_url': asset_url('logo.png'), 'titulo_doc': 'ORDEN DE COMPRA', 'tipo': 'OC', 'codigo': '001-1',
+        'proveedor_nombre': 'Proveedor S.A.C.', 'proveedor_direccion': 'Av. Principal 123', 'proveedor_ruc': '20123456789',
+        'contacto': '-', 'referencia': '-', 'atencion': '-', 'cc_codigo': 'CC1', 'fecha_emision': '05/01/2026',
+        'items': items, 'alcance': None, 'simbolo': 'S/.', 'subtotal': 100.0 * len(items),
+        'igv': 18.0 * len(items), 'total': 118.0 * len(items), 'condiciones': ['Forma de Pago: Contado'] * 6
+    }, 'Orden.pdf', assets={'logo.png': logo})
+
+    guia = documento_pdf_guia({
+        'serie': 'T001', 'numero': 5, 'fecha_de_emision': date(2026, 1, 5), 'fecha_de_inicio_de_traslado': date(2026, 1, 5),
+        'punto_de_partida_direccion': 'Av. Origen 100', 'punto_de_llegada_direccion': 'Av. Destino 200',
+        'cliente_denominacion': 'Cliente S.A.C.', 'cliente_numero_de_documento': '20123456789',
+        'cliente_tipo_de_documento': '6', 'motivo_de_traslado': '04',
+        'items': [{'codigo': f"SKU-{i:05d}", 'descripcion': f"Producto {i}", 'unidad': 'NIU', 'cantidad': 3}
+                  for i in range(ROWS // 2)]
+    }, 'https://e-factura.sunat.gob.pe/v1/contribuyente/gre/comprobantes/descargaqr?hashqr=benchmark')
+    guia.context['data']['logo_path'] = asset_url('logo.png')
+    guia = guia._replace(assets={**guia.assets, 'logo.png': logo})
+
+    return [stock, cost, purchase, guia]
+
+
+def legacy_write_pdf(html, document):
+    """
+    Renderizado anterior: CSS dentro del HTML, imágenes en base64, sin FontConfiguration compartida.
+    """
+    from weasyprint import HTML
+
+    html = html.replace('</head>', f"<style>\n{stylesheet_source(document.template)}</style>\n</head>", 1)
+    for name, data in (document.assets or {}).items():
+        html = html.replace(f"{ASSET_SCHEME}{name}", f"data:image/png;base64,{base64.b64encode(data).decode('utf-8')}")
+    return HTML(string=html, base_url=document.base_url).write_pdf()
+
+
+def measure(render):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        render()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        app.config.setdefault('TU_RUC', '20000000000')
+        documents = build_documents(load_logo())
+
+        print(f"--- {REPEAT} renderizados por plantilla, {ROWS} filas ---")
+        for document in documents:
+            html = render_html(document)
+
+            legacy_write_pdf(html, document)  # Calienta imports de WeasyPrint
+            before = measure(lambda: legacy_write_pdf(html, document))
+
+            pdf_renderer._stylesheets.clear()
+            start = time.perf_counter()
+            pdf = pdf_renderer.write_pdf(html, document.base_url, document.template, document.assets)
+            first = (time.perf_counter() - start) * 1000
+            after = measure(lambda: pdf_renderer.write_pdf(html, document.base_url, document.template, document.assets))
+
+            print(f"{document.template:<28} antes: {before:7.1f} ms | después: {after:7.1f} ms "
+                  f"(primera, compila CSS: {first:7.1f} ms) | {len(pdf) / 1024:,.0f} KB")
+
+
+if __name__ == '__main__':
+    main()
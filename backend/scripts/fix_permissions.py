@@ -1,6 +1,7 @@
 from app import create_app, db
 from app.models.role import Role
 from app.models.permission import Permission
+from app.services.auth_service import permission_cache
 
 app = create_app()
 
@@ -35,6 +36,8 @@ with app.app_context():
                 perm_obj = Permission.query.filter_by(name=p_name).first()
                 role.permissions.append(perm_obj)
         
+        # Avisar a los workers en ejecución que los permisos cambiaron
+        permission_cache.invalidate()
         db.session.commit()
         
     # 3. Verify
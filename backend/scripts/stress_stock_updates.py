@@ -0,0 +1,167 @@
+# Prueba de estrés: varios procesos moviendo el MISMO stock a la vez.
+# Verifica que no se pierdan actualizaciones (el saldo final cuadra con las operaciones hechas).
+# Cada operación se aplica con inventory_ledger.apply_movements, como en los endpoints.
+#
+#   python -m scripts.stress_stock_updates                  (4 procesos x 300 operaciones)
+#   python -m scripts.stress_stock_updates 8 500
+#   python -m scripts.stress_stock_updates 4 300 --legacy   (lectura en Python + escritura: pierde datos)
+#
+# Usa una BD SQLite temporal. Para probar contra otro motor: STRESS_DATABASE_URL=postgresql://...
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Los procesos hijos heredan STRESS_DATABASE_URL, así todos usan la misma BD
+if 'STRESS_DATABASE_URL' not in os.environ:
+    os.environ['STRESS_DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stress_stock.db')}"
+os.environ['DATABASE_URL'] = os.environ['STRESS_DATABASE_URL']
+
+INITIAL_A = 100.0
+INITIAL_B = 0.0
+SKU = 'STRESS-001'
+
+
+def _make_app():
+    from app import create_app
+    with contextlib.redirect_stdout(io.StringIO()):
+        return create_app()
+
+
+def _setup():
+    from app import db
+    from app.models.product_catalog import Product, Category
+    from app.models.warehouse import Warehouse
+    from app.models.inventory_models import InventoryStock, ProductStockTotal
+
+    app = _make_app()
+    with app.app_context():
+        warehouses = Warehouse.query.order_by(Warehouse.id).limit(2).all()
+        product = Product(sku=SKU, name='Producto de estrés', standard_price=1.0,
+                          category_id=Category.query.first().id)
+        db.session.add(product)
+        db.session.flush()
+        db.session.add(InventoryStock(product_id=product.id, warehouse_id=warehouses[0].id, quantity=INITIAL_A))
+        db.session.add(InventoryStock(product_id=product.id, warehouse_id=warehouses[1].id, quantity=INITIAL_B))
+        db.session.add(ProductStockTotal(product_id=product.id, quantity=INITIAL_A + INITIAL_B))
+        db.session.commit()
+        return product.id, warehouses[0].id, warehouses[1].id
+
+
+def _legacy_change(product_id, warehouse_id, delta, require_available=False):
+    """Patrón anterior: leer en Python, calcular y escribir el valor absoluto."""
+    from app.models.inventory_models import InventoryStock
+    stock = InventoryStock.query.filter_by(product_id=product_id, warehouse_id=warehouse_id).first()
+    current = float(stock.quantity)
+    if require_available and current < -delta:
+        return None
+    time.sleep(0.001)  # Ventana típica entre leer y escribir en un request real
+    stock.quantity = current + delta
+    return current + delta
+
+
+def _legacy_apply(moves, user_id):
+    """Aplica [Movement, ...] con el patrón anterior (Kardex y totales incluidos)."""
+    from app import db
+    from app.models.inventory_models import InventoryTransaction
+    from app.services.stock_service import InsufficientStockError
+    from app.services.stock_total_service import apply_stock_deltas, sum_deltas
+
+    for m in moves:
+        new_qty = _legacy_change(m.product_id, m.warehouse_id, m.delta, m.require_available)
+        if new_qty is None:
+            raise InsufficientStockError("Stock insuficiente.")
+        db.session.add(InventoryTransaction(
+            product_id=m.product_id, warehouse_id=m.warehouse_id, quantity_change=m.delta,
+            new_quantity=new_qty, type=m.type, user_id=user_id
+        ))
+    apply_stock_deltas(sum_deltas((m.product_id, m.delta) for m in moves))
+
+
+def _worker(args):
+    worker_id, operations, product_id, wh_a, wh_b, legacy = args
+
+    from sqlalchemy.exc import OperationalError
+    from app import db
+    from app.services.inventory_ledger import apply_movements, Movement
+    from app.services.stock_service import InsufficientStockError
+
+    apply = _legacy_apply if legacy else apply_movements
+    app = _make_app()
+    rng = random.Random(worker_id)
+    done = {'in': 0, 'move': 0, 'out': 0, 'rejected': 0, 'retries': 0}
+
+    with app.app_context():
+        for _ in range(operations):
+            op = rng.choice(('in', 'move', 'move', 'out'))
+            if op == 'in':
+                moves = [Movement(product_id, wh_a, 1, 'Estrés')]
+            elif op == 'move':
+                moves = [Movement(product_id, wh_a, -1, 'Estrés', require_available=True),
+                         Movement(product_id, wh_b, 1, 'Estrés')]
+            else:
+                moves = [Movement(product_id, wh_b, -1, 'Estrés', require_available=True)]
+
+            while True:
+                try:
+                    apply(moves, f'worker-{worker_id}')
+                    db.session.commit()
+                    done[op] += 1
+                    break
+                except InsufficientStockError:
+                    db.session.rollback()
+                    done['rejected'] += 1
+                    break
+                except OperationalError:
+                    # SQLite: "database is locked" si la espera supera el timeout -> reintentar
+                    db.session.rollback()
+                    done['retries'] += 1
+    return done
+
+
+def main():
+    positional = [a for a in sys.argv[1:] if not a.startswith('--')]
+    processes = int(positional[0]) if len(positional) > 0 else 4
+    operations = int(positional[1]) if len(positional) > 1 else 300
+    legacy = '--legacy' in sys.argv
+
+    product_id, wh_a, wh_b = _setup()
+    print(f"--- {processes} procesos x {operations} operaciones ({'LEGACY' if legacy else 'atómico'}) ---")
+
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(processes) as pool:
+        results = pool.map(_worker, [(i, operations, product_id, wh_a, wh_b, legacy) for i in range(processes)])
+    elapsed = time.perf_counter() - start
+
+    totals = {k: sum(r[k] for r in results) for k in results[0]}
+    expected_a = INITIAL_A + totals['in'] - totals['move']
+    expected_b = INITIAL_B + totals['move'] - totals['out']
+
+    from app import db
+    from app.models.inventory_models import InventoryStock, InventoryTransaction, ProductStockTotal
+    app = _make_app()
+    with app.app_context():
+        actual_a = float(InventoryStock.query.filter_by(product_id=product_id, warehouse_id=wh_a).one().quantity)
+        actual_b = float(InventoryStock.query.filter_by(product_id=product_id, warehouse_id=wh_b).one().quantity)
+        actual_total = float(db.session.get(ProductStockTotal, product_id).quantity)
+        kardex_rows = InventoryTransaction.query.filter_by(product_id=product_id).count()
+
+    print(f"Operaciones: {totals} en {elapsed:.1f} s")
+    print(f"Almacén A: esperado {expected_a:.0f} | real {actual_a:.0f}")
+    print(f"Almacén B: esperado {expected_b:.0f} | real {actual_b:.0f}")
+    print(f"Total:     esperado {expected_a + expected_b:.0f} | real {actual_total:.0f}")
+    print(f"Kardex:    esperado {totals['in'] + 2 * totals['move'] + totals['out']} | real {kardex_rows}")
+
+    ok = (actual_a == expected_a and actual_b == expected_b and actual_total == expected_a + expected_b
+          and actual_a >= 0 and actual_b >= 0)
+    print("OK: sin actualizaciones perdidas." if ok else "FALLO: se perdieron actualizaciones.")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Simulador local de SUNAT (token OAuth2, envío de GRE y consulta de ticket) para
+# probar el envío en segundo plano sin conexión ni credenciales reales.
+#
+#   python -m scripts.sunat_standin                        (puerto 5055; 2 consultas "en proceso" y luego acepta)
+#   python -m scripts.sunat_standin --pending 5 --reject   (5 consultas en proceso y luego rechaza)
+#   python -m scripts.sunat_standin --token-ttl 90          (tokens de 90 s; los vencidos reciben 401)
+#
+# Y en el backend (la firma usa el certificado de CERTIFICADO_PFX_PATH, como siempre):
+#   SUNAT_SECURITY_URL=http://localhost:5055/v1/clientessol/
+#   SUNAT_API_URL=http://localhost:5055/v1/contribuyente/gem/comprobantes/
+import argparse
+import base64
+import io
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+
+from flask import Flask, jsonify, request
+
+CDR_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<ar:ApplicationResponse xmlns:ar="urn:oasis:names:specification:ubl:schema:xsd:ApplicationResponse-2"
+    xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+    xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+  <cbc:ResponseDate>{fecha}</cbc:ResponseDate>
+  <cac:DocumentResponse>
+    <cac:Response><cbc:ResponseCode>0</cbc:ResponseCode>
+      <cbc:Description>La Guia numero {documento}, ha sido aceptada</cbc:Description></cac:Response>
+    <cac:DocumentReference><cbc:ID>{documento}</cbc:ID>
+      <cbc:DocumentDescription>https://e-factura.sunat.gob.pe/v1/contribuyente/gre/comprobantes/descargaqr?hashqr=standin-{ticket}</cbc:DocumentDescription>
+    </cac:DocumentReference>
+  </cac:DocumentResponse>
+</ar:ApplicationResponse>
+"""
+
+
+def create_standin(pending=2, reject=False, token_ttl=3600):
+    app = Flask(__name__)
+    tickets = {}  # ticket -> {'documento': ..., 'consultas': n}
+    tokens = {}  # access_token -> vencimiento
+    app.config['TOKENS_EMITIDOS'] = 0
+
+    def token_valido():
+        auth = request.headers.get('Authorization', '')
+        vence = tokens.get(auth[len('Bearer '):]) if auth.startswith('Bearer ') else None
+        return vence is not None and datetime.now() < vence
+
+    @app.route('/v1/clientessol/<client_id>/oauth2/token/', methods=['POST'])
+    def token(client_id):
+        if request.form.get('grant_type') != 'password':
+            return jsonify(error='unsupported_grant_type'), 400
+        access_token = f"standin-{uuid.uuid4().hex}"
+        tokens[access_token] = datetime.now() + timedelta(seconds=token_ttl)
+        app.config['TOKENS_EMITIDOS'] += 1
+        print(f"[SUNAT simulado] token #{app.config['TOKENS_EMITIDOS']} emitido ({token_ttl} s)")
+        return jsonify(access_token=access_token, token_type='JWT', expires_in=token_ttl)
+
+    @app.route('/v1/contribuyente/gem/comprobantes/<nombre>', methods=['POST'])
+    def enviar(nombre):
+        if not token_valido():
+            return jsonify(cod='401', msg='Token inválido o vencido'), 401
+        archivo = (request.get_json(silent=True) or {}).get('archivo') or {}
+        if not archivo.get('arcGreZip'):
+            return jsonify(cod='400', msg='Solicitud inválida'), 400
+        ticket = str(uuid.uuid4())
+        tickets[ticket] = {'documento': '-'.join(nombre.split('-')[2:]), 'consultas': 0}
+        print(f"[SUNAT simulado] {nombre} recibido -> ticket {ticket}")
+        return jsonify(numTicket=ticket, fecRecepcion=datetime.now().isoformat())
+
+    @app.route('/v1/contribuyente/gem/comprobantes/envios/<ticket>', methods=['GET'])
+    def consultar(ticket):
+        if not token_valido():
+            return jsonify(cod='401', msg='Token inválido o vencido'), 401
+        envio = tickets.get(ticket)
+        if envio is None:
+            return jsonify(cod='404', msg='Ticket no existe'), 404
+        envio['consultas'] += 1
+        if envio['consultas'] <= pending:
+            return jsonify(codRespuesta='98')
+        if reject:
+            return jsonify(codRespuesta='99', indCdrGenerado='0',
+                           error={'numError': '2800', 'desError': 'Rechazo simulado'})
+
+        cdr = io.BytesIO()
+        with zipfile.ZipFile(cdr, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(f"R-{envio['documento']}.xml", CDR_TEMPLATE.format(
+                fecha=datetime.now().date().isoformat(), documento=envio['documento'], ticket=ticket))
+        return jsonify(codRespuesta='0', indCdrGenerado='1', arcCdr=base64.b64encode(cdr.getvalue()).decode('utf-8'))
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulador local de SUNAT para GRE.')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--pending', type=int, default=2, help='Consultas que responden 98 (en proceso).')
+    parser.add_argument('--reject', action='store_true', help='Rechazar (99) en lugar de aceptar.')
+    parser.add_argument('--token-ttl', type=int, default=3600, help='Segundos de vida de cada token (expires_in).')
+    args = parser.parse_args()
+    create_standin(args.pending, args.reject, args.token_ttl).run(port=args.port)
+
+
+if __name__ == '__main__':
+    main()